@@ -0,0 +1,106 @@
+"""
+Admin API router.
+Operational endpoints for the vector search index and chat profiling.
+Requires the X-Admin-Key header to match ADMIN_API_KEY; disabled when it is unset.
+"""
+from typing import Optional
+import asyncio
+import logging
+import secrets
+
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+
+from app.config import settings
+from app.database import engine
+from app.services.pgvector_index import PgVectorIndexManager
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+index_manager = PgVectorIndexManager(
+    engine,
+    index_type=settings.VECTOR_INDEX_TYPE,
+    hnsw_m=settings.VECTOR_INDEX_HNSW_M,
+    hnsw_ef_construction=settings.VECTOR_INDEX_HNSW_EF_CONSTRUCTION,
+    ivfflat_lists=settings.VECTOR_INDEX_IVFFLAT_LISTS,
+    maintenance_work_mem=settings.VECTOR_INDEX_MAINTENANCE_WORK_MEM or None
+)
+
+# Keep a reference so the background build is not garbage collected
+_rebuild_task: Optional[asyncio.Task] = None
+
+
+async def require_admin(x_admin_key: str = Header("")) -> None:
+    """Reject requests unless the admin API is enabled and the key matches."""
+    if not settings.ADMIN_API_KEY:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin API is disabled"
+        )
+    if not secrets.compare_digest(x_admin_key, settings.ADMIN_API_KEY):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid admin key"
+        )
+
+
+@router.get("/vector-index", dependencies=[Depends(require_admin)])
+async def get_vector_index_status():
+    """
+    Report the pgvector ANN index: configuration, size on disk, validity,
+    progress of any running build and the outcome of the last build.
+    """
+    return await index_manager.status()
+
+
+@router.post(
+    "/vector-index/rebuild",
+    status_code=status.HTTP_202_ACCEPTED,
+    dependencies=[Depends(require_admin)]
+)
+async def rebuild_vector_index():
+    """
+    Rebuild the ANN index in the background with the configured parameters.
+    The existing index keeps serving queries until the new one is swapped in.
+    """
+    global _rebuild_task
+
+    if index_manager.index_type == "none":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Vector index is disabled (VECTOR_INDEX_TYPE=none)"
+        )
+    if index_manager.building:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A vector index build is already running"
+        )
+
+    async def run() -> None:
+        try:
+            await index_manager.ensure_index(rebuild=True)
+        except Exception as e:
+            logger.error(f"Vector index rebuild failed: {e}")
+
+    _rebuild_task = asyncio.create_task(run())
+    return {"status": "accepted", "index_type": index_manager.index_type, "options": index_manager.index_options}
+
+
+@router.get("/slow-requests", dependencies=[Depends(require_admin)])
+async def slow_requests():
+    """
+    Stack samples of recent chat requests slower than SLOW_REQUEST_PROFILE_MS,
+    most frequent stacks first.
+    """
+    from app.api.chat import slow_request_profiler
+
+    if slow_request_profiler is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Slow request profiling is disabled (SLOW_REQUEST_PROFILE_MS=0)"
+        )
+    return {
+        "threshold_ms": slow_request_profiler.threshold_ms,
+        "profiles": slow_request_profiler.recent()
+    }
@@ -2,33 +2,66 @@
 Chat API endpoints for RAG chatbot.
 Provides endpoints for querying, conversation management, and feedback.
 """
-from typing import Optional, List
+from typing import Optional, List, Dict, AsyncIterator, Iterator
+from contextlib import contextmanager, nullcontext
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel, Field
+import json
+import logging
 import uuid
 import time
 
-from app.database import get_db
+from app.database import get_db, AsyncSessionLocal
 from app.config import settings
+from app.core.executor import executor_stats
+from app.core.metrics import RequestTrace, SlowRequestProfiler, REQUEST_SECONDS
 from app.services.rag_service import RAGService, ConversationManager
 from app.services.embedding_service import create_embedding_service
+from app.services.retrieval import create_retriever, HybridRetriever
+from app.services.response_cache import ResponseCache, CorpusVersion
+from app.services.tokenizer import get_tokenizer
+from app.services.context_assembler import ContextAssembler
+from app.services.conversation_memory import ConversationMemory
+from app.services.message_writer import MessageWriter
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
+# Embedding cache and batching options shared by all providers
+embedding_options = {
+    "cache_enabled": settings.EMBEDDING_CACHE_ENABLED,
+    "cache_max_entries": settings.EMBEDDING_CACHE_MAX_ENTRIES,
+    "cache_ttl_seconds": settings.EMBEDDING_CACHE_TTL_SECONDS,
+    "cache_path": settings.EMBEDDING_CACHE_PATH,
+    "batch_size": settings.EMBEDDING_BATCH_SIZE,
+    "batch_max_tokens": settings.EMBEDDING_BATCH_MAX_TOKENS,
+    "max_concurrent_batches": settings.EMBEDDING_MAX_CONCURRENT_BATCHES,
+    "max_inflight_tokens": settings.EMBEDDING_MAX_INFLIGHT_TOKENS,
+    "microbatch_enabled": settings.EMBEDDING_MICROBATCH_ENABLED,
+    "microbatch_max_size": settings.EMBEDDING_MICROBATCH_MAX_SIZE,
+    "microbatch_max_wait_ms": settings.EMBEDDING_MICROBATCH_MAX_WAIT_MS,
+    "executor_max_workers": settings.EMBEDDING_EXECUTOR_MAX_WORKERS,
+    "executor_max_queue": settings.EMBEDDING_EXECUTOR_MAX_QUEUE,
+}
+
 # Initialize services based on provider selection
 if settings.EMBEDDING_PROVIDER == "gemini":
     embedding_service = create_embedding_service(
         provider_type="gemini",
         api_key=settings.GEMINI_API_KEY,
-        model=settings.GEMINI_EMBEDDING_MODEL
+        model=settings.GEMINI_EMBEDDING_MODEL,
+        **embedding_options
     )
 elif settings.EMBEDDING_PROVIDER == "openai":
     embedding_service = create_embedding_service(
         provider_type="openai",
         api_key=settings.OPENAI_API_KEY,
         model=settings.EMBEDDING_MODEL,
-        dimensions=settings.EMBEDDING_DIMENSIONS
+        dimensions=settings.EMBEDDING_DIMENSIONS,
+        **embedding_options
     )
 else:
     # Default to OpenAI
@@ -36,8 +69,67 @@ else:
         provider_type="openai",
         api_key=settings.OPENAI_API_KEY,
         model=settings.EMBEDDING_MODEL,
-        dimensions=settings.EMBEDDING_DIMENSIONS
+        dimensions=settings.EMBEDDING_DIMENSIONS,
+        **embedding_options
+    )
+
+# Initialize retrieval backend
+if settings.RETRIEVER_BACKEND == "memory":
+    retriever = create_retriever(
+        backend="memory",
+        dimensions=embedding_service.dimensions,
+        nlist=settings.ANN_INDEX_NLIST,
+        nprobe=settings.ANN_INDEX_NPROBE,
+        snapshot_path=settings.ANN_INDEX_SNAPSHOT_PATH or None,
+        session_factory=AsyncSessionLocal
+    )
+else:
+    retriever = create_retriever(
+        backend="pgvector",
+        index_type=settings.VECTOR_INDEX_TYPE,
+        ef_search=settings.VECTOR_SEARCH_EF_SEARCH,
+        probes=settings.VECTOR_SEARCH_IVFFLAT_PROBES
+    )
+
+# Vector + lexical retrieval; each lookup gets its own pooled session
+hybrid_retriever = HybridRetriever(
+    retriever,
+    session_factory=AsyncSessionLocal,
+    rrf_k=settings.HYBRID_RRF_K,
+    vector_weight=settings.HYBRID_VECTOR_WEIGHT,
+    lexical_weight=settings.HYBRID_LEXICAL_WEIGHT,
+    candidate_multiplier=settings.HYBRID_CANDIDATE_MULTIPLIER
+)
+
+# Cache of answers to repeated questions
+response_cache = None
+if settings.RESPONSE_CACHE_ENABLED:
+    response_cache = ResponseCache(
+        max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+        ttl_seconds=settings.RESPONSE_CACHE_TTL_SECONDS,
+        similarity_threshold=settings.RESPONSE_CACHE_SIMILARITY_THRESHOLD
     )
+corpus_version = CorpusVersion(ttl_seconds=settings.CORPUS_VERSION_TTL_SECONDS)
+
+# Token counting for prompt budgets (falls back to len/4 if the encoding is unavailable)
+tokenizer = get_tokenizer(settings.TOKENIZER_ENCODING, cache_size=settings.TOKEN_COUNT_CACHE_SIZE)
+
+# Rolling summary + recent window; summaries are updated on their own sessions
+conversation_memory = ConversationMemory(
+    tokenizer,
+    window_messages=settings.CONVERSATION_MEMORY_LIMIT,
+    summary_interval=settings.CONVERSATION_SUMMARY_INTERVAL,
+    max_summary_tokens=settings.CONVERSATION_SUMMARY_MAX_TOKENS,
+    session_factory=AsyncSessionLocal
+)
+context_assembler = ContextAssembler(
+    tokenizer,
+    max_prompt_tokens=settings.PROMPT_TOKEN_BUDGET,
+    max_context_tokens=settings.MAX_CONTEXT_TOKENS,
+    history_share=settings.PROMPT_HISTORY_SHARE,
+    max_history_messages=conversation_memory.max_messages,
+    duplicate_threshold=settings.CONTEXT_DUPLICATE_THRESHOLD
+)
 
 # Initialize RAG service with selected LLM provider
 if settings.LLM_PROVIDER == "gemini":
@@ -47,7 +139,18 @@ if settings.LLM_PROVIDER == "gemini":
         llm_api_key=settings.GEMINI_API_KEY,
         model=settings.GEMINI_LLM_MODEL,
         top_k=settings.TOP_K_RESULTS,
-        similarity_threshold=settings.VECTOR_SIMILARITY_THRESHOLD
+        similarity_threshold=settings.VECTOR_SIMILARITY_THRESHOLD,
+        retriever=retriever,
+        hybrid_retriever=hybrid_retriever,
+        use_hybrid=settings.HYBRID_SEARCH_ENABLED,
+        response_cache=response_cache,
+        semantic_cache=settings.RESPONSE_CACHE_SEMANTIC_ENABLED,
+        corpus_version=corpus_version,
+        tokenizer=tokenizer,
+        max_context_tokens=settings.MAX_CONTEXT_TOKENS,
+        context_assembler=context_assembler,
+        conversation_memory=conversation_memory,
+        session_factory=AsyncSessionLocal
     )
 elif settings.LLM_PROVIDER == "anthropic":
     rag_service = RAGService(
@@ -56,7 +159,18 @@ elif settings.LLM_PROVIDER == "anthropic":
         llm_api_key=settings.ANTHROPIC_API_KEY,
         model=settings.ANTHROPIC_MODEL,
         top_k=settings.TOP_K_RESULTS,
-        similarity_threshold=settings.VECTOR_SIMILARITY_THRESHOLD
+        similarity_threshold=settings.VECTOR_SIMILARITY_THRESHOLD,
+        retriever=retriever,
+        hybrid_retriever=hybrid_retriever,
+        use_hybrid=settings.HYBRID_SEARCH_ENABLED,
+        response_cache=response_cache,
+        semantic_cache=settings.RESPONSE_CACHE_SEMANTIC_ENABLED,
+        corpus_version=corpus_version,
+        tokenizer=tokenizer,
+        max_context_tokens=settings.MAX_CONTEXT_TOKENS,
+        context_assembler=context_assembler,
+        conversation_memory=conversation_memory,
+        session_factory=AsyncSessionLocal
     )
 else:
     # Default to Gemini
@@ -66,11 +180,40 @@ else:
         llm_api_key=settings.GEMINI_API_KEY,
         model=settings.GEMINI_LLM_MODEL,
         top_k=settings.TOP_K_RESULTS,
-        similarity_threshold=settings.VECTOR_SIMILARITY_THRESHOLD
+        similarity_threshold=settings.VECTOR_SIMILARITY_THRESHOLD,
+        retriever=retriever,
+        hybrid_retriever=hybrid_retriever,
+        use_hybrid=settings.HYBRID_SEARCH_ENABLED,
+        response_cache=response_cache,
+        semantic_cache=settings.RESPONSE_CACHE_SEMANTIC_ENABLED,
+        corpus_version=corpus_version,
+        tokenizer=tokenizer,
+        max_context_tokens=settings.MAX_CONTEXT_TOKENS,
+        context_assembler=context_assembler,
+        conversation_memory=conversation_memory,
+        session_factory=AsyncSessionLocal
     )
 
 conversation_manager = ConversationManager()
 
+# Stack sampling for slow chat requests (SLOW_REQUEST_PROFILE_MS=0 disables)
+slow_request_profiler = None
+if settings.SLOW_REQUEST_PROFILE_MS > 0:
+    slow_request_profiler = SlowRequestProfiler(
+        settings.SLOW_REQUEST_PROFILE_MS,
+        interval_ms=settings.SLOW_REQUEST_SAMPLE_INTERVAL_MS
+    )
+
+# Optional write-behind for chat messages (started in the app lifespan)
+message_writer = None
+if settings.CHAT_WRITE_BEHIND_ENABLED:
+    message_writer = MessageWriter(
+        AsyncSessionLocal,
+        max_batch=settings.CHAT_WRITE_BEHIND_BATCH_SIZE,
+        flush_interval_ms=settings.CHAT_WRITE_BEHIND_FLUSH_MS,
+        max_queue=settings.CHAT_WRITE_BEHIND_MAX_QUEUE
+    )
+
 
 # Pydantic models for API
 class ChatRequest(BaseModel):
@@ -79,6 +222,8 @@ class ChatRequest(BaseModel):
     session_id: Optional[str] = Field(None, description="Session ID for conversation continuity")
     top_k: Optional[int] = Field(None, ge=1, le=20, description="Number of context chunks to retrieve")
     include_sources: bool = Field(True, description="Include source documents in response")
+    hybrid: Optional[bool] = Field(None, description="Fuse vector and keyword search (default: server setting)")
+    debug: bool = Field(False, description="Include the per-stage span breakdown (if CHAT_DEBUG_ENABLED)")
 
 
 class Citation(BaseModel):
@@ -99,6 +244,10 @@ class ChatResponse(BaseModel):
     model: str
     response_time_ms: int
     retrieved_chunks: int
+    cached: bool = False
+    db_time_ms: Optional[float] = None
+    stage_timings_ms: Optional[Dict[str, float]] = None
+    debug: Optional[dict] = None
 
 
 class ConversationHistoryResponse(BaseModel):
@@ -133,70 +282,230 @@ async def chat_query(
     """
     start_time = time.time()
     
-    try:
-        # Generate session ID if not provided
-        session_id = request.session_id or str(uuid.uuid4())
-        
-        # Get or create conversation
-        conversation = await conversation_manager.get_conversation(db, session_id)
-        if not conversation:
-            conversation = await conversation_manager.create_conversation(
-                db, session_id
+    with _instrument("query") as trace:
+        try:
+            # Generate session ID if not provided
+            session_id = request.session_id or str(uuid.uuid4())
+            
+            # Get or create conversation and load its memory (one statement)
+            db_start = time.perf_counter()
+            conversation_id, memory = await conversation_memory.open(db, session_id)
+            # Commit the new conversation now rather than holding the
+            # transaction open through retrieval and generation
+            await db.commit()
+            open_seconds = time.perf_counter() - db_start
+            
+            # Perform RAG query
+            result = await rag_service.query(
+                query=request.query,
+                db=db,
+                conversation_id=conversation_id,
+                memory=memory,
+                top_k=request.top_k,
+                hybrid=request.hybrid
             )
+            
+            # Calculate response time
+            response_time_ms = int((time.time() - start_time) * 1000)
+            
+            # Store the question and answer together (one INSERT, or queued)
+            db_start = time.perf_counter()
+            await _store_turn(db, conversation_id, request, result, response_time_ms)
             await db.commit()
-        
-        # Add user message
-        await conversation_manager.add_message(
-            db=db,
-            conversation_id=conversation.id,
-            role="user",
-            content=request.query
-        )
-        
-        # Perform RAG query
-        result = await rag_service.query(
-            query=request.query,
-            db=db,
-            conversation_id=conversation.id,
-            top_k=request.top_k
-        )
-        
-        # Calculate response time
-        response_time_ms = int((time.time() - start_time) * 1000)
-        
-        # Add assistant message
-        await conversation_manager.add_message(
-            db=db,
-            conversation_id=conversation.id,
-            role="assistant",
-            content=result["response"],
-            citations=result["citations"],
-            source_chunks=result["source_contexts"] if request.include_sources else None,
-            token_count=len(result["response"]) // 4,  # Approximate
-            confidence_score=result["confidence_score"],
-            model_used=result["model"],
-            response_time_ms=response_time_ms
-        )
-        
-        await db.commit()
-        
-        # Format response
-        return ChatResponse(
-            response=result["response"],
-            citations=[Citation(**c) for c in result["citations"]],
-            confidence_score=result["confidence_score"],
-            session_id=session_id,
-            model=result["model"],
-            response_time_ms=response_time_ms,
-            retrieved_chunks=result["retrieved_chunks"]
-        )
-        
-    except Exception as e:
-        await db.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error processing query: {str(e)}"
-        )
+            store_seconds = time.perf_counter() - db_start
+            db_time_ms = round((open_seconds + store_seconds) * 1000, 3)
+            stage_timings_ms = {
+                "conversation_open": round(open_seconds * 1000, 3),
+                **result["stage_timings_ms"],
+                "persist": round(store_seconds * 1000, 3),
+            }
+            logger.debug(f"Chat query {session_id}: {response_time_ms} ms, database {db_time_ms} ms")
+            
+            # Format response
+            return ChatResponse(
+                response=result["response"],
+                citations=[Citation(**c) for c in result["citations"]],
+                confidence_score=result["confidence_score"],
+                session_id=session_id,
+                model=result["model"],
+                response_time_ms=response_time_ms,
+                retrieved_chunks=result["retrieved_chunks"],
+                cached=result["cached"],
+                db_time_ms=db_time_ms,
+                stage_timings_ms=stage_timings_ms,
+                debug=_debug_info(request, trace)
+            )
+            
+        except Exception as e:
+            await db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error processing query: {str(e)}"
+            )
+
+
+@contextmanager
+def _instrument(endpoint: str) -> Iterator[RequestTrace]:
+    """Trace spans, profile if slow, and observe the request duration."""
+    with RequestTrace() as trace:
+        profile = slow_request_profiler.profile(endpoint) if slow_request_profiler else nullcontext()
+        try:
+            with profile:
+                yield trace
+        finally:
+            REQUEST_SECONDS.observe(time.perf_counter() - trace.start, endpoint)
+
+
+def _debug_info(request: ChatRequest, trace: RequestTrace) -> Optional[dict]:
+    if not (request.debug and settings.CHAT_DEBUG_ENABLED):
+        return None
+    return {"spans": trace.breakdown()}
+
+
+def _message_rows(
+    conversation_id: int,
+    request: ChatRequest,
+    result: dict,
+    response_time_ms: int
+) -> List[dict]:
+    """Message rows for one question/answer turn."""
+    return [
+        {
+            "conversation_id": conversation_id,
+            "role": "user",
+            "content": request.query,
+            "citations": None,
+            "source_chunks": None,
+            "token_count": len(request.query) // 4,  # Approximate
+            "confidence_score": None,
+            "model_used": None,
+            "response_time_ms": None,
+        },
+        {
+            "conversation_id": conversation_id,
+            "role": "assistant",
+            "content": result["response"],
+            "citations": result["citations"],
+            "source_chunks": result["source_contexts"] if request.include_sources else None,
+            "token_count": len(result["response"]) // 4,  # Approximate
+            "confidence_score": result["confidence_score"],
+            "model_used": result["model"],
+            "response_time_ms": response_time_ms,
+        },
+    ]
+
+
+async def _store_turn(
+    db: AsyncSession,
+    conversation_id: int,
+    request: ChatRequest,
+    result: dict,
+    response_time_ms: int
+) -> Optional[int]:
+    """
+    Store the user and assistant messages of a turn. Returns the assistant
+    message ID, or None if the write was handed to the write-behind queue.
+    """
+    rows = _message_rows(conversation_id, request, result, response_time_ms)
+    if message_writer is not None and message_writer.submit(rows):
+        return None
+    ids = await conversation_manager.add_messages(db, rows)
+    return ids[-1]
+
+
+def _sse_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@router.post("/query/stream")
+async def chat_query_stream(request: ChatRequest):
+    """
+    Streaming variant of /chat/query using Server-Sent Events.
+    
+    Events, in order:
+    - **citations**: retrieved sources, sent as soon as retrieval finishes
+    - **token**: incremental response text (`{"text": ...}`), many times
+    - **done**: session ID, confidence, model, message ID and timings
+    - **error**: sent instead of the remaining events if the query fails
+    
+    Both messages are stored once the stream completes. If the client
+    disconnects early, only the conversation itself is kept.
+    """
+    start_time = time.time()
+    session_id = request.session_id or str(uuid.uuid4())
+
+    async def event_stream() -> AsyncIterator[str]:
+        with _instrument("query_stream") as trace:
+            # The request-scoped get_db session is closed before a streaming
+            # body runs, so the stream manages its own session
+            async with AsyncSessionLocal() as db:
+                try:
+                    conversation_id, memory = await conversation_memory.open(db, session_id)
+                    # Do not hold the transaction open while streaming
+                    await db.commit()
+
+                    first_token_ms = None
+                    result = None
+                    async for event, data in rag_service.query_stream(
+                        query=request.query,
+                        db=db,
+                        conversation_id=conversation_id,
+                        memory=memory,
+                        top_k=request.top_k,
+                        hybrid=request.hybrid
+                    ):
+                        if event == "citations":
+                            # Retrieval and the cache lookup (corpus version)
+                            # may have begun a new transaction on db; end it
+                            # before generation starts
+                            if db.in_transaction():
+                                await db.commit()
+                            yield _sse_event("citations", {
+                                "session_id": session_id,
+                                "citations": data["citations"],
+                                "retrieved_chunks": data["retrieved_chunks"]
+                            })
+                        elif event == "token":
+                            if first_token_ms is None:
+                                first_token_ms = int((time.time() - start_time) * 1000)
+                            yield _sse_event("token", data)
+                        elif event == "done":
+                            result = data
+
+                    response_time_ms = int((time.time() - start_time) * 1000)
+                    message_id = await _store_turn(db, conversation_id, request, result, response_time_ms)
+                    await db.commit()
+
+                    yield _sse_event("done", {
+                        "session_id": session_id,
+                        "message_id": message_id,
+                        "confidence_score": result["confidence_score"],
+                        "model": result["model"],
+                        "retrieved_chunks": result["retrieved_chunks"],
+                        "cached": result["cached"],
+                        "time_to_first_token_ms": first_token_ms,
+                        "response_time_ms": response_time_ms,
+                        "stage_timings_ms": result["stage_timings_ms"],
+                        "debug": _debug_info(request, trace)
+                    })
+
+                except Exception as e:
+                    logger.error(f"Error streaming chat query: {e}", exc_info=True)
+                    await db.rollback()
+                    yield _sse_event("error", {"detail": f"Error processing query: {str(e)}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            # Marks the body as already encoded so GZipMiddleware passes the
+            # events through instead of buffering them
+            "Content-Encoding": "identity",
+        }
+    )
 
 
 @router.get("/history/{session_id}", response_model=ConversationHistoryResponse)
@@ -368,8 +677,20 @@ async def health_check():
             "llm_provider": settings.LLM_PROVIDER,
             "llm_model": llm_model,
             "top_k": settings.TOP_K_RESULTS,
-            "similarity_threshold": settings.VECTOR_SIMILARITY_THRESHOLD
-        }
+            "similarity_threshold": settings.VECTOR_SIMILARITY_THRESHOLD,
+            "hybrid_search": rag_service.use_hybrid
+        },
+        "embedding_cache": embedding_service.cache_stats(),
+        "embedding_microbatch": embedding_service.microbatch_stats(),
+        "retriever": rag_service.retriever.stats(),
+        "response_cache": response_cache.stats() if response_cache else None,
+        "tokenizer": {
+            "encoding": tokenizer.encoding_name,
+            "exact": tokenizer.exact,
+            "count_cache": tokenizer.cache_info(),
+        },
+        "executors": executor_stats(),
+        "message_writer": message_writer.stats() if message_writer else None
     }
 
     if not all(health_status["services"].values()):
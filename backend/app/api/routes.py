@@ -2,7 +2,7 @@
 FastAPI route definitions for Battery Intelligence Platform API
 """
 from typing import Optional, List, Literal
-from fastapi import APIRouter, Depends, Query, Path, HTTPException, status
+from fastapi import APIRouter, Depends, Query, Path, HTTPException, Request, status
 from fastapi.responses import JSONResponse
 
 from ..models.schemas import (
@@ -23,9 +23,11 @@ from ..models.schemas import (
     # Enums
     DevelopmentStage, PolicyType, Jurisdiction, PolicyStatus, SortOrder, Granularity
 )
+from ..config import settings
 from ..core.auth import get_api_key
+from ..core.http_cache import HTTPResponseCache
 from ..core.rate_limit import check_rate_limit
-from ..services.data_service import DataService
+from ..services.data_service import DataService, get_data_service
 
 
 # Initialize routers
@@ -35,8 +37,23 @@ forecast_router = APIRouter(prefix="/forecast", tags=["Forecast"])
 analytics_router = APIRouter(prefix="/analytics", tags=["Analytics"])
 policy_router = APIRouter(prefix="/policies", tags=["Policy"])
 chat_router = APIRouter(prefix="/chat", tags=["Chatbot"])
+search_router = APIRouter(prefix="/search", tags=["Search"])
 health_router = APIRouter(tags=["Health"])
 
+# Serialized, pre-compressed responses of the forecast and analytics
+# endpoints, keyed by route, parameters and data version
+response_cache = (
+    HTTPResponseCache(max_entries=settings.DATA_RESPONSE_CACHE_MAX_ENTRIES)
+    if settings.DATA_RESPONSE_CACHE_ENABLED else None
+)
+
+
+async def _cached(request: Request, service: DataService, build, **params):
+    """Serve build() through the response cache, if enabled."""
+    if response_cache is None:
+        return await build()
+    return await response_cache.respond(request, service.snapshot.version, build, **params)
+
 
 # ============================================================================
 # HEALTH CHECK
@@ -80,7 +97,8 @@ async def list_companies(
     sort_by: Literal["name", "capacity", "state"] = Query("capacity", description="Sort field"),
     sort_order: SortOrder = Query(SortOrder.DESC, description="Sort order"),
     api_key: str = Depends(get_api_key),
-    rate_limit: bool = Depends(check_rate_limit)
+    rate_limit: bool = Depends(check_rate_limit),
+    service: DataService = Depends(get_data_service)
 ):
     """
     List companies with filtering and pagination.
@@ -90,8 +108,6 @@ async def list_companies(
     - /companies?state=TN&sort_by=name
     - /companies?page=2&page_size=10
     """
-    service = DataService()
-
     filters = {
         "technology": technology,
         "state": state,
@@ -111,34 +127,6 @@ async def list_companies(
     return result
 
 
-@companies_router.get(
-    "/{id}",
-    response_model=CompanyDetail,
-    summary="Get company details",
-    description="Retrieve detailed information about a specific company"
-)
-async def get_company(
-    id: str = Path(..., description="Company ID or slug"),
-    api_key: str = Depends(get_api_key),
-    rate_limit: bool = Depends(check_rate_limit)
-):
-    """
-    Get detailed company information by ID.
-
-    Example: /companies/tesla
-    """
-    service = DataService()
-    company = await service.get_company_by_id(id)
-
-    if not company:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Company '{id}' not found"
-        )
-
-    return company
-
-
 @companies_router.get(
     "/search",
     response_model=SearchResponse,
@@ -150,14 +138,14 @@ async def search_companies(
     fields: str = Query("name,technology,description", description="Fields to search (comma-separated)"),
     limit: int = Query(10, ge=1, le=100, description="Maximum number of results"),
     api_key: str = Depends(get_api_key),
-    rate_limit: bool = Depends(check_rate_limit)
+    rate_limit: bool = Depends(check_rate_limit),
+    service: DataService = Depends(get_data_service)
 ):
     """
     Full-text search across companies.
 
     Example: /companies/search?q=solid+state+battery&limit=5
     """
-    service = DataService()
     search_fields = [field.strip() for field in fields.split(",")]
 
     results = await service.search_companies(
@@ -169,6 +157,34 @@ async def search_companies(
     return results
 
 
+@companies_router.get(
+    "/{id}",
+    response_model=CompanyDetail,
+    summary="Get company details",
+    description="Retrieve detailed information about a specific company"
+)
+async def get_company(
+    id: str = Path(..., description="Company ID or slug"),
+    api_key: str = Depends(get_api_key),
+    rate_limit: bool = Depends(check_rate_limit),
+    service: DataService = Depends(get_data_service)
+):
+    """
+    Get detailed company information by ID.
+
+    Example: /companies/tesla
+    """
+    company = await service.get_company_by_id(id)
+
+    if not company:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Company '{id}' not found"
+        )
+
+    return company
+
+
 # ============================================================================
 # FACILITIES
 # ============================================================================
@@ -193,7 +209,8 @@ async def list_facilities(
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
     api_key: str = Depends(get_api_key),
-    rate_limit: bool = Depends(check_rate_limit)
+    rate_limit: bool = Depends(check_rate_limit),
+    service: DataService = Depends(get_data_service)
 ):
     """
     List facilities with filtering and pagination.
@@ -203,8 +220,6 @@ async def list_facilities(
     - /facilities?company=tesla&min_capacity=50
     - /facilities?bbox=-125.0,24.0,-66.0,49.0 (all US facilities)
     """
-    service = DataService()
-
     # Parse bounding box if provided
     bbox_coords = None
     if bbox:
@@ -249,14 +264,14 @@ async def list_facilities(
 async def get_facility(
     id: str = Path(..., description="Facility ID"),
     api_key: str = Depends(get_api_key),
-    rate_limit: bool = Depends(check_rate_limit)
+    rate_limit: bool = Depends(check_rate_limit),
+    service: DataService = Depends(get_data_service)
 ):
     """
     Get detailed facility information by ID.
 
     Example: /facilities/tesla-gigafactory-nevada
     """
-    service = DataService()
     facility = await service.get_facility_by_id(id)
 
     if not facility:
@@ -280,15 +295,14 @@ async def find_nearby_facilities(
     radius: float = Query(100, ge=1, le=1000, description="Search radius in kilometers"),
     limit: int = Query(10, ge=1, le=50, description="Maximum number of results"),
     api_key: str = Depends(get_api_key),
-    rate_limit: bool = Depends(check_rate_limit)
+    rate_limit: bool = Depends(check_rate_limit),
+    service: DataService = Depends(get_data_service)
 ):
     """
     Find facilities near a location.
 
     Example: /facilities/nearby?lat=36.1627&lng=-86.7816&radius=100
     """
-    service = DataService()
-
     results = await service.find_nearby_facilities(
         latitude=lat,
         longitude=lng,
@@ -310,31 +324,34 @@ async def find_nearby_facilities(
     description="Historical and projected battery capacity data"
 )
 async def get_capacity_forecast(
+    request: Request,
     start_year: Optional[int] = Query(None, ge=2000, le=2050, description="Starting year for forecast"),
     end_year: Optional[int] = Query(None, ge=2000, le=2050, description="Ending year for forecast"),
     technology: Optional[str] = Query(None, description="Filter by technology type"),
     region: Optional[str] = Query(None, description="Filter by region (state or cluster)"),
     granularity: Granularity = Query(Granularity.YEARLY, description="Data granularity"),
     api_key: str = Depends(get_api_key),
-    rate_limit: bool = Depends(check_rate_limit)
+    rate_limit: bool = Depends(check_rate_limit),
+    service: DataService = Depends(get_data_service)
 ):
     """
     Get capacity forecast data.
 
     Example: /forecast/capacity?start_year=2020&end_year=2030&granularity=yearly
     """
-    service = DataService()
-
-    forecast = await service.get_capacity_forecast(
-        start_year=start_year,
-        end_year=end_year,
-        technology=technology,
-        region=region,
-        granularity=granularity.value
+    return await _cached(
+        request, service,
+        lambda: service.get_capacity_forecast(
+            start_year=start_year,
+            end_year=end_year,
+            technology=technology,
+            region=region,
+            granularity=granularity.value
+        ),
+        start_year=start_year, end_year=end_year, technology=technology,
+        region=region, granularity=granularity
     )
 
-    return forecast
-
 
 @forecast_router.get(
     "/cost",
@@ -343,29 +360,32 @@ async def get_capacity_forecast(
     description="Historical and projected battery cost curve data"
 )
 async def get_cost_forecast(
+    request: Request,
     start_year: Optional[int] = Query(None, ge=2000, le=2050),
     end_year: Optional[int] = Query(None, ge=2000, le=2050),
     technology: Optional[str] = Query(None, description="Filter by technology type"),
     include_breakdown: bool = Query(False, description="Include cost component breakdown"),
     api_key: str = Depends(get_api_key),
-    rate_limit: bool = Depends(check_rate_limit)
+    rate_limit: bool = Depends(check_rate_limit),
+    service: DataService = Depends(get_data_service)
 ):
     """
     Get cost forecast data.
 
     Example: /forecast/cost?start_year=2015&end_year=2030&include_breakdown=true
     """
-    service = DataService()
-
-    forecast = await service.get_cost_forecast(
-        start_year=start_year,
-        end_year=end_year,
-        technology=technology,
+    return await _cached(
+        request, service,
+        lambda: service.get_cost_forecast(
+            start_year=start_year,
+            end_year=end_year,
+            technology=technology,
+            include_breakdown=include_breakdown
+        ),
+        start_year=start_year, end_year=end_year, technology=technology,
         include_breakdown=include_breakdown
     )
 
-    return forecast
-
 
 @analytics_router.get(
     "/market-share",
@@ -374,27 +394,29 @@ async def get_cost_forecast(
     description="Market share data by technology/chemistry over time"
 )
 async def get_market_share(
+    request: Request,
     start_year: Optional[int] = Query(None, ge=2000, le=2050),
     end_year: Optional[int] = Query(None, ge=2000, le=2050),
     chemistry: Optional[str] = Query(None, description="Filter by specific chemistry"),
     api_key: str = Depends(get_api_key),
-    rate_limit: bool = Depends(check_rate_limit)
+    rate_limit: bool = Depends(check_rate_limit),
+    service: DataService = Depends(get_data_service)
 ):
     """
     Get market share evolution data.
 
     Example: /analytics/market-share?start_year=2015&end_year=2030
     """
-    service = DataService()
-
-    data = await service.get_market_share(
-        start_year=start_year,
-        end_year=end_year,
-        chemistry=chemistry
+    return await _cached(
+        request, service,
+        lambda: service.get_market_share(
+            start_year=start_year,
+            end_year=end_year,
+            chemistry=chemistry
+        ),
+        start_year=start_year, end_year=end_year, chemistry=chemistry
     )
 
-    return data
-
 
 @analytics_router.get(
     "/regional-clusters",
@@ -403,17 +425,17 @@ async def get_market_share(
     description="Analysis of battery manufacturing regional clusters"
 )
 async def get_regional_clusters(
+    request: Request,
     api_key: str = Depends(get_api_key),
-    rate_limit: bool = Depends(check_rate_limit)
+    rate_limit: bool = Depends(check_rate_limit),
+    service: DataService = Depends(get_data_service)
 ):
     """
     Get regional cluster data.
 
     Example: /analytics/regional-clusters
     """
-    service = DataService()
-    data = await service.get_regional_clusters()
-    return data
+    return await _cached(request, service, service.get_regional_clusters)
 
 
 @analytics_router.get(
@@ -423,21 +445,25 @@ async def get_regional_clusters(
     description="Technology adoption and innovation trends"
 )
 async def get_technology_trends(
+    request: Request,
     metric: Literal["energy_density", "cycle_life", "technology_mix"] = Query(
         "technology_mix",
         description="Metric to analyze"
     ),
     api_key: str = Depends(get_api_key),
-    rate_limit: bool = Depends(check_rate_limit)
+    rate_limit: bool = Depends(check_rate_limit),
+    service: DataService = Depends(get_data_service)
 ):
     """
     Get technology trends data.
 
     Example: /analytics/technology-trends?metric=energy_density
     """
-    service = DataService()
-    data = await service.get_technology_trends(metric=metric)
-    return data
+    return await _cached(
+        request, service,
+        lambda: service.get_technology_trends(metric=metric),
+        metric=metric
+    )
 
 
 @analytics_router.get(
@@ -447,18 +473,22 @@ async def get_technology_trends(
     description="Critical materials and supply chain risk assessment"
 )
 async def get_supply_chain_analysis(
+    request: Request,
     material: Optional[str] = Query(None, description="Filter by specific material"),
     api_key: str = Depends(get_api_key),
-    rate_limit: bool = Depends(check_rate_limit)
+    rate_limit: bool = Depends(check_rate_limit),
+    service: DataService = Depends(get_data_service)
 ):
     """
     Get supply chain analysis.
 
     Example: /analytics/supply-chain?material=lithium
     """
-    service = DataService()
-    data = await service.get_supply_chain_analysis(material=material)
-    return data
+    return await _cached(
+        request, service,
+        lambda: service.get_supply_chain_analysis(material=material),
+        material=material
+    )
 
 
 # ============================================================================
@@ -479,15 +509,14 @@ async def list_policies(
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
     api_key: str = Depends(get_api_key),
-    rate_limit: bool = Depends(check_rate_limit)
+    rate_limit: bool = Depends(check_rate_limit),
+    service: DataService = Depends(get_data_service)
 ):
     """
     List policies with filtering.
 
     Example: /policies?type=tax_credit&jurisdiction=federal&status=active
     """
-    service = DataService()
-
     filters = {
         "type": type,
         "jurisdiction": jurisdiction,
@@ -513,14 +542,14 @@ async def list_policies(
 async def get_policy(
     id: str = Path(..., description="Policy ID"),
     api_key: str = Depends(get_api_key),
-    rate_limit: bool = Depends(check_rate_limit)
+    rate_limit: bool = Depends(check_rate_limit),
+    service: DataService = Depends(get_data_service)
 ):
     """
     Get detailed policy information.
 
     Example: /policies/ira-45x
     """
-    service = DataService()
     policy = await service.get_policy_by_id(id)
 
     if not policy:
@@ -541,14 +570,14 @@ async def get_policy(
 async def get_policy_impact(
     id: str = Path(..., description="Policy ID"),
     api_key: str = Depends(get_api_key),
-    rate_limit: bool = Depends(check_rate_limit)
+    rate_limit: bool = Depends(check_rate_limit),
+    service: DataService = Depends(get_data_service)
 ):
     """
     Get policy impact analysis.
 
     Example: /policies/ira-45x/impact
     """
-    service = DataService()
     impact = await service.get_policy_impact(id)
 
     if not impact:
@@ -560,6 +589,34 @@ async def get_policy_impact(
     return impact
 
 
+# ============================================================================
+# SEARCH
+# ============================================================================
+
+@search_router.get(
+    "",
+    response_model=SearchResponse,
+    summary="Search all platform data",
+    description="Ranked full-text search over companies, policies, technologies and timeline events"
+)
+async def search(
+    q: str = Query(..., min_length=1, description="Search query"),
+    types: Optional[str] = Query(None, description="Result types (comma-separated: company,policy,technology,timeline)"),
+    limit: int = Query(10, ge=1, le=100, description="Maximum number of results"),
+    api_key: str = Depends(get_api_key),
+    rate_limit: bool = Depends(check_rate_limit),
+    service: DataService = Depends(get_data_service)
+):
+    """
+    Search across all indexed data. Tolerates misspellings.
+
+    Example: /search?q=sodium+ion&types=technology,company
+    """
+    result_types = [t.strip() for t in types.split(",") if t.strip()] if types else None
+
+    return await service.search(query=q, types=result_types, limit=limit)
+
+
 # ============================================================================
 # CHATBOT
 # ============================================================================
@@ -573,7 +630,8 @@ async def get_policy_impact(
 async def chat_query(
     request: ChatQueryRequest,
     api_key: str = Depends(get_api_key),
-    rate_limit: bool = Depends(check_rate_limit)
+    rate_limit: bool = Depends(check_rate_limit),
+    service: DataService = Depends(get_data_service)
 ):
     """
     Submit a natural language query to the RAG-powered chatbot.
@@ -585,8 +643,6 @@ async def chat_query(
         "max_sources": 5
     }
     """
-    service = DataService()
-
     response = await service.process_chat_query(
         query=request.query,
         session_id=request.session_id,
@@ -607,15 +663,14 @@ async def get_chat_history(
     session_id: Optional[str] = Query(None, description="Filter by session ID"),
     limit: int = Query(50, ge=1, le=100, description="Maximum number of messages"),
     api_key: str = Depends(get_api_key),
-    rate_limit: bool = Depends(check_rate_limit)
+    rate_limit: bool = Depends(check_rate_limit),
+    service: DataService = Depends(get_data_service)
 ):
     """
     Get conversation history.
 
     Example: /chat/history?session_id=abc123&limit=20
     """
-    service = DataService()
-
     history = await service.get_chat_history(
         api_key=api_key,
         session_id=session_id,
@@ -638,5 +693,6 @@ def get_all_routers():
         forecast_router,
         analytics_router,
         policy_router,
+        search_router,
         chat_router
     ]
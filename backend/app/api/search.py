@@ -1,76 +1,113 @@
 """
 Search API router.
-Endpoints for semantic search using vector embeddings.
+Endpoints for semantic, full-text and hybrid search over document chunks.
 """
-from fastapi import APIRouter, Depends, Query
-from sqlalchemy import select, text
+from fastapi import APIRouter, Depends, Query, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 
 from app.database import get_db
-from app.models import DocumentChunk
 from app.config import settings
+from app.api.chat import rag_service
+from app.services.retrieval import RetrievedContext
 
 router = APIRouter()
 limiter = Limiter(key_func=get_remote_address)
 
 
+def _format_result(ctx: RetrievedContext) -> dict:
+    """Format a retrieved chunk as a search result with a content preview."""
+    return {
+        "id": ctx.chunk_id,
+        "source": ctx.source_document,
+        "content": ctx.content[:200] + "..." if len(ctx.content) > 200 else ctx.content,
+        "section": ctx.section_title,
+        "similarity_score": ctx.similarity_score,
+        "lexical_score": ctx.lexical_score,
+        "fusion_score": ctx.fusion_score,
+    }
+
+
 @router.get("/semantic")
 @limiter.limit(f"{settings.RATE_LIMIT_PER_MINUTE}/minute")
 async def semantic_search(
+    request: Request,
     query: str = Query(..., min_length=3, description="Search query"),
     limit: int = Query(10, ge=1, le=50, description="Maximum number of results"),
+    min_similarity: float = Query(
+        settings.VECTOR_SIMILARITY_THRESHOLD, gt=0, le=1, description="Minimum cosine similarity"
+    ),
     db: AsyncSession = Depends(get_db),
 ):
     """
     Perform semantic search using vector embeddings.
+    Results are ranked by cosine similarity to the embedded query.
+    """
+    contexts = await rag_service.search_similar_chunks(
+        query=query,
+        db=db,
+        top_k=limit,
+        similarity_threshold=min_similarity,
+        hybrid=False
+    )
+
+    return {
+        "query": query,
+        "results": [_format_result(ctx) for ctx in contexts],
+        "count": len(contexts),
+    }
 
-    Note: This endpoint requires the query to be embedded first.
-    For production use, integrate with OpenAI or other embedding service.
+
+@router.get("/hybrid")
+@limiter.limit(f"{settings.RATE_LIMIT_PER_MINUTE}/minute")
+async def hybrid_search(
+    request: Request,
+    query: str = Query(..., min_length=2, description="Search query"),
+    limit: int = Query(10, ge=1, le=50, description="Maximum number of results"),
+    min_similarity: float = Query(
+        settings.VECTOR_SIMILARITY_THRESHOLD, gt=0, le=1,
+        description="Minimum cosine similarity for vector matches"
+    ),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Perform hybrid search: vector similarity and full-text matches are
+    retrieved concurrently and merged with reciprocal rank fusion.
+    Exact terms (e.g. "IRA 45X", company names) are found even when their
+    vector similarity is low.
     """
-    # TODO: Implement actual vector search with embeddings
-    # This is a placeholder that returns empty results
-    # In production, you would:
-    # 1. Embed the query using OpenAI/Cohere
-    # 2. Perform vector similarity search using pgvector
-    # 3. Return ranked results with citations
+    contexts = await rag_service.search_similar_chunks(
+        query=query,
+        db=db,
+        top_k=limit,
+        similarity_threshold=min_similarity,
+        hybrid=True
+    )
 
     return {
         "query": query,
-        "results": [],
-        "message": "Vector search endpoint - requires embedding service integration",
+        "results": [_format_result(ctx) for ctx in contexts],
+        "count": len(contexts),
     }
 
 
 @router.get("/fulltext")
 @limiter.limit(f"{settings.RATE_LIMIT_PER_MINUTE}/minute")
 async def fulltext_search(
-    query: str = Query(..., min_length=3, description="Search query"),
+    request: Request,
+    query: str = Query(..., min_length=2, description="Search query"),
     limit: int = Query(10, ge=1, le=50),
     db: AsyncSession = Depends(get_db),
 ):
     """
     Perform full-text search across document chunks.
+    Uses the full-text index (or the in-memory BM25 index), ranked by relevance.
     """
-    # Simple ILIKE search (for PostgreSQL full-text search, use to_tsquery)
-    search_query = select(DocumentChunk).where(
-        DocumentChunk.content.ilike(f"%{query}%")
-    ).limit(limit)
-
-    result = await db.execute(search_query)
-    chunks = result.scalars().all()
+    contexts = await rag_service.retriever.search_text(query, db=db, top_k=limit)
 
     return {
         "query": query,
-        "results": [
-            {
-                "id": chunk.id,
-                "source": chunk.source_document,
-                "content": chunk.content[:200] + "..." if len(chunk.content) > 200 else chunk.content,
-                "section": chunk.section_title,
-            }
-            for chunk in chunks
-        ],
-        "count": len(chunks),
+        "results": [_format_result(ctx) for ctx in contexts],
+        "count": len(contexts),
     }
@@ -87,21 +87,100 @@ class Settings(BaseSettings):
     # Cohere Configuration
     COHERE_API_KEY: str = ""
 
+    # Embedding Cache
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 10000
+    EMBEDDING_CACHE_TTL_SECONDS: int = 86400
+    EMBEDDING_CACHE_PATH: str = ""  # SQLite file for the persistent tier; empty disables it
+
+    # Embedding Batching
+    EMBEDDING_BATCH_SIZE: int = 100
+    EMBEDDING_BATCH_MAX_TOKENS: int = 100000
+    EMBEDDING_MAX_CONCURRENT_BATCHES: int = 4
+    EMBEDDING_MAX_INFLIGHT_TOKENS: int = 300000
+
+    # Executor for blocking embedding SDK calls (Gemini, local models)
+    EMBEDDING_EXECUTOR_MAX_WORKERS: int = 8
+    EMBEDDING_EXECUTOR_MAX_QUEUE: int = 256  # calls beyond this are rejected
+
+    # Query Embedding Micro-batching (opt-in)
+    EMBEDDING_MICROBATCH_ENABLED: bool = False
+    EMBEDDING_MICROBATCH_MAX_SIZE: int = 32
+    EMBEDDING_MICROBATCH_MAX_WAIT_MS: float = 5.0
+
     # RAG Configuration
     CHUNK_SIZE: int = 1000
     CHUNK_OVERLAP: int = 200
+    CHUNK_UNIT: str = "chars"  # "chars" or "tokens" (CHUNK_SIZE/CHUNK_OVERLAP in BPE tokens)
+    TOKENIZER_ENCODING: str = "cl100k_base"  # tiktoken encoding; needs TIKTOKEN_CACHE_DIR offline
+    TOKEN_COUNT_CACHE_SIZE: int = 65536
+    MAX_CONTEXT_TOKENS: int = 6000  # retrieved context is trimmed to this many tokens
+    PROMPT_TOKEN_BUDGET: int = 8000  # system prompt + history + context + question
+    PROMPT_HISTORY_SHARE: float = 0.25  # max share of the prompt budget used by history
+    CONTEXT_DUPLICATE_THRESHOLD: float = 0.85  # word 3-gram Jaccard above which chunks are duplicates
     TOP_K_RESULTS: int = 5
     ENABLE_RERANKING: bool = True
-    CONVERSATION_MEMORY_LIMIT: int = 10
+    CONVERSATION_MEMORY_LIMIT: int = 10  # recent messages sent in full
+    CONVERSATION_SUMMARY_INTERVAL: int = 2  # turns between rolling summary updates
+    CONVERSATION_SUMMARY_MAX_TOKENS: int = 400
+    CHAT_WRITE_BEHIND_ENABLED: bool = False  # queue chat messages and write them in background batches
+    CHAT_WRITE_BEHIND_BATCH_SIZE: int = 100
+    CHAT_WRITE_BEHIND_FLUSH_MS: float = 50.0
+    CHAT_WRITE_BEHIND_MAX_QUEUE: int = 10000
+
+    # Observability
+    METRICS_ENABLED: bool = True  # serve /metrics in Prometheus format
+    CHAT_DEBUG_ENABLED: bool = False  # allow "debug": true in chat requests to return spans
+    SLOW_REQUEST_PROFILE_MS: int = 0  # sample stacks of chat requests slower than this; 0 disables
+    SLOW_REQUEST_SAMPLE_INTERVAL_MS: float = 5.0
 
     # Vector Search
     VECTOR_SIMILARITY_THRESHOLD: float = 0.7
     MAX_SEARCH_RESULTS: int = 10
+    RETRIEVER_BACKEND: str = "pgvector"  # "pgvector" or "memory"
+
+    # pgvector ANN index (managed on startup and via /admin/vector-index)
+    VECTOR_INDEX_TYPE: str = "hnsw"  # "hnsw", "ivfflat" or "none"
+    VECTOR_INDEX_AUTO_CREATE: bool = True
+    VECTOR_INDEX_HNSW_M: int = 16
+    VECTOR_INDEX_HNSW_EF_CONSTRUCTION: int = 64
+    VECTOR_INDEX_IVFFLAT_LISTS: int = 100
+    VECTOR_INDEX_MAINTENANCE_WORK_MEM: str = ""  # e.g. "1GB"; empty keeps the server default
+    VECTOR_SEARCH_EF_SEARCH: int = 40  # HNSW candidate list size per query
+    VECTOR_SEARCH_IVFFLAT_PROBES: int = 10  # IVFFlat lists scanned per query
+
+    # Hybrid (vector + lexical) retrieval with reciprocal rank fusion
+    HYBRID_SEARCH_ENABLED: bool = False  # default for chat queries
+    HYBRID_RRF_K: int = 60
+    HYBRID_VECTOR_WEIGHT: float = 1.0
+    HYBRID_LEXICAL_WEIGHT: float = 1.0
+    HYBRID_CANDIDATE_MULTIPLIER: int = 4
+
+    # In-memory ANN index (RETRIEVER_BACKEND=memory)
+    ANN_INDEX_NLIST: int = 100
+    ANN_INDEX_NPROBE: int = 8
+    ANN_INDEX_SNAPSHOT_PATH: str = ""  # .npz snapshot; built from the database when missing
+
+    # Response Cache (answers to repeated questions, invalidated on re-ingestion)
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_MAX_ENTRIES: int = 1000
+    RESPONSE_CACHE_TTL_SECONDS: int = 3600
+    RESPONSE_CACHE_SEMANTIC_ENABLED: bool = False  # also match near-duplicate questions by embedding
+    RESPONSE_CACHE_SIMILARITY_THRESHOLD: float = 0.95
+    CORPUS_VERSION_TTL_SECONDS: int = 30  # how often the document set hash is re-read
+
+    # Platform data (visualization-data.json, search-data.json and data/*.json)
+    DATA_RELOAD_INTERVAL_SECONDS: float = 5.0  # poll the files and hot-swap changes; 0 disables
+    DATA_RESPONSE_CACHE_ENABLED: bool = True  # serialized, pre-compressed forecast/analytics responses
+    DATA_RESPONSE_CACHE_MAX_ENTRIES: int = 512
 
     # Citation Configuration
     ENABLE_CITATIONS: bool = True
     MIN_CITATION_CONFIDENCE: float = 0.7
 
+    # Admin API (disabled when empty)
+    ADMIN_API_KEY: str = ""
+
     # Logging
     LOG_LEVEL: str = "INFO"
 
@@ -0,0 +1,162 @@
+"""
+Size-limited executors for blocking calls made from async code.
+Blocking SDK calls (e.g. Gemini embeddings, local model encoding) run on a
+named thread pool with a bounded queue, so they cannot stall the event loop
+or pile up without limit. Queue depth and wait times are tracked per
+executor and exposed via executor_stats().
+"""
+from typing import Any, Callable, Dict
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+_executors: Dict[str, "BlockingExecutor"] = {}
+_registry_lock = threading.Lock()
+
+
+class ExecutorSaturatedError(RuntimeError):
+    """Raised when a blocking executor's queue is full."""
+
+
+class BlockingExecutor:
+    """
+    Thread pool with max_workers threads and at most max_queue waiting calls.
+
+    run() rejects new work with ExecutorSaturatedError once max_queue calls
+    are already waiting, instead of letting the backlog (and latency) grow
+    without bound. Wait time is measured from submission until a worker
+    picks the call up.
+    """
+
+    def __init__(self, name: str, max_workers: int = 8, max_queue: int = 256, sample_size: int = 1024):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.max_queue_depth = 0
+        self._wait_ms: deque = deque(maxlen=sample_size)
+        self._run_ms: deque = deque(maxlen=sample_size)
+
+        with _registry_lock:
+            if name in _executors:
+                logger.warning(f"Replacing blocking executor '{name}'")
+            _executors[name] = self
+
+    async def run(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run func(*args, **kwargs) on the pool and await its result."""
+        with self._lock:
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                raise ExecutorSaturatedError(
+                    f"Executor '{self.name}' is saturated ({self.queued} calls waiting)"
+                )
+            self.queued += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queued)
+
+        submitted = time.perf_counter()
+        call = functools.partial(func, *args, **kwargs)
+
+        def instrumented() -> Any:
+            started = time.perf_counter()
+            with self._lock:
+                self.queued -= 1
+                self.active += 1
+                self._wait_ms.append((started - submitted) * 1000)
+            ok = False
+            try:
+                result = call()
+                ok = True
+                return result
+            finally:
+                with self._lock:
+                    self.active -= 1
+                    if ok:
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+                    self._run_ms.append((time.perf_counter() - started) * 1000)
+
+        def release_if_cancelled(future) -> None:
+            # A call cancelled while still queued never reaches
+            # instrumented(), so its queue slot is released here. Once a
+            # worker has started it, cancellation no longer applies and
+            # instrumented() does the accounting.
+            if future.cancelled():
+                with self._lock:
+                    self.queued -= 1
+
+        try:
+            future = self._pool.submit(instrumented)
+        except BaseException:
+            with self._lock:
+                self.queued -= 1
+            raise
+        future.add_done_callback(release_if_cancelled)
+        # Cancelling the awaiting task cancels the call if it has not started
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._pool.shutdown(wait=wait)
+        with _registry_lock:
+            if _executors.get(self.name) is self:
+                del _executors[self.name]
+
+    @staticmethod
+    def _percentile(samples: list, fraction: float) -> float:
+        if not samples:
+            return 0.0
+        ordered = sorted(samples)
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 3)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth, utilization and wait/run time percentiles (ms)."""
+        with self._lock:
+            wait_ms = list(self._wait_ms)
+            run_ms = list(self._run_ms)
+            counters = {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queue_depth": self.queued,
+                "max_queue_depth": self.max_queue_depth,
+                "active": self.active,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+            }
+        counters.update({
+            "wait_ms_p50": self._percentile(wait_ms, 0.5),
+            "wait_ms_p95": self._percentile(wait_ms, 0.95),
+            "wait_ms_max": round(max(wait_ms), 3) if wait_ms else 0.0,
+            "run_ms_p50": self._percentile(run_ms, 0.5),
+            "run_ms_p95": self._percentile(run_ms, 0.95),
+        })
+        return counters
+
+
+def get_executor(name: str, max_workers: int = 8, max_queue: int = 256) -> BlockingExecutor:
+    """Return the executor registered under name, creating it if needed."""
+    with _registry_lock:
+        executor = _executors.get(name)
+    if executor is None:
+        executor = BlockingExecutor(name, max_workers=max_workers, max_queue=max_queue)
+    return executor
+
+
+def executor_stats() -> Dict[str, Dict[str, Any]]:
+    """Return stats for every registered executor."""
+    with _registry_lock:
+        executors = list(_executors.values())
+    return {executor.name: executor.stats() for executor in executors}
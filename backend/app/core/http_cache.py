@@ -0,0 +1,193 @@
+"""
+HTTP response cache for read endpoints whose output only depends on the
+request parameters and the data snapshot version.
+A response is serialized once and stored with gzip and brotli variants,
+so a hit costs a dict lookup: no model building, no JSON encoding and no
+compression. Clients revalidating with If-None-Match get a 304.
+"""
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from collections import OrderedDict
+from enum import Enum
+import gzip
+import hashlib
+import threading
+import logging
+
+from fastapi import Request, Response
+
+try:
+    import brotli
+except ImportError:
+    # Optional: without it only gzip variants are stored
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+
+def accepted_encodings(header: str) -> Dict[str, float]:
+    """Parse Accept-Encoding into coding -> q-value."""
+    accepted: Dict[str, float] = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """Weak comparison of If-None-Match against etag."""
+    if header.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+class CachedBody:
+    """A serialized response body and its compressed variants."""
+
+    __slots__ = ("identity", "gzip", "br", "etag")
+
+    def __init__(self, body: bytes, min_compress_size: int = 1000):
+        self.identity = body
+        self.etag = f'W/"{hashlib.sha1(body).hexdigest()[:20]}"'
+        self.gzip = None
+        self.br = None
+        if len(body) >= min_compress_size:
+            self.gzip = gzip.compress(body, compresslevel=9)
+            if brotli is not None:
+                self.br = brotli.compress(body, quality=11)
+
+    def variant(self, accept_encoding: str) -> Tuple[bytes, Optional[str]]:
+        """Body and Content-Encoding for a request's Accept-Encoding."""
+        accepted = accepted_encodings(accept_encoding)
+        wildcard = accepted.get("*", 0.0)
+        for coding in ("br", "gzip"):
+            body = getattr(self, coding)
+            if body is not None and accepted.get(coding, wildcard) > 0:
+                return body, coding
+        return self.identity, None
+
+
+class HTTPResponseCache:
+    """
+    LRU cache of serialized JSON responses.
+
+    Entries are keyed by route, the request's parameters (None dropped,
+    enums by value, sorted) and the data version, so a data reload makes
+    the old entries unreachable; they age out of the LRU. Bodies of at
+    least min_compress_size bytes are stored pre-compressed; those
+    responses carry Content-Encoding, which GZipMiddleware leaves alone.
+    """
+
+    def __init__(self, max_entries: int = 512, min_compress_size: int = 1000):
+        self.max_entries = max_entries
+        self.min_compress_size = min_compress_size
+        self._entries: "OrderedDict[Hashable, CachedBody]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(route: str, version: str, params: Dict[str, Any]) -> Hashable:
+        normalized = tuple(sorted(
+            (name, _normalize(value)) for name, value in params.items() if value is not None
+        ))
+        return (route, version, normalized)
+
+    def get(self, key: Hashable) -> Optional[CachedBody]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: Hashable, entry: CachedBody) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    async def respond(
+        self,
+        request: Request,
+        version: str,
+        build: Callable[[], Awaitable[Any]],
+        **params: Any
+    ) -> Response:
+        """
+        The cached response for this route, params and data version,
+        calling build() for the Pydantic model on a miss.
+        """
+        key = self.key(request.url.path, version, params)
+        entry = self.get(key)
+        if entry is None:
+            self.misses += 1
+            model = await build()
+            body = model.model_dump_json(by_alias=True).encode("utf-8")
+            entry = CachedBody(body, self.min_compress_size)
+            self.put(key, entry)
+        else:
+            self.hits += 1
+
+        headers = {
+            "ETag": entry.etag,
+            "Vary": "Accept-Encoding",
+            "X-Data-Version": version,
+        }
+        if _etag_matches(request.headers.get("if-none-match", ""), entry.etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+
+        body, encoding = entry.variant(request.headers.get("accept-encoding", ""))
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = len(self._entries)
+            stored_bytes = sum(
+                len(entry.identity) + len(entry.gzip or b"") + len(entry.br or b"")
+                for entry in self._entries.values()
+            )
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "stored_bytes": stored_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "evictions": self.evictions,
+            "brotli": brotli is not None,
+        }
@@ -0,0 +1,274 @@
+"""
+Latency metrics and profiling for the chat pipeline.
+span() times a pipeline stage into the rag_stage_duration_seconds
+histogram and, while a RequestTrace is active, into that request's span
+list. render_prometheus() serves all histograms in the Prometheus text
+format. SlowRequestProfiler samples the event loop thread's stack during
+requests and keeps the samples of those slower than a threshold.
+"""
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from collections import Counter, deque
+from contextvars import ContextVar
+import os
+import sys
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_histograms: Dict[str, "Histogram"] = {}
+_registry_lock = threading.Lock()
+
+_current_trace: ContextVar[Optional["RequestTrace"]] = ContextVar("current_trace", default=None)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """Cumulative-bucket histogram with a fixed set of label names."""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # label values -> [bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for label_values, values in sorted(series.items()):
+            for bound, count in zip(self.buckets, values):
+                labels = _format_labels(self.labels, label_values, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            count = values[len(self.buckets)]
+            labels = _format_labels(self.labels, label_values, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, label_values)} {values[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, label_values)} {count}")
+        return lines
+
+
+def get_histogram(name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    """Return the histogram registered under name, creating it if needed."""
+    with _registry_lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram(name, help_text, labels, buckets)
+    return histogram
+
+
+def render_prometheus() -> str:
+    """All registered metrics in the Prometheus text exposition format."""
+    with _registry_lock:
+        histograms = sorted(_histograms.values(), key=lambda h: h.name)
+    lines: List[str] = []
+    for histogram in histograms:
+        lines.extend(histogram.render())
+    return "\n".join(lines) + "\n"
+
+
+STAGE_SECONDS = get_histogram(
+    "rag_stage_duration_seconds",
+    "Duration of chat pipeline stages",
+    labels=("stage",)
+)
+REQUEST_SECONDS = get_histogram(
+    "chat_request_duration_seconds",
+    "End-to-end duration of chat requests",
+    labels=("endpoint",)
+)
+
+
+class RequestTrace:
+    """
+    Spans recorded during one request. Use as a context manager; tasks
+    created inside inherit the trace and add their spans to it.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self._token = None
+
+    def __enter__(self) -> "RequestTrace":
+        self._token = _current_trace.set(self)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        try:
+            _current_trace.reset(self._token)
+        except ValueError:
+            # Exited from another context, e.g. a streaming body closed
+            # after the client disconnected
+            pass
+
+    def breakdown(self) -> List[Dict[str, Any]]:
+        """Spans ordered by start time."""
+        return sorted(self.spans, key=lambda span: span["start_ms"])
+
+
+class Span:
+    """
+    Time a pipeline stage: `with span("embedding"): ...`.
+    The duration is observed in rag_stage_duration_seconds and, if a
+    RequestTrace is active, added to it. After the block, .ms holds it.
+    """
+
+    def __init__(self, stage: str, **attributes: Any):
+        self.stage = stage
+        self.attributes = attributes
+        self.ms = 0.0
+
+    def __enter__(self) -> "Span":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        end = time.perf_counter()
+        seconds = end - self._start
+        self.ms = round(seconds * 1000, 3)
+        STAGE_SECONDS.observe(seconds, self.stage)
+
+        trace = _current_trace.get()
+        if trace is not None:
+            record = {
+                "stage": self.stage,
+                "start_ms": round((self._start - trace.start) * 1000, 3),
+                "duration_ms": self.ms,
+                **self.attributes,
+            }
+            if exc_type is not None:
+                record["error"] = exc_type.__name__
+            trace.spans.append(record)
+
+
+def span(stage: str, **attributes: Any) -> Span:
+    return Span(stage, **attributes)
+
+
+class SlowRequestProfiler:
+    """
+    Sampling profiler for slow requests.
+
+    While profile() blocks are active, a daemon thread samples the stack
+    of the thread that entered them (the event loop) every interval_ms.
+    Requests that take at least threshold_ms keep their aggregated stack
+    samples (most frequent first) in recent(); faster ones drop them.
+    Since all requests share the loop thread, a sample shows whatever the
+    loop was running at that moment, which is what stalls every request.
+    """
+
+    def __init__(self, threshold_ms: float, interval_ms: float = 5.0, max_profiles: int = 20, max_depth: int = 40):
+        self.threshold_ms = threshold_ms
+        self.interval = interval_ms / 1000
+        self.max_depth = max_depth
+        self._profiles: deque = deque(maxlen=max_profiles)
+        self._lock = threading.Lock()
+        self._active: Dict[int, Tuple[int, Counter]] = {}
+        self._wake = threading.Event()
+        self._thread = None
+        self._next_id = 0
+
+    def _collapse(self, frame) -> str:
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            code = frame.f_code
+            names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def _sample_loop(self) -> None:
+        while True:
+            self._wake.wait()
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    self._wake.clear()
+                    continue
+                frames = sys._current_frames()
+                by_thread: Dict[int, str] = {}
+                for thread_id, samples in self._active.values():
+                    if thread_id not in by_thread:
+                        frame = frames.get(thread_id)
+                        by_thread[thread_id] = self._collapse(frame) if frame is not None else "<idle>"
+                    samples[by_thread[thread_id]] += 1
+
+    def profile(self, name: str) -> "_ProfileBlock":
+        return _ProfileBlock(self, name)
+
+    def _start(self) -> int:
+        with self._lock:
+            self._next_id += 1
+            request_id = self._next_id
+            self._active[request_id] = (threading.get_ident(), Counter())
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample_loop, name="slow-request-profiler", daemon=True)
+                self._thread.start()
+            self._wake.set()
+        return request_id
+
+    def _finish(self, request_id: int, name: str, duration_ms: float) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            _, samples = self._active.pop(request_id)
+        if duration_ms < self.threshold_ms:
+            return None
+        profile = {
+            "name": name,
+            "duration_ms": round(duration_ms, 3),
+            "samples": sum(samples.values()),
+            "interval_ms": self.interval * 1000,
+            "stacks": [{"stack": stack, "count": count} for stack, count in samples.most_common(20)],
+        }
+        self._profiles.append(profile)
+        top = samples.most_common(1)
+        logger.warning(
+            f"Slow request {name}: {duration_ms:.0f} ms, {profile['samples']} samples"
+            + (f", hottest frame: {top[0][0].rsplit(';', 1)[-1]}" if top else "")
+        )
+        return profile
+
+    def recent(self) -> List[Dict[str, Any]]:
+        return list(self._profiles)
+
+
+class _ProfileBlock:
+    def __init__(self, profiler: SlowRequestProfiler, name: str):
+        self.profiler = profiler
+        self.name = name
+        self.profile: Optional[Dict[str, Any]] = None
+
+    def __enter__(self) -> "_ProfileBlock":
+        self._start = time.perf_counter()
+        self._id = self.profiler._start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        duration_ms = (time.perf_counter() - self._start) * 1000
+        self.profile = self.profiler._finish(self._id, self.name, duration_ms)
@@ -3,12 +3,38 @@ Database configuration and session management.
 Uses async SQLAlchemy with PostgreSQL and pgvector extension.
 """
 from typing import AsyncGenerator
-from sqlalchemy import text
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+import logging
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.pool import NullPool
 from app.config import settings
 
+logger = logging.getLogger(__name__)
+
+
+def register_vector_codec(async_engine: AsyncEngine) -> None:
+    """
+    Register the pgvector binary codec on every new asyncpg connection.
+
+    Embeddings are then bound as float32 arrays in binary wire format instead
+    of being stringified into '[x,y,...]' literals. If the vector extension
+    does not exist yet (first start), registration is skipped for that
+    connection; init_db() disposes the pool after creating the extension.
+    """
+    if async_engine.dialect.driver != "asyncpg":
+        return
+
+    from pgvector.asyncpg import register_vector
+
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def _register_vector(dbapi_connection, connection_record):
+        try:
+            dbapi_connection.run_async(register_vector)
+        except Exception as e:
+            logger.warning(f"pgvector codec not registered on connection: {e}")
+
+
 # Create async engine
 engine = create_async_engine(
     settings.DATABASE_URL,
@@ -18,6 +44,7 @@ engine = create_async_engine(
     # Use NullPool for better handling with async
     poolclass=NullPool if settings.ENVIRONMENT == "testing" else None,
 )
+register_vector_codec(engine)
 
 # Create async session factory
 AsyncSessionLocal = async_sessionmaker(
@@ -68,6 +95,25 @@ async def init_db() -> None:
         # Create all tables
         await conn.run_sync(Base.metadata.create_all)
 
+        # create_all skips indexes on existing tables; the full-text index
+        # was added after document_chunks, so create it explicitly
+        await conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_document_chunks_content_fts "
+            "ON document_chunks USING gin (to_tsvector('english', content))"
+        ))
+        # Same for the conversation memory column and history index
+        await conn.execute(text(
+            "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS summarized_message_id INTEGER"
+        ))
+        await conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_messages_conversation_created "
+            "ON messages (conversation_id, created_at, id)"
+        ))
+
+    # Drop pooled connections opened before the vector type existed so that
+    # new connections register the binary codec
+    await engine.dispose()
+
 
 async def close_db() -> None:
     """
@@ -2,7 +2,8 @@
 Main FastAPI application for the US Battery Industry Intelligence Platform.
 """
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
 from slowapi import Limiter, _rate_limit_exceeded_handler
@@ -12,7 +13,9 @@ import logging
 
 from app.config import settings
 from app.database import init_db, close_db
-from app.api import companies, facilities, technologies, forecasts, policies, search, chat
+from app.core.metrics import render_prometheus
+from app.services.data_snapshot import SnapshotWatcher, get_snapshot
+from app.api import companies, facilities, technologies, forecasts, policies, search, chat, admin
 
 # Configure logging
 logging.basicConfig(
@@ -41,10 +44,40 @@ async def lifespan(app: FastAPI):
         logger.error(f"Failed to initialize database: {e}")
         raise
 
+    if settings.VECTOR_INDEX_AUTO_CREATE:
+        try:
+            action = await admin.index_manager.ensure_index()
+            logger.info(f"Vector index: {action}")
+        except Exception as e:
+            # Search still works without the index, just slower
+            logger.error(f"Failed to ensure vector index: {e}")
+
+    try:
+        await chat.rag_service.retriever.initialize()
+        logger.info(f"Retriever initialized: {chat.rag_service.retriever.stats()}")
+    except Exception as e:
+        logger.error(f"Failed to initialize retriever: {e}")
+        raise
+
+    # Read the JSON data once, before the first request needs it
+    get_snapshot()
+    data_watcher = None
+    if settings.DATA_RELOAD_INTERVAL_SECONDS > 0:
+        data_watcher = SnapshotWatcher(settings.DATA_RELOAD_INTERVAL_SECONDS)
+        data_watcher.start()
+
+    if chat.message_writer is not None:
+        chat.message_writer.start()
+
     yield
 
     # Shutdown
     logger.info("Shutting down...")
+    if data_watcher is not None:
+        await data_watcher.stop()
+    if chat.message_writer is not None:
+        # Flush queued chat messages while the pool is still open
+        await chat.message_writer.stop()
     try:
         await close_db()
         logger.info("Database connections closed")
@@ -93,9 +126,19 @@ async def health_check():
         "app": settings.APP_NAME,
         "version": settings.APP_VERSION,
         "environment": settings.ENVIRONMENT,
+        "data_version": get_snapshot().version,
     }
 
 
+# Prometheus metrics (chat stage and request latency histograms)
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Metrics in the Prometheus text exposition format."""
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
 # Root endpoint
 @app.get("/", tags=["Root"])
 async def root():
@@ -151,6 +194,12 @@ app.include_router(
     tags=["Chat"],
 )
 
+app.include_router(
+    admin.router,
+    prefix=f"{settings.API_V1_PREFIX}/admin",
+    tags=["Admin"],
+)
+
 
 if __name__ == "__main__":
     import uvicorn
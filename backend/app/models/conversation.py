@@ -3,7 +3,7 @@ Conversation and message models for chatbot.
 Tracks conversation history and enables conversation memory.
 """
 from typing import Optional
-from sqlalchemy import String, Text, Integer, Float, JSON, ForeignKey, Boolean
+from sqlalchemy import String, Text, Integer, Float, JSON, ForeignKey, Boolean, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from app.database import Base
 from app.models.base import TimestampMixin
@@ -27,6 +27,8 @@ class Conversation(Base, TimestampMixin):
     # Conversation metadata
     title: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)
     summary: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    # Last message folded into summary (see ConversationMemory)
+    summarized_message_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
     
     # Status
     is_active: Mapped[bool] = mapped_column(Boolean, default=True, nullable=False, index=True)
@@ -44,6 +46,10 @@ class Message(Base, TimestampMixin):
     Can be from user or assistant.
     """
     __tablename__ = "messages"
+    __table_args__ = (
+        # Recent-window history query: newest messages of a conversation first
+        Index("ix_messages_conversation_created", "conversation_id", "created_at", "id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     
@@ -3,13 +3,39 @@ Document and chunk models for RAG system.
 Stores document chunks with vector embeddings for semantic search.
 """
 from typing import Optional
-from sqlalchemy import String, Text, Integer, Float, JSON
+import numpy as np
+from sqlalchemy import String, Text, Integer, Float, JSON, Index, text
 from sqlalchemy.orm import Mapped, mapped_column
 from pgvector.sqlalchemy import Vector
 from app.database import Base
 from app.models.base import TimestampMixin
 
 
+class Float32Vector(Vector):
+    """
+    pgvector column bound as float32 NumPy arrays.
+
+    On asyncpg the binary codec registered by register_vector_codec() encodes
+    the array directly; other drivers fall back to the text literal.
+    """
+    cache_ok = True
+
+    def bind_processor(self, dialect):
+        if dialect.driver != "asyncpg":
+            return super().bind_processor(dialect)
+
+        def process(value):
+            if value is None:
+                return None
+            array = np.ascontiguousarray(value, dtype=np.float32)
+            if array.ndim != 1:
+                raise ValueError("expected ndim to be 1")
+            if self.dim is not None and array.shape[0] != self.dim:
+                raise ValueError(f"expected {self.dim} dimensions, not {array.shape[0]}")
+            return array
+        return process
+
+
 class DocumentChunk(Base, TimestampMixin):
     """
     Represents a chunk of a source document with its embedding.
@@ -18,6 +44,15 @@ class DocumentChunk(Base, TimestampMixin):
     context for user queries through vector similarity search.
     """
     __tablename__ = "document_chunks"
+    __table_args__ = (
+        # Full-text index for lexical/hybrid search; queries must use the
+        # same to_tsvector('english', content) expression to hit it
+        Index(
+            "ix_document_chunks_content_fts",
+            text("to_tsvector('english', content)"),
+            postgresql_using="gin",
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     
@@ -35,7 +70,7 @@ class DocumentChunk(Base, TimestampMixin):
     chunk_metadata: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)
     
     # Vector embedding for similarity search
-    embedding: Mapped[Vector] = mapped_column(Vector(1536), nullable=False)
+    embedding: Mapped[np.ndarray] = mapped_column(Float32Vector(1536), nullable=False)
     
     # Token count for cost tracking
     token_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
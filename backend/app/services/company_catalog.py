@@ -0,0 +1,304 @@
+"""
+Materialized company catalog for the data endpoints.
+Merges the top-N summary (visualization-data.json topCompanies) with the
+full company records of data/companies-detailed.json, builds the
+Company/CompanyDetail models once, and indexes them by slug, name and
+state. Sorted views per sort key are precomputed, so listing a page is a
+slice and filtering only touches the companies that match.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from types import MappingProxyType
+import bisect
+import re
+import logging
+
+from app.models.schemas import Company, CompanyDetail, Headquarters
+
+logger = logging.getLogger(__name__)
+
+US_STATES = {
+    "AL": "Alabama", "AK": "Alaska", "AZ": "Arizona", "AR": "Arkansas", "CA": "California",
+    "CO": "Colorado", "CT": "Connecticut", "DE": "Delaware", "DC": "District of Columbia",
+    "FL": "Florida", "GA": "Georgia", "HI": "Hawaii", "ID": "Idaho", "IL": "Illinois",
+    "IN": "Indiana", "IA": "Iowa", "KS": "Kansas", "KY": "Kentucky", "LA": "Louisiana",
+    "ME": "Maine", "MD": "Maryland", "MA": "Massachusetts", "MI": "Michigan", "MN": "Minnesota",
+    "MS": "Mississippi", "MO": "Missouri", "MT": "Montana", "NE": "Nebraska", "NV": "Nevada",
+    "NH": "New Hampshire", "NJ": "New Jersey", "NM": "New Mexico", "NY": "New York",
+    "NC": "North Carolina", "ND": "North Dakota", "OH": "Ohio", "OK": "Oklahoma", "OR": "Oregon",
+    "PA": "Pennsylvania", "RI": "Rhode Island", "SC": "South Carolina", "SD": "South Dakota",
+    "TN": "Tennessee", "TX": "Texas", "UT": "Utah", "VT": "Vermont", "VA": "Virginia",
+    "WA": "Washington", "WV": "West Virginia", "WI": "Wisconsin", "WY": "Wyoming"
+}
+STATE_CODES = {name.upper(): code for code, name in US_STATES.items()}
+
+DETAILED_SECTIONS = ("publicCompanies", "privateCompanies", "jointVentures")
+
+# Legal-form words ignored when matching names across the two files
+_NAME_SUFFIXES = {"inc", "corp", "corporation", "llc", "ltd", "co", "company", "holdings"}
+
+SORT_KEYS = ("name", "capacity")
+
+
+def company_slug(name: str) -> str:
+    """URL id of a company: lowercase name with dashes, no parentheses."""
+    return name.lower().replace(" ", "-").replace("(", "").replace(")", "")
+
+
+def name_key(name: str) -> str:
+    """
+    Name used to match a company across files: lowercase, without
+    parenthesized notes, punctuation or a trailing legal form, so
+    "Ultium Cells (GM-LG)" and "Ultium Cells LLC" match.
+    """
+    words = re.sub(r"\([^)]*\)", " ", name.lower())
+    words = re.sub(r"[^a-z0-9 ]+", " ", words).split()
+    while len(words) > 1 and words[-1] in _NAME_SUFFIXES:
+        words.pop()
+    return " ".join(words)
+
+
+def state_name(location: Optional[str]) -> Optional[str]:
+    """US state named by a location such as "Warren, OH" or "Nevada"."""
+    if not location:
+        return None
+    place = re.sub(r"\([^)]*\)", "", location).split(",")[-1].strip().upper()
+    if place in US_STATES:
+        return US_STATES[place]
+    if place in STATE_CODES:
+        return US_STATES[STATE_CODES[place]]
+    return None
+
+
+def _number(value: Any) -> Optional[float]:
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+class CompanyCatalog:
+    """
+    Read-only company models and their indexes.
+
+    - by_slug / by_name: slug and lowercased name -> position
+    - state_index: state name and two-letter code (upper case) -> positions
+    - views: ("name" | "capacity" | None, descending) -> positions in order;
+      None is the file order
+    """
+
+    def __init__(
+        self,
+        top_companies: Iterable[Dict[str, Any]],
+        state_rankings: Iterable[Dict[str, Any]],
+        detailed: Optional[Dict[str, Any]] = None
+    ):
+        # stateRankings names companies loosely ("Ultium Cells"), so match
+        # them on name_key()
+        ranking_states: Dict[str, List[str]] = {}
+        for state_data in state_rankings:
+            for name in state_data.get("companies", []):
+                ranking_states.setdefault(name_key(name), []).append(state_data["state"])
+
+        # Top-N records first (their ids are what clients already use),
+        # then the detailed records, merged into a top-N one when the
+        # names match
+        records: List[Dict[str, Any]] = []
+        by_key: Dict[str, int] = {}
+        for comp in top_companies:
+            key = name_key(comp["name"])
+            if key in by_key:
+                continue
+            by_key[key] = len(records)
+            records.append({"summary": comp, "detail": None})
+        for section in DETAILED_SECTIONS:
+            for comp in (detailed or {}).get(section, []):
+                if not isinstance(comp, dict) or not comp.get("name"):
+                    continue
+                key = name_key(comp["name"])
+                if key in by_key:
+                    if records[by_key[key]]["detail"] is None:
+                        records[by_key[key]]["detail"] = comp
+                    continue
+                by_key[key] = len(records)
+                records.append({"summary": None, "detail": comp})
+
+        companies: List[Company] = []
+        details: List[CompanyDetail] = []
+        self.detailed = sum(1 for record in records if record["detail"] is not None)
+        for record in records:
+            company, detail = self._materialize(record["summary"], record["detail"], ranking_states)
+            companies.append(company)
+            details.append(detail)
+
+        by_slug: Dict[str, int] = {}
+        by_name: Dict[str, int] = {}
+        state_index: Dict[str, List[int]] = {}
+        for pos, company in enumerate(companies):
+            by_slug.setdefault(company.id, pos)
+            by_name.setdefault(company.name.lower(), pos)
+            for state in company.states:
+                keys = {state.upper()}
+                if state.upper() in STATE_CODES:
+                    keys.add(STATE_CODES[state.upper()])
+                for key in keys:
+                    state_index.setdefault(key, []).append(pos)
+
+        positions = range(len(companies))
+        views: Dict[Tuple[Optional[str], bool], Tuple[int, ...]] = {
+            (None, False): tuple(positions),
+            (None, True): tuple(positions),
+        }
+        sort_values = {
+            "name": [company.name for company in companies],
+            "capacity": [company.capacity for company in companies],
+        }
+        for key, values in sort_values.items():
+            # Two stable sorts, so ties keep file order in both directions
+            views[(key, False)] = tuple(sorted(positions, key=values.__getitem__))
+            views[(key, True)] = tuple(sorted(positions, key=values.__getitem__, reverse=True))
+
+        self.companies: Tuple[Company, ...] = tuple(companies)
+        self.details: Tuple[CompanyDetail, ...] = tuple(details)
+        self.by_slug = MappingProxyType(by_slug)
+        self.by_name = MappingProxyType(by_name)
+        self.state_index = MappingProxyType({key: frozenset(value) for key, value in state_index.items()})
+        self.views = MappingProxyType(views)
+        self.ranks = MappingProxyType({
+            view_key: {pos: rank for rank, pos in enumerate(view)} for view_key, view in views.items()
+        })
+        # Capacities in ascending order, for range filters
+        self._capacity_view = views[("capacity", False)]
+        self._capacities = tuple(companies[pos].capacity for pos in self._capacity_view)
+        self._technologies = tuple(company.technology.lower() for company in companies)
+
+    @staticmethod
+    def _materialize(
+        summary: Optional[Dict[str, Any]],
+        detail: Optional[Dict[str, Any]],
+        ranking_states: Dict[str, List[str]]
+    ) -> Tuple[Company, CompanyDetail]:
+        primary = summary or detail
+        name = primary["name"]
+        detail = detail or {}
+
+        capacity = _number(summary["capacity"]) if summary else None
+        if capacity is None:
+            capacity = _number(detail.get("capacity_gwh")) or _number(detail.get("total_capacity_gwh")) or 0.0
+        technology = primary.get("technology") or detail.get("technology") or ""
+
+        states = list(dict.fromkeys(ranking_states.get(name_key(name), [])))
+        for facility in detail.get("facilities", []) or []:
+            state = state_name(facility.get("location")) if isinstance(facility, dict) else None
+            if state and state not in states:
+                states.append(state)
+
+        partnerships = detail.get("partnerships") or detail.get("partners") or []
+        company = Company(
+            id=company_slug(name),
+            name=name,
+            capacity=capacity,
+            technology=technology,
+            states=states,
+            facilities=[],
+            partnerships=[str(p) for p in partnerships]
+        )
+
+        if summary:
+            description = f"{name} is a leading battery manufacturer with {summary['capacity']} GWh capacity."
+        else:
+            stage = f" ({detail['stage']})" if detail.get("stage") else ""
+            description = f"{name}: {technology}{stage}."
+
+        headquarters = None
+        hq = detail.get("headquarters")
+        if isinstance(hq, str) and "," in hq:
+            city, state = (part.strip() for part in hq.rsplit(",", 1))
+            headquarters = Headquarters(city=city, state=state)
+
+        founded = detail.get("founded")
+        if not isinstance(founded, int) or not 1800 <= founded <= 2100:
+            founded = None
+
+        company_detail = CompanyDetail(
+            **company.model_dump(),
+            description=description,
+            founded=founded,
+            headquarters=headquarters,
+            facilities_detail=None,
+            financial_data=None,
+            key_executives=None
+        )
+        return company, company_detail
+
+    def __len__(self) -> int:
+        return len(self.companies)
+
+    def __iter__(self):
+        return iter(self.companies)
+
+    def find(self, company_id: str) -> Optional[int]:
+        """Position of a company by slug, or by name ignoring case."""
+        pos = self.by_slug.get(company_id)
+        if pos is None:
+            pos = self.by_name.get(company_id.lower())
+        return pos
+
+    def get(self, company_id: str) -> Optional[Company]:
+        pos = self.find(company_id)
+        return self.companies[pos] if pos is not None else None
+
+    def get_detail(self, company_id: str) -> Optional[CompanyDetail]:
+        pos = self.find(company_id)
+        return self.details[pos] if pos is not None else None
+
+    def states_of(self, company_id: str) -> Tuple[str, ...]:
+        company = self.get(company_id)
+        return tuple(company.states) if company else ()
+
+    def _capacity_range(self, min_capacity: Optional[float], max_capacity: Optional[float]) -> Set[int]:
+        lo = bisect.bisect_left(self._capacities, min_capacity) if min_capacity is not None else 0
+        hi = bisect.bisect_right(self._capacities, max_capacity) if max_capacity is not None else len(self._capacities)
+        return set(self._capacity_view[lo:hi])
+
+    def query(
+        self,
+        technology: Optional[str] = None,
+        state: Optional[str] = None,
+        min_capacity: Optional[float] = None,
+        max_capacity: Optional[float] = None,
+        sort_by: Optional[str] = "capacity",
+        descending: bool = True,
+        offset: int = 0,
+        limit: Optional[int] = None
+    ) -> Tuple[List[Company], int]:
+        """
+        One page of companies matching the filters, in sort order, and the
+        total number of matches. Without filters this is a slice of a
+        presorted view; with filters the index lookups narrow the matches
+        first and only those are ordered.
+        """
+        view_key = (sort_by if sort_by in SORT_KEYS else None, descending)
+        end = offset + limit if limit is not None else None
+
+        matches: Optional[Set[int]] = None
+        if state:
+            matches = set(self.state_index.get(state.upper(), ()))
+        if min_capacity is not None or max_capacity is not None:
+            in_range = self._capacity_range(min_capacity, max_capacity)
+            matches = in_range if matches is None else matches & in_range
+        if technology:
+            tech = technology.lower()
+            candidates = range(len(self.companies)) if matches is None else matches
+            matches = {pos for pos in candidates if tech in self._technologies[pos]}
+
+        if matches is None:
+            view = self.views[view_key]
+            return [self.companies[pos] for pos in view[offset:end]], len(view)
+
+        ranks = self.ranks[view_key]
+        ordered = sorted(matches, key=ranks.__getitem__)
+        return [self.companies[pos] for pos in ordered[offset:end]], len(ordered)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "companies": len(self.companies),
+            "detailed": self.detailed,
+            "states": sum(1 for key in self.state_index if len(key) > 2),
+        }
@@ -0,0 +1,271 @@
+"""
+Prompt context assembly for the RAG system.
+Turns retrieved chunks into the smallest useful context: adjacent chunks
+of the same section are merged (dropping the overlap they share),
+near-duplicates are removed, and what remains is packed by score into a
+token budget shared with the conversation history.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+from app.services.retrieval import RetrievedContext
+from app.services.text_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+# Rough per-message overhead of chat formatting (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def format_source(index: int, ctx: RetrievedContext) -> str:
+    """Format one context as it appears in the prompt."""
+    section_info = f" - {ctx.section_title}" if ctx.section_title else ""
+    return f"[Source {index}: {ctx.source_document}{section_info}]\n{ctx.content}\n"
+
+
+def context_score(ctx: RetrievedContext) -> float:
+    """Ranking score: the fusion score in hybrid mode, else similarity."""
+    return ctx.fusion_score if ctx.fusion_score is not None else ctx.similarity_score
+
+
+def _join_overlapping(first: str, second: str) -> str:
+    """
+    Append second to first, dropping the longest suffix of first that
+    second starts with (the chunk overlap).
+    """
+    probe = second[:32]
+    if probe:
+        # The overlap cannot be longer than second itself
+        pos = first.find(probe, max(0, len(first) - len(second)))
+        while pos != -1:
+            if second.startswith(first[pos:]):
+                return first + second[len(first) - pos:]
+            pos = first.find(probe, pos + 1)
+    return f"{first}\n\n{second}"
+
+
+class AssembledContext:
+    """Contexts and history selected for one prompt, with token accounting."""
+
+    def __init__(self):
+        self.contexts: List[RetrievedContext] = []
+        self.history: List[Dict[str, str]] = []
+        self.context_tokens = 0
+        self.history_tokens = 0
+        self.fixed_tokens = 0
+        self.retrieved = 0
+        self.merged = 0
+        self.duplicates = 0
+        self.dropped = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "retrieved_chunks": self.retrieved,
+            "merged_chunks": self.merged,
+            "duplicates_dropped": self.duplicates,
+            "sources_dropped": self.dropped,
+            "sources_used": len(self.contexts),
+            "history_messages": len(self.history),
+            "context_tokens": self.context_tokens,
+            "history_tokens": self.history_tokens,
+            "fixed_tokens": self.fixed_tokens,
+            "prompt_tokens": self.context_tokens + self.history_tokens + self.fixed_tokens,
+        }
+
+
+class ContextAssembler:
+    """
+    Builds the retrieved-context part of a prompt under a token budget.
+
+    max_prompt_tokens covers the whole prompt: system prompt, question
+    template, history and context. History gets up to history_share of
+    what is left after the fixed parts (most recent messages first, at
+    most max_history_messages); context gets the rest, optionally capped
+    at max_context_tokens.
+    """
+
+    def __init__(
+        self,
+        tokenizer,
+        max_prompt_tokens: int = 8000,
+        max_context_tokens: Optional[int] = None,
+        history_share: float = 0.25,
+        max_history_messages: int = 10,
+        duplicate_threshold: float = 0.85,
+        min_partial_tokens: int = 64
+    ):
+        self.tokenizer = tokenizer
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_context_tokens = max_context_tokens
+        self.history_share = history_share
+        self.max_history_messages = max_history_messages
+        self.duplicate_threshold = duplicate_threshold
+        self.min_partial_tokens = min_partial_tokens
+
+    # ------------------------------------------------------------------
+    # Merging and deduplication
+    # ------------------------------------------------------------------
+
+    def merge_adjacent(self, contexts: List[RetrievedContext]) -> List[RetrievedContext]:
+        """
+        Merge chunks with consecutive chunk_index from the same document
+        section into one context, removing the text they overlap on.
+        """
+        groups: Dict[Tuple[str, Optional[str]], List[RetrievedContext]] = {}
+        merged: List[RetrievedContext] = []
+        for ctx in contexts:
+            if ctx.chunk_index is None:
+                merged.append(ctx)
+            else:
+                groups.setdefault((ctx.source_document, ctx.section_title), []).append(ctx)
+
+        for group in groups.values():
+            group.sort(key=lambda ctx: ctx.chunk_index)
+            run = [group[0]]
+            for ctx in group[1:]:
+                if ctx.chunk_index == run[-1].chunk_index + 1:
+                    run.append(ctx)
+                else:
+                    merged.append(self._merge_run(run))
+                    run = [ctx]
+            merged.append(self._merge_run(run))
+        return merged
+
+    @staticmethod
+    def _merge_run(run: List[RetrievedContext]) -> RetrievedContext:
+        if len(run) == 1:
+            return run[0]
+        first = run[0]
+        # Chunks carry a "# {section}" prefix; keep it once
+        prefix = f"# {first.section_title}\n\n" if first.section_title else ""
+        bodies = [
+            ctx.content[len(prefix):] if prefix and ctx.content.startswith(prefix) else ctx.content
+            for ctx in run
+        ]
+        content = bodies[0]
+        for body in bodies[1:]:
+            content = _join_overlapping(content, body)
+
+        lexical = [ctx.lexical_score for ctx in run if ctx.lexical_score is not None]
+        fusion = [ctx.fusion_score for ctx in run if ctx.fusion_score is not None]
+        return RetrievedContext(
+            content=prefix + content,
+            source_document=first.source_document,
+            section_title=first.section_title,
+            similarity_score=max(ctx.similarity_score for ctx in run),
+            chunk_id=first.chunk_id,
+            metadata={
+                **(first.metadata or {}),
+                "merged_chunk_ids": [ctx.chunk_id for ctx in run],
+                "chunk_index_range": [first.chunk_index, run[-1].chunk_index],
+            },
+            chunk_index=first.chunk_index,
+            lexical_score=max(lexical) if lexical else None,
+            fusion_score=max(fusion) if fusion else None,
+        )
+
+    def drop_near_duplicates(self, contexts: List[RetrievedContext]) -> List[RetrievedContext]:
+        """
+        Drop contexts whose word 3-gram Jaccard similarity with a better
+        scored context is at least duplicate_threshold. Expects contexts
+        sorted best first.
+        """
+        kept: List[RetrievedContext] = []
+        kept_shingles: List[set] = []
+        for ctx in contexts:
+            words = tokenize(ctx.content)
+            shingles = {tuple(words[i:i + 3]) for i in range(max(1, len(words) - 2))}
+            duplicate = any(
+                len(shingles & other) / (len(shingles | other) or 1) >= self.duplicate_threshold
+                for other in kept_shingles
+            )
+            if not duplicate:
+                kept.append(ctx)
+                kept_shingles.append(shingles)
+        return kept
+
+    # ------------------------------------------------------------------
+    # Budgeting
+    # ------------------------------------------------------------------
+
+    def select_history(
+        self,
+        history: Optional[List[Dict[str, str]]],
+        budget: int
+    ) -> Tuple[List[Dict[str, str]], int]:
+        """Keep the most recent messages that fit in budget, in order."""
+        selected: List[Dict[str, str]] = []
+        used = 0
+        for msg in reversed((history or [])[-self.max_history_messages:]):
+            cost = self.tokenizer.count_tokens(msg["content"]) + MESSAGE_OVERHEAD_TOKENS
+            if used + cost > budget:
+                break
+            selected.append(msg)
+            used += cost
+        # Chat APIs expect the history to open with a user turn
+        while selected and selected[-1]["role"] != "user":
+            used -= self.tokenizer.count_tokens(selected.pop()["content"]) + MESSAGE_OVERHEAD_TOKENS
+        selected.reverse()
+        return selected, used
+
+    def pack(self, contexts: List[RetrievedContext], budget: int) -> Tuple[List[RetrievedContext], int]:
+        """
+        Take contexts in order while they fit in budget; the first one
+        that does not fit is truncated if at least min_partial_tokens of
+        its content still fit.
+        """
+        count = self.tokenizer.count_tokens
+        separator_tokens = count("\n---\n")
+        packed: List[RetrievedContext] = []
+        used = 0
+        for ctx in contexts:
+            overhead = separator_tokens if packed else 0
+            cost = count(format_source(len(packed) + 1, ctx)) + overhead
+            if used + cost <= budget:
+                packed.append(ctx)
+                used += cost
+                continue
+
+            header_cost = cost - count(ctx.content)
+            remaining = budget - used - header_cost
+            if remaining >= self.min_partial_tokens:
+                content = self.tokenizer.truncate(ctx.content, remaining)
+                partial = RetrievedContext(**{**ctx.to_dict(), "content": content})
+                packed.append(partial)
+                used += header_cost + count(partial.content)
+            break
+        return packed, used
+
+    def assemble(
+        self,
+        contexts: List[RetrievedContext],
+        history: Optional[List[Dict[str, str]]] = None,
+        fixed_tokens: int = 0
+    ) -> AssembledContext:
+        """
+        Merge, deduplicate, order and pack contexts, and select history.
+        fixed_tokens is the cost of the system prompt and question template.
+        """
+        result = AssembledContext()
+        result.retrieved = len(contexts)
+        result.fixed_tokens = fixed_tokens
+
+        merged = self.merge_adjacent(contexts)
+        result.merged = len(contexts) - len(merged)
+        ordered = sorted(merged, key=context_score, reverse=True)
+        unique = self.drop_near_duplicates(ordered)
+        result.duplicates = len(ordered) - len(unique)
+
+        available = max(0, self.max_prompt_tokens - fixed_tokens)
+        result.history, result.history_tokens = self.select_history(
+            history, int(available * self.history_share)
+        )
+        context_budget = available - result.history_tokens
+        if self.max_context_tokens:
+            context_budget = min(context_budget, self.max_context_tokens)
+
+        result.contexts, result.context_tokens = self.pack(unique, context_budget)
+        result.dropped = len(unique) - len(result.contexts)
+        if result.dropped or result.merged or result.duplicates:
+            logger.debug(f"Context assembled: {result.stats()}")
+        return result
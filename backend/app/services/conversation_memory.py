@@ -0,0 +1,228 @@
+"""
+Windowed conversation memory with a rolling summary.
+A prompt carries the conversation summary (Conversation.summary) plus the
+most recent messages, so neither the history query nor the prompt grows
+with the length of a session. Messages that fall out of the window are
+folded into the summary every few turns, in the background.
+"""
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+import asyncio
+import logging
+
+from sqlalchemy import and_, func, select, union_all, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.metrics import span
+from app.models.conversation import Conversation, Message
+
+logger = logging.getLogger(__name__)
+
+# summarize(previous_summary, messages) -> new summary
+Summarizer = Callable[[Optional[str], List[Dict[str, str]]], Awaitable[str]]
+
+
+class MemoryState:
+    """Summary and unsummarized recent messages of one conversation."""
+
+    def __init__(
+        self,
+        summary: Optional[str] = None,
+        messages: Optional[List[Dict[str, str]]] = None,
+        pending: int = 0,
+        needs_summary: bool = False
+    ):
+        self.summary = summary
+        self.messages = messages or []
+        # Messages outside the window that are not in the summary yet
+        self.pending = pending
+        self.needs_summary = needs_summary
+
+
+class ConversationMemory:
+    """
+    Rolling summary plus a window of the last window_messages messages.
+
+    Once summary_interval turns (two messages each) have left the window
+    they are folded into the summary, which is capped at
+    max_summary_tokens. Until then they stay in the history, so at most
+    window_messages + 2 * summary_interval messages are ever loaded.
+    Conversation.summarized_message_id marks the last folded message.
+    """
+
+    def __init__(
+        self,
+        tokenizer,
+        window_messages: int = 10,
+        summary_interval: int = 2,
+        max_summary_tokens: int = 400,
+        session_factory=None
+    ):
+        self.tokenizer = tokenizer
+        self.window_messages = window_messages
+        self.summary_interval = summary_interval
+        self.max_summary_tokens = max_summary_tokens
+        self.session_factory = session_factory
+        self._updating: Set[int] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def max_messages(self) -> int:
+        return self.window_messages + 2 * self.summary_interval
+
+    def _history_query(self, conversation):
+        """
+        Summary, pointer and newest unsummarized messages of the single
+        conversation row in the conversation selectable. Walks the
+        (conversation_id, created_at, id) index backwards.
+        """
+        return (
+            select(
+                conversation.c.id.label("conversation_id"),
+                conversation.c.summary,
+                conversation.c.summarized_message_id,
+                Message.id,
+                Message.role,
+                Message.content
+            )
+            .select_from(conversation)
+            .outerjoin(
+                Message,
+                and_(
+                    Message.conversation_id == conversation.c.id,
+                    Message.id > func.coalesce(conversation.c.summarized_message_id, 0)
+                )
+            )
+            .order_by(Message.created_at.desc(), Message.id.desc())
+            .limit(self.max_messages)
+        )
+
+    async def _fetch(self, db: AsyncSession, conversation_id: int):
+        conversation = Conversation.__table__
+        result = await db.execute(
+            self._history_query(conversation).where(conversation.c.id == conversation_id)
+        )
+        rows = result.all()
+        if not rows:
+            return None, None, []
+        messages = [row for row in reversed(rows) if row.id is not None]
+        return rows[0].summary, rows[0].summarized_message_id, messages
+
+    def _state(self, summary: Optional[str], rows: List[Any]) -> MemoryState:
+        messages = [{"role": row.role, "content": row.content} for row in rows]
+        # Chat APIs expect the history to open with a user turn
+        while messages and messages[0]["role"] != "user":
+            messages.pop(0)
+
+        pending = max(0, len(rows) - self.window_messages)
+        return MemoryState(
+            summary=summary,
+            messages=messages,
+            pending=pending,
+            needs_summary=pending >= 2 * self.summary_interval
+        )
+
+    async def load(self, db: AsyncSession, conversation_id: int) -> MemoryState:
+        """Load the summary and recent messages for a prompt."""
+        with span("history_load"):
+            summary, _, rows = await self._fetch(db, conversation_id)
+        return self._state(summary, rows)
+
+    async def open(
+        self,
+        db: AsyncSession,
+        session_id: str,
+        user_id: Optional[str] = None
+    ) -> Tuple[int, MemoryState]:
+        """
+        Get or create the conversation for session_id and load its memory
+        in a single statement. Returns (conversation_id, memory).
+
+        The new row is inserted with ON CONFLICT DO NOTHING and an existing
+        one read from the table, so existing conversations are not locked
+        for the rest of the transaction.
+        """
+        for _ in range(2):
+            inserted = (
+                pg_insert(Conversation)
+                .values(session_id=session_id, user_id=user_id, is_active=True)
+                .on_conflict_do_nothing(index_elements=[Conversation.session_id])
+                .returning(Conversation.id, Conversation.summary, Conversation.summarized_message_id)
+                .cte("inserted")
+            )
+            # Both branches see the same snapshot: exactly one of them
+            # returns the row
+            conversation = union_all(
+                select(inserted.c.id, inserted.c.summary, inserted.c.summarized_message_id),
+                select(Conversation.id, Conversation.summary, Conversation.summarized_message_id)
+                .where(Conversation.session_id == session_id)
+            ).subquery("conversation")
+
+            with span("conversation_open"):
+                rows = (await db.execute(self._history_query(conversation))).all()
+            if rows:
+                messages = [row for row in reversed(rows) if row.id is not None]
+                return rows[0].conversation_id, self._state(rows[0].summary, messages)
+            # A concurrent request inserted the same session after our
+            # snapshot was taken; the retry sees its row
+        raise RuntimeError(f"Could not open conversation for session {session_id}")
+
+    async def update_summary(self, db: AsyncSession, conversation_id: int, summarize: Summarizer) -> bool:
+        """
+        Fold the messages that left the window into the summary.
+        Returns False if there was not enough to fold or another update
+        moved the summary first.
+        """
+        summary, pointer, rows = await self._fetch(db, conversation_id)
+        evicted = rows[:-self.window_messages] if self.window_messages else rows
+        if len(evicted) < 2 * self.summary_interval:
+            return False
+
+        new_summary = await summarize(
+            summary, [{"role": row.role, "content": row.content} for row in evicted]
+        )
+        new_summary = self.tokenizer.truncate(new_summary.strip(), self.max_summary_tokens)
+
+        # Only move the pointer if nobody else did in the meantime
+        current = (
+            Conversation.summarized_message_id.is_(None)
+            if pointer is None
+            else Conversation.summarized_message_id == pointer
+        )
+        result = await db.execute(
+            update(Conversation)
+            .where(Conversation.id == conversation_id, current)
+            .values(summary=new_summary, summarized_message_id=evicted[-1].id)
+        )
+        await db.commit()
+        return result.rowcount == 1
+
+    def schedule_update(self, conversation_id: int, summarize: Summarizer) -> Optional[asyncio.Task]:
+        """Run update_summary() in the background on its own session."""
+        if self.session_factory is None or conversation_id in self._updating:
+            return None
+        self._updating.add(conversation_id)
+
+        async def run() -> None:
+            try:
+                async with self.session_factory() as db:
+                    if await self.update_summary(db, conversation_id, summarize):
+                        logger.debug(f"Updated summary of conversation {conversation_id}")
+            except Exception as e:
+                logger.warning(f"Conversation summary update failed for {conversation_id}: {e}")
+            finally:
+                self._updating.discard(conversation_id)
+
+        task = asyncio.create_task(run())
+        # Keep a reference so the task is not garbage collected mid-run
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_messages": self.window_messages,
+            "summary_interval": self.summary_interval,
+            "max_summary_tokens": self.max_summary_tokens,
+            "updates_running": len(self._updating),
+        }
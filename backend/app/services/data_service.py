@@ -2,14 +2,14 @@
 Data service for Battery Intelligence Platform
 Handles data retrieval and business logic
 """
-import json
 from typing import Dict, List, Optional, Any
 from datetime import datetime
 import uuid
-from pathlib import Path
+
+from fastapi import Response
 
 from ..models.schemas import (
-    Company, CompanyDetail, CompanyListResponse,
+    CompanyDetail, CompanyListResponse,
     FacilityBase, FacilityDetail, FacilityListResponse,
     NearbyFacilitiesResponse, SearchResponse,
     CapacityForecast, CostForecast,
@@ -20,39 +20,16 @@ from ..models.schemas import (
     CapacityForecastMetadata, CapacityDataPoint,
     CostForecastMetadata, CostDataPoint
 )
+from .data_snapshot import DataSnapshot, get_snapshot
 
 
 class DataService:
     """Service for data access and business logic"""
 
-    def __init__(self):
-        # Load visualization data
-        self.data = self._load_data()
-
-    def _load_data(self) -> dict:
-        """Load data from visualization-data.json"""
-        # In production, this would connect to a database
-        # For now, loading from the JSON file
-        data_path = Path(__file__).parent.parent.parent.parent / "visualization-data.json"
-
-        try:
-            with open(data_path, 'r') as f:
-                return json.load(f)
-        except FileNotFoundError:
-            # Return empty structure if file not found
-            return {
-                "topCompanies": [],
-                "stateRankings": [],
-                "costCurve": [],
-                "capacityGrowth": [],
-                "technologyMix": {},
-                "energyDensity": {},
-                "marketShare": {},
-                "cycleLife": {},
-                "regionalClusters": [],
-                "timeline": {},
-                "keyMetrics": {}
-            }
+    def __init__(self, snapshot: Optional[DataSnapshot] = None):
+        # Shared, read-only data loaded once per process
+        self.snapshot = snapshot or get_snapshot()
+        self.data = self.snapshot.data
 
     # ========================================================================
     # COMPANIES
@@ -68,40 +45,19 @@ class DataService:
     ) -> CompanyListResponse:
         """Get list of companies with filtering and pagination"""
 
-        # Get companies from data
-        companies_data = self.data.get("topCompanies", [])
-
-        # Convert to Company objects
-        companies = []
-        for idx, comp in enumerate(companies_data):
-            # Extract states from stateRankings
-            states = []
-            for state_data in self.data.get("stateRankings", []):
-                if comp["name"] in state_data.get("companies", []):
-                    states.append(state_data["state"])
-
-            company = Company(
-                id=comp["name"].lower().replace(" ", "-").replace("(", "").replace(")", ""),
-                name=comp["name"],
-                capacity=comp["capacity"],
-                technology=comp["technology"],
-                states=states,
-                facilities=[],
-                partnerships=[]
-            )
-            companies.append(company)
-
-        # Apply filters
-        filtered = self._apply_company_filters(companies, filters)
-
-        # Sort
-        filtered = self._sort_companies(filtered, sort_by, sort_order)
-
-        # Paginate
-        total_items = len(filtered)
+        # Filter and paginate on the presorted, indexed catalog
         start_idx = (page - 1) * page_size
         end_idx = start_idx + page_size
-        paginated = filtered[start_idx:end_idx]
+        paginated, total_items = self.snapshot.companies.query(
+            technology=filters.get("technology"),
+            state=filters.get("state"),
+            min_capacity=filters.get("min_capacity"),
+            max_capacity=filters.get("max_capacity"),
+            sort_by=sort_by,
+            descending=sort_order.lower() == "desc",
+            offset=start_idx,
+            limit=page_size
+        )
 
         # Create pagination metadata
         pagination = Pagination(
@@ -119,104 +75,28 @@ class DataService:
             filters_applied=filters
         )
 
-    def _apply_company_filters(self, companies: List[Company], filters: dict) -> List[Company]:
-        """Apply filters to company list"""
-        filtered = companies
-
-        if filters.get("technology"):
-            tech = filters["technology"].lower()
-            filtered = [c for c in filtered if tech in c.technology.lower()]
-
-        if filters.get("state"):
-            state = filters["state"].upper()
-            filtered = [c for c in filtered if state in c.states]
-
-        if filters.get("min_capacity") is not None:
-            min_cap = filters["min_capacity"]
-            filtered = [c for c in filtered if c.capacity >= min_cap]
-
-        if filters.get("max_capacity") is not None:
-            max_cap = filters["max_capacity"]
-            filtered = [c for c in filtered if c.capacity <= max_cap]
-
-        return filtered
-
-    def _sort_companies(self, companies: List[Company], sort_by: str, sort_order: str) -> List[Company]:
-        """Sort companies"""
-        reverse = sort_order.lower() == "desc"
-
-        if sort_by == "name":
-            return sorted(companies, key=lambda c: c.name, reverse=reverse)
-        elif sort_by == "capacity":
-            return sorted(companies, key=lambda c: c.capacity, reverse=reverse)
-        else:
-            return companies
-
     async def get_company_by_id(self, company_id: str) -> Optional[CompanyDetail]:
         """Get detailed company information"""
-        # Find company in data
-        for comp in self.data.get("topCompanies", []):
-            slug = comp["name"].lower().replace(" ", "-").replace("(", "").replace(")", "")
-            if slug == company_id or comp["name"].lower() == company_id.lower():
-                # Build detailed company
-                states = []
-                for state_data in self.data.get("stateRankings", []):
-                    if comp["name"] in state_data.get("companies", []):
-                        states.append(state_data["state"])
-
-                return CompanyDetail(
-                    id=slug,
-                    name=comp["name"],
-                    capacity=comp["capacity"],
-                    technology=comp["technology"],
-                    states=states,
-                    facilities=[],
-                    partnerships=[],
-                    description=f"{comp['name']} is a leading battery manufacturer with {comp['capacity']} GWh capacity.",
-                    founded=None,
-                    headquarters=None,
-                    facilities_detail=None,
-                    financial_data=None,
-                    key_executives=None
-                )
-
-        return None
+        return self.snapshot.companies.get_detail(company_id)
 
     async def search_companies(self, query: str, fields: List[str], limit: int) -> SearchResponse:
         """Full-text search for companies"""
-        results = []
-        query_lower = query.lower()
-
-        for comp in self.data.get("topCompanies", [])[:limit]:
-            score = 0.0
-
-            # Simple scoring based on field matches
-            if "name" in fields and query_lower in comp["name"].lower():
-                score += 0.5
-            if "technology" in fields and query_lower in comp["technology"].lower():
-                score += 0.3
-
-            if score > 0:
-                slug = comp["name"].lower().replace(" ", "-").replace("(", "").replace(")", "")
-                results.append(SearchResult(
-                    type="company",
-                    item={
-                        "id": slug,
-                        "name": comp["name"],
-                        "capacity": comp["capacity"],
-                        "technology": comp["technology"]
-                    },
-                    score=score,
-                    highlights=[comp["name"]] if query_lower in comp["name"].lower() else []
-                ))
-
-        # Sort by score
-        results.sort(key=lambda r: r.score, reverse=True)
+        return await self.search(query, types=["company"], fields=fields, limit=limit)
+
+    async def search(
+        self,
+        query: str,
+        types: Optional[List[str]] = None,
+        fields: Optional[List[str]] = None,
+        limit: int = 10
+    ) -> SearchResponse:
+        """Ranked search over companies, policies, technologies and timeline"""
+        hits, total = self.snapshot.search_index.search(query, types=types, fields=fields, limit=limit)
 
         return SearchResponse(
             query=query,
-            total_results=len(results),
-            data=results[:limit]
+            total_results=total,
+            data=[SearchResult(**hit) for hit in hits]
         )
 
     # ========================================================================
@@ -287,32 +167,22 @@ class DataService:
     ) -> CapacityForecast:
         """Get capacity forecast data"""
 
-        capacity_data = self.data.get("capacityGrowth", [])
+        series = self.snapshot.capacity
+        span = series.between(start_year, end_year)
 
-        # Filter by year range
-        if start_year:
-            capacity_data = [d for d in capacity_data if d["year"] >= start_year]
-        if end_year:
-            capacity_data = [d for d in capacity_data if d["year"] <= end_year]
-
-        # Convert to data points
+        # Convert to data points; the first point has no previous one in range
         data_points = []
-        for i, point in enumerate(capacity_data):
-            growth_rate = None
-            if i > 0:
-                prev = capacity_data[i-1]
-                growth_rate = ((point["capacity"] - prev["capacity"]) / prev["capacity"]) * 100
-
+        for i in span:
             data_points.append(CapacityDataPoint(
-                year=point["year"],
-                capacity=point["capacity"],
-                growth_rate=growth_rate,
+                year=series.years[i],
+                capacity=series.values[i],
+                growth_rate=series.changes[i] if i > span.start else None,
                 breakdown=None
             ))
 
         metadata = CapacityForecastMetadata(
-            start_year=capacity_data[0]["year"] if capacity_data else 2015,
-            end_year=capacity_data[-1]["year"] if capacity_data else 2030,
+            start_year=series.years[span.start] if span else 2015,
+            end_year=series.years[span.stop - 1] if span else 2030,
             granularity=granularity,
             confidence_interval="95%"
         )
@@ -331,32 +201,23 @@ class DataService:
     ) -> CostForecast:
         """Get cost forecast data"""
 
-        cost_data = self.data.get("costCurve", [])
+        series = self.snapshot.cost
+        span = series.between(start_year, end_year)
 
-        # Filter by year range
-        if start_year:
-            cost_data = [d for d in cost_data if d["year"] >= start_year]
-        if end_year:
-            cost_data = [d for d in cost_data if d["year"] <= end_year]
-
-        # Convert to data points
+        # Convert to data points; a reduction is a negative change
         data_points = []
-        for i, point in enumerate(cost_data):
-            reduction_rate = None
-            if i > 0:
-                prev = cost_data[i-1]
-                reduction_rate = ((prev["cost"] - point["cost"]) / prev["cost"]) * 100
-
+        for i in span:
+            change = series.changes[i] if i > span.start else None
             data_points.append(CostDataPoint(
-                year=point["year"],
-                cost=point["cost"],
-                reduction_rate=reduction_rate,
+                year=series.years[i],
+                cost=series.values[i],
+                reduction_rate=-change if change is not None else None,
                 breakdown=None
             ))
 
         metadata = CostForecastMetadata(
             unit="$/kWh",
-            base_year=cost_data[0]["year"] if cost_data else 2015
+            base_year=series.years[span.start] if span else 2015
         )
 
         return CostForecast(
@@ -489,8 +350,10 @@ class DataService:
 
     async def get_policy_by_id(self, policy_id: str) -> Optional[PolicyDetail]:
         """Get detailed policy information"""
-        # In production, query from database
-        return None
+        policy = self.snapshot.policies_by_id.get(policy_id)
+        if policy is None:
+            return None
+        return PolicyDetail(**policy)
 
     async def get_policy_impact(self, policy_id: str) -> Optional[PolicyImpactResponse]:
         """Get policy impact analysis"""
@@ -554,3 +417,14 @@ class DataService:
         history = []
 
         return ChatHistoryResponse(data=history)
+
+
+def get_data_service(response: Response) -> DataService:
+    """
+    FastAPI dependency: a DataService over the current data snapshot.
+    The request keeps that snapshot even if a reload swaps it meanwhile;
+    its version is sent in the X-Data-Version header.
+    """
+    snapshot = get_snapshot()
+    response.headers["X-Data-Version"] = snapshot.version
+    return DataService(snapshot)
@@ -0,0 +1,367 @@
+"""
+In-process snapshot of the platform's JSON data.
+visualization-data.json, search-data.json and data/*.json are read and
+decoded once; the snapshot keeps the raw data together with lookup
+structures and a search index built at load time, so read endpoints
+never touch the disk or re-scan lists.
+Snapshots are never modified after they are built and are shared by all
+requests. SnapshotWatcher polls the files and swaps in a freshly built
+and validated snapshot when they change; requests that already hold the
+old one finish on it.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+from pathlib import Path
+from types import MappingProxyType
+import asyncio
+import bisect
+import hashlib
+import json
+import os
+import threading
+import time
+import logging
+
+from app.services.company_catalog import CompanyCatalog
+from app.services.search_index import build_search_index
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATA_PATH = Path(__file__).parent.parent.parent.parent / "visualization-data.json"
+DEFAULT_DATA_DIR = DEFAULT_DATA_PATH.parent / "data"
+# Further files loaded (and watched) next to the main data file
+EXTRA_DATA_FILES = ("search-data.json",)
+
+# Top-level keys of visualization-data.json and the type each must have
+DATA_SCHEMA = {
+    "topCompanies": list,
+    "stateRankings": list,
+    "costCurve": list,
+    "capacityGrowth": list,
+    "technologyMix": dict,
+    "energyDensity": dict,
+    "marketShare": dict,
+    "cycleLife": dict,
+    "regionalClusters": list,
+    "timeline": dict,
+    "keyMetrics": dict
+}
+
+EMPTY_DATA = {
+    "topCompanies": [],
+    "stateRankings": [],
+    "costCurve": [],
+    "capacityGrowth": [],
+    "technologyMix": {},
+    "energyDensity": {},
+    "marketShare": {},
+    "cycleLife": {},
+    "regionalClusters": [],
+    "timeline": {},
+    "keyMetrics": {}
+}
+
+_snapshot: Optional["DataSnapshot"] = None
+_snapshot_lock = threading.Lock()
+
+
+class SnapshotValidationError(ValueError):
+    """Raised when data files do not have the shape the API relies on."""
+
+
+class YearSeries:
+    """
+    A yearly series sorted by year, with the change against the previous
+    point precomputed. between() slices it by binary search.
+    """
+
+    def __init__(self, points: List[Dict[str, Any]], value_key: str):
+        ordered = sorted(points, key=lambda point: point["year"])
+        self.years: Tuple[int, ...] = tuple(point["year"] for point in ordered)
+        self.values: Tuple[float, ...] = tuple(point[value_key] for point in ordered)
+        # Percent change from the previous point; None for the first
+        changes: List[Optional[float]] = [None]
+        for prev, value in zip(self.values, self.values[1:]):
+            changes.append((value - prev) / prev * 100 if prev else None)
+        self.changes: Tuple[Optional[float], ...] = tuple(changes)
+
+    def between(self, start_year: Optional[int], end_year: Optional[int]) -> range:
+        """Indexes of the points with start_year <= year <= end_year."""
+        lo = bisect.bisect_left(self.years, start_year) if start_year else 0
+        hi = bisect.bisect_right(self.years, end_year) if end_year else len(self.years)
+        return range(lo, max(lo, hi))
+
+    def __len__(self) -> int:
+        return len(self.years)
+
+
+class DataSnapshot:
+    """
+    Immutable view of the loaded data plus its indexes:
+
+    - companies: CompanyCatalog of topCompanies merged with
+      data/companies-detailed.json
+    - capacity / cost: year-indexed capacityGrowth and costCurve series
+    - policies_by_id: policy id -> record
+
+    datasets holds the other data files by stem (e.g. "companies-detailed",
+    "search-data"), and search_index a SearchIndex over all of them.
+    version is a hash of all file contents.
+    """
+
+    __slots__ = (
+        "data", "datasets", "source", "version", "loaded_at",
+        "companies", "capacity", "cost", "policies_by_id", "search_index"
+    )
+
+    def __init__(
+        self,
+        data: Dict[str, Any],
+        datasets: Optional[Dict[str, Any]] = None,
+        source: Optional[str] = None,
+        version: str = "empty"
+    ):
+        policies = {
+            str(policy["id"]): policy
+            for policy in data.get("policies", [])
+            if policy.get("id") is not None
+        }
+
+        setattr_ = object.__setattr__
+        setattr_(self, "data", MappingProxyType(data))
+        setattr_(self, "datasets", MappingProxyType(dict(datasets or {})))
+        setattr_(self, "source", source)
+        setattr_(self, "version", version)
+        setattr_(self, "loaded_at", time.time())
+        setattr_(self, "companies", CompanyCatalog(
+            data.get("topCompanies", []),
+            data.get("stateRankings", []),
+            self.datasets.get("companies-detailed")
+        ))
+        setattr_(self, "capacity", YearSeries(data.get("capacityGrowth", []), "capacity"))
+        setattr_(self, "cost", YearSeries(data.get("costCurve", []), "cost"))
+        setattr_(self, "policies_by_id", MappingProxyType(policies))
+        setattr_(self, "search_index", build_search_index(self.companies, self.datasets, policies))
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError("DataSnapshot is read-only")
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.data.get(key, default)
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.version}"'
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "source": self.source,
+            "datasets": sorted(self.datasets),
+            "companies": len(self.companies),
+            "policies": len(self.policies_by_id),
+            "capacity_years": len(self.capacity),
+            "cost_years": len(self.cost),
+            "search_documents": len(self.search_index),
+        }
+
+
+def validate_data(data: Any) -> None:
+    """Check the parts of visualization-data.json the indexes and endpoints use."""
+    if not isinstance(data, dict):
+        raise SnapshotValidationError("top level must be an object")
+    errors = []
+    for key, expected in DATA_SCHEMA.items():
+        if key in data and not isinstance(data[key], expected):
+            errors.append(f"{key} must be a {expected.__name__}")
+    for i, comp in enumerate(data.get("topCompanies") or []):
+        if not isinstance(comp, dict) or not isinstance(comp.get("name"), str):
+            errors.append(f"topCompanies[{i}] has no name")
+        elif not isinstance(comp.get("capacity"), (int, float)) or not isinstance(comp.get("technology"), str):
+            errors.append(f"topCompanies[{i}] ({comp['name']}) needs a numeric capacity and a technology")
+    for i, state in enumerate(data.get("stateRankings") or []):
+        if not isinstance(state, dict) or "state" not in state:
+            errors.append(f"stateRankings[{i}] has no state")
+    for key, value_key in (("capacityGrowth", "capacity"), ("costCurve", "cost")):
+        for i, point in enumerate(data.get(key) or []):
+            if (
+                not isinstance(point, dict)
+                or not isinstance(point.get("year"), int)
+                or not isinstance(point.get(value_key), (int, float))
+            ):
+                errors.append(f"{key}[{i}] needs an integer year and a numeric {value_key}")
+    if errors:
+        raise SnapshotValidationError("; ".join(errors[:10]))
+
+
+def data_files(path: Optional[Path] = None, data_dir: Optional[Path] = None) -> List[Path]:
+    """
+    The files a snapshot is built from: the main data file, the extra
+    files next to it that exist, then data/*.json.
+    """
+    path = Path(path or DEFAULT_DATA_PATH)
+    data_dir = Path(data_dir or DEFAULT_DATA_DIR)
+    files = [path]
+    files.extend(extra for extra in (path.parent / name for name in EXTRA_DATA_FILES) if extra.is_file())
+    if data_dir.is_dir():
+        files.extend(sorted(data_dir.glob("*.json")))
+    return files
+
+
+def load_snapshot(
+    path: Optional[Path] = None,
+    data_dir: Optional[Path] = None,
+    allow_missing: bool = True
+) -> DataSnapshot:
+    """
+    Read, validate and index the data files. A missing main file gives
+    an empty snapshot when allow_missing, and an error otherwise. Raises
+    ValueError (including SnapshotValidationError) for bad content.
+    """
+    path = Path(path or DEFAULT_DATA_PATH)
+    digest = hashlib.sha1()
+    data: Any = None
+    datasets: Dict[str, Any] = {}
+    for file in data_files(path, data_dir):
+        try:
+            raw = file.read_bytes()
+        except FileNotFoundError:
+            if file != path or not allow_missing:
+                raise
+            logger.warning(f"Data file {path} not found, serving empty data")
+            data = dict(EMPTY_DATA)
+            continue
+        digest.update(file.name.encode())
+        digest.update(raw)
+        try:
+            parsed = json.loads(raw)
+        except ValueError as e:
+            raise SnapshotValidationError(f"{file.name}: {e}") from e
+        if file == path:
+            data = parsed
+        else:
+            datasets[file.stem] = parsed
+
+    validate_data(data)
+    snapshot = DataSnapshot(data, datasets, source=str(path), version=digest.hexdigest()[:16])
+    logger.info(f"Loaded data snapshot: {snapshot.stats()}")
+    return snapshot
+
+
+def get_snapshot() -> DataSnapshot:
+    """The process-wide snapshot, loaded on first use."""
+    global _snapshot
+    snapshot = _snapshot
+    if snapshot is None:
+        with _snapshot_lock:
+            if _snapshot is None:
+                _snapshot = load_snapshot()
+            snapshot = _snapshot
+    return snapshot
+
+
+def set_snapshot(snapshot: DataSnapshot) -> DataSnapshot:
+    """Make snapshot the process-wide one; returns the one it replaces."""
+    global _snapshot
+    with _snapshot_lock:
+        previous, _snapshot = _snapshot, snapshot
+    return previous
+
+
+class SnapshotWatcher:
+    """
+    Hot reload of the data files.
+
+    Every interval seconds the watcher compares the size and mtime of the
+    data files (and the set of data/*.json files) with what it saw last.
+    On a change it builds and validates a new snapshot in a worker thread
+    and swaps it in with set_snapshot(). A snapshot that fails to load or
+    validate is logged and the current one stays in place until the files
+    change again. Requests never check the files themselves.
+    """
+
+    def __init__(self, interval: float = 5.0, path: Optional[Path] = None, data_dir: Optional[Path] = None):
+        self.interval = interval
+        self.path = Path(path or DEFAULT_DATA_PATH)
+        self.data_dir = Path(data_dir or DEFAULT_DATA_DIR)
+        self._signature = self._stat()
+        self._task = None
+
+        self.reloads = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.last_reload_ms = 0.0
+
+    def _stat(self) -> Tuple[Tuple[str, int, int], ...]:
+        signature = []
+        for file in data_files(self.path, self.data_dir):
+            try:
+                stat = os.stat(file)
+            except FileNotFoundError:
+                continue
+            signature.append((str(file), stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if not self.running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.check()
+            except Exception as e:
+                logger.error(f"Data file check failed: {e}")
+
+    async def check(self) -> bool:
+        """Reload if the files changed since the last check; True if swapped."""
+        signature = await asyncio.to_thread(self._stat)
+        if signature == self._signature:
+            return False
+        self._signature = signature
+
+        start = time.perf_counter()
+        try:
+            snapshot = await asyncio.to_thread(load_snapshot, self.path, self.data_dir, False)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.failures += 1
+            self.last_error = str(e)
+            logger.error(f"Data reload rejected, keeping version {get_snapshot().version}: {e}")
+            return False
+
+        self.last_error = None
+        current = get_snapshot()
+        if current.version == snapshot.version:
+            logger.info(f"Data files touched, content unchanged (version {snapshot.version})")
+            return False
+
+        set_snapshot(snapshot)
+        self.reloads += 1
+        self.last_reload_ms = round((time.perf_counter() - start) * 1000, 3)
+        logger.info(f"Data reloaded: version {current.version} -> {snapshot.version} in {self.last_reload_ms} ms")
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "interval_seconds": self.interval,
+            "version": get_snapshot().version,
+            "reloads": self.reloads,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "last_reload_ms": self.last_reload_ms,
+        }
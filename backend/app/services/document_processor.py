@@ -3,12 +3,40 @@ Document processing service for RAG system.
 Handles document loading, chunking, and metadata extraction.
 """
 import hashlib
+import itertools
 import re
 from pathlib import Path
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
 import markdown
 from bs4 import BeautifulSoup
 
+from app.services.tokenizer import get_tokenizer
+
+_HEADER_RE = re.compile(r'^(#{1,6})\s+(.+)$')
+
+# Whitespace as defined by str.isspace(): the ASCII characters are found
+# with str.rfind, the rare Unicode ones with a regex (\s == str.isspace())
+_ASCII_SPACES = " \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f"
+_OTHER_SPACE_RE = re.compile(r'[^\S\t\n\r\x0b\x0c\x1c-\x1f ]')
+_LAST_SPACE_RE = re.compile(r'\s(?=\S*\Z)')
+
+
+def _last_space(text: str, start: int, end: int) -> int:
+    """Index of the last whitespace character in text[start:end], or -1."""
+    pos = max(text.rfind(space, start, end) for space in _ASCII_SPACES)
+    if _OTHER_SPACE_RE.search(text, max(pos + 1, start), end):
+        return _LAST_SPACE_RE.search(text, start, end).start()
+    return pos
+
+
+def _split_lines(lines: Iterable[str]) -> Iterator[str]:
+    """Yield the lines of a text file incrementally, exactly as content.split('\\n') would."""
+    line = ""
+    for line in lines:
+        yield line[:-1] if line.endswith("\n") else line
+    if not line or line.endswith("\n"):
+        yield ""
+
 
 class DocumentChunk:
     """Represents a processed document chunk."""
@@ -53,56 +81,93 @@ class MarkdownDocumentProcessor:
     - Metadata extraction
     - Citation tracking
     - Overlap handling for context continuity
+    
+    chunk_size and chunk_overlap are in characters, or in BPE tokens when
+    chunk_unit="tokens" (min_chunk_size is always in characters). Token
+    chunks include the section title prefix in their budget and record
+    their token span within the section.
     """
     
+    CHUNK_UNITS = ("chars", "tokens")
+    
     def __init__(
         self,
         chunk_size: int = 1000,
         chunk_overlap: int = 200,
-        min_chunk_size: int = 100
+        min_chunk_size: int = 100,
+        chunk_unit: str = "chars",
+        encoding_name: str = "cl100k_base",
+        tokenizer=None
     ):
+        if chunk_unit not in self.CHUNK_UNITS:
+            raise ValueError(f"Unknown chunk unit: {chunk_unit}")
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
         self.min_chunk_size = min_chunk_size
+        self.chunk_unit = chunk_unit
+        self.tokenizer = None
+        if chunk_unit == "tokens":
+            self.tokenizer = tokenizer or get_tokenizer(encoding_name, exact=True)
+    
+    @property
+    def chunking(self) -> str:
+        """Signature of the chunking settings, stored with each chunk."""
+        if self.chunk_unit == "tokens":
+            return f"tokens:{self.tokenizer.encoding_name}:{self.chunk_size}:{self.chunk_overlap}"
+        return f"chars:{self.chunk_size}:{self.chunk_overlap}"
     
     def load_document(self, file_path: str) -> str:
         """Load markdown document from file."""
         with open(file_path, 'r', encoding='utf-8') as f:
             return f.read()
     
-    def extract_sections(self, content: str) -> List[Dict[str, str]]:
+    def extract_sections(self, content: str) -> List[Dict[str, Any]]:
         """
         Extract sections from markdown based on headers.
-        Returns list of {title, content, level} dicts.
+        Returns list of {title, content, level, hash} dicts.
         """
-        sections = []
-        current_section = {"title": "Introduction", "content": "", "level": 0}
+        return list(self.iter_sections(content.split('\n')))
+    
+    def iter_sections(self, lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+        """
+        Yield non-empty sections from lines (without trailing newlines) as
+        each one ends. Only the current section is held in memory, and its
+        lines are joined once rather than concatenated line by line.
+        """
+        title, level = "Introduction", 0
+        parts: List[str] = []
         
-        lines = content.split('\n')
         for line in lines:
             # Check for markdown headers
-            header_match = re.match(r'^(#{1,6})\s+(.+)$', line)
+            header_match = _HEADER_RE.match(line) if line.startswith("#") else None
             if header_match:
-                # Save previous section if it has content
-                if current_section["content"].strip():
-                    sections.append(current_section)
+                section = self._make_section(title, level, parts)
+                if section:
+                    yield section
                 
                 # Start new section
                 level = len(header_match.group(1))
                 title = header_match.group(2).strip()
-                current_section = {
-                    "title": title,
-                    "content": "",
-                    "level": level
-                }
+                parts = []
             else:
-                current_section["content"] += line + '\n'
-        
-        # Add final section
-        if current_section["content"].strip():
-            sections.append(current_section)
+                parts.append(line)
         
-        return sections
+        section = self._make_section(title, level, parts)
+        if section:
+            yield section
+    
+    @staticmethod
+    def _make_section(title: str, level: int, parts: List[str]) -> Optional[Dict[str, Any]]:
+        """Build a section dict, or None if it has no content."""
+        if not parts:
+            return None
+        parts.append("")
+        content = "\n".join(parts)
+        if not content.strip():
+            return None
+        section = {"title": title, "content": content, "level": level}
+        section["hash"] = section_hash(section)
+        return section
     
     def chunk_text(
         self,
@@ -111,29 +176,44 @@ class MarkdownDocumentProcessor:
     ) -> List[str]:
         """
         Split text into chunks with overlap.
-        Uses character-based chunking with word boundaries.
+        Uses character- or token-based chunking with word boundaries.
+        """
+        return list(self.iter_chunks(text, section_title))
+    
+    def iter_chunks(
+        self,
+        text: str,
+        section_title: Optional[str] = None
+    ) -> Iterator[str]:
+        """
+        Yield chunks of text, each ending at the last whitespace within
+        chunk_size characters of its start (or exactly chunk_size in when
+        there is none), with chunk_overlap characters carried over.
+        Each boundary is found with a bounded search of one window, so the
+        whole pass is linear in len(text).
         """
-        if len(text) <= self.chunk_size:
-            return [text]
+        if self.chunk_unit == "tokens":
+            for chunk, _ in self.iter_token_chunks(text, section_title):
+                yield chunk
+            return
         
-        chunks = []
-        start = 0
+        length = len(text)
+        if length <= self.chunk_size:
+            yield text
+            return
         
-        while start < len(text):
-            # Calculate end position
+        start = 0
+        while start < length:
             end = start + self.chunk_size
             
             # If this is not the last chunk, find word boundary
-            if end < len(text):
-                # Look backwards for a word boundary
-                while end > start and not text[end].isspace():
-                    end -= 1
-                
+            if end < length:
+                boundary = _last_space(text, start + 1, end + 1)
                 # If we couldn't find a space, just cut at chunk_size
-                if end == start:
-                    end = start + self.chunk_size
+                if boundary != -1:
+                    end = boundary
             else:
-                end = len(text)
+                end = length
             
             chunk = text[start:end].strip()
             
@@ -142,70 +222,153 @@ class MarkdownDocumentProcessor:
                 # Prepend section title for context
                 if section_title:
                     chunk = f"# {section_title}\n\n{chunk}"
-                chunks.append(chunk)
+                yield chunk
             
-            # Move start position with overlap
-            start = end - self.chunk_overlap if end < len(text) else end
-        
-        return chunks
+            if end >= length:
+                break
+            # Move start position with overlap; a boundary closer to start
+            # than the overlap would otherwise repeat the same window forever
+            next_start = end - self.chunk_overlap
+            start = next_start if next_start > start else end
     
-    def process_document(
+    def iter_token_chunks(
         self,
-        file_path: str
-    ) -> Tuple[List[DocumentChunk], Dict[str, Any]]:
+        text: str,
+        section_title: Optional[str] = None
+    ) -> Iterator[Tuple[str, Tuple[int, int]]]:
         """
-        Process a markdown document into chunks.
-        
-        Returns:
-            Tuple of (chunks, metadata)
+        Yield (chunk, (token_start, token_end)) for windows of at most
+        chunk_size tokens, title prefix included. A window ends before its
+        last token that starts with whitespace, so words are not split.
         """
-        # Load document
-        content = self.load_document(file_path)
-        file_name = Path(file_path).name
+        tokenizer = self.tokenizer
+        prefix = f"# {section_title}\n\n" if section_title else ""
+        budget = max(1, self.chunk_size - tokenizer.count_tokens(prefix))
         
-        # Extract sections
-        sections = self.extract_sections(content)
-        
-        # Process each section into chunks
-        all_chunks = []
-        chunk_index = 0
+        tokens = tokenizer.encode(text)
+        pieces = tokenizer.token_bytes(tokens)
+        offsets = list(itertools.accumulate((len(piece) for piece in pieces), initial=0))
+        data = text.encode("utf-8")
         
-        for section in sections:
-            section_content = section["content"]
-            section_title = section["title"]
-            
-            # Skip empty sections
-            if not section_content.strip():
-                continue
+        length = len(tokens)
+        start = 0
+        while start < length:
+            end = min(start + budget, length)
+            if end < length:
+                for boundary in range(end, start, -1):
+                    if pieces[boundary][:1].isspace():
+                        end = boundary
+                        break
             
-            # Chunk the section
-            text_chunks = self.chunk_text(section_content, section_title)
+            # A cut inside a multi-byte character drops the partial bytes
+            chunk = data[offsets[start]:offsets[end]].decode("utf-8", errors="ignore").strip()
+            if len(chunk) >= self.min_chunk_size:
+                chunk = prefix + chunk
+                # Re-encoding can merge across the prefix boundary differently
+                if tokenizer.count_tokens(chunk) > self.chunk_size:
+                    chunk = tokenizer.truncate(chunk, self.chunk_size)
+                yield chunk, (start, end)
             
-            for text_chunk in text_chunks:
-                doc_chunk = DocumentChunk(
-                    content=text_chunk,
-                    source_document=file_name,
-                    chunk_index=chunk_index,
-                    section_title=section_title,
-                    metadata={
-                        "section_level": section["level"],
-                        "file_path": file_path
-                    }
-                )
-                all_chunks.append(doc_chunk)
+            if end >= length:
+                break
+            next_start = end - self.chunk_overlap
+            start = next_start if next_start > start else end
+    
+    def chunk_section(
+        self,
+        section: Dict[str, Any],
+        file_path: str,
+        start_index: int = 0
+    ) -> List[DocumentChunk]:
+        """
+        Chunk one section, numbering chunks from start_index.
+        Chunk metadata records the section hash for incremental re-ingestion.
+        """
+        return list(self.iter_section_chunks(section, file_path, start_index))
+    
+    def iter_section_chunks(
+        self,
+        section: Dict[str, Any],
+        file_path: str,
+        start_index: int = 0
+    ) -> Iterator[DocumentChunk]:
+        section_title = section["title"]
+        source_document = Path(file_path).name
+        if self.chunk_unit == "tokens":
+            pieces = self.iter_token_chunks(section["content"], section_title)
+        else:
+            pieces = ((chunk, None) for chunk in self.iter_chunks(section["content"], section_title))
+        
+        for i, (text_chunk, token_span) in enumerate(pieces):
+            metadata = {
+                "section_level": section["level"],
+                "section_hash": section["hash"],
+                "chunking": self.chunking,
+                "file_path": file_path
+            }
+            if token_span:
+                metadata["token_start"], metadata["token_end"] = token_span
+            yield DocumentChunk(
+                content=text_chunk,
+                source_document=source_document,
+                chunk_index=start_index + i,
+                section_title=section_title,
+                metadata=metadata
+            )
+    
+    def read_sections(self, file_path: str) -> Iterator[Dict[str, Any]]:
+        """Stream sections from a file, reading it line by line."""
+        with open(file_path, 'r', encoding='utf-8') as f:
+            yield from self.iter_sections(_split_lines(f))
+    
+    def iter_document_chunks(self, file_path: str) -> Iterator[DocumentChunk]:
+        """
+        Stream a document's chunks. Memory is bounded by the largest
+        section rather than the file size.
+        """
+        chunk_index = 0
+        for section in self.read_sections(file_path):
+            for chunk in self.iter_section_chunks(section, file_path, chunk_index):
+                yield chunk
                 chunk_index += 1
+    
+    def load_sections(self, file_path: str) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Load a document and split it into sections without chunking.
+        
+        Returns:
+            Tuple of (sections, metadata)
+        """
+        sections = list(self.read_sections(file_path))
         
-        # Generate document metadata
         file_stats = Path(file_path).stat()
         metadata = {
             "file_path": file_path,
-            "file_name": file_name,
+            "file_name": Path(file_path).name,
             "file_size": file_stats.st_size,
-            "total_chunks": len(all_chunks),
             "total_sections": len(sections),
             "file_hash": self._hash_file(file_path)
         }
+        return sections, metadata
+    
+    def process_document(
+        self,
+        file_path: str
+    ) -> Tuple[List[DocumentChunk], Dict[str, Any]]:
+        """
+        Process a markdown document into chunks.
+        
+        Returns:
+            Tuple of (chunks, metadata)
+        """
+        sections, metadata = self.load_sections(file_path)
+        
+        # Process each section into chunks
+        all_chunks = []
+        for section in sections:
+            all_chunks.extend(self.iter_section_chunks(section, file_path, len(all_chunks)))
         
+        metadata["total_chunks"] = len(all_chunks)
         return all_chunks, metadata
     
     def _hash_file(self, file_path: str) -> str:
@@ -258,11 +421,47 @@ class MarkdownDocumentProcessor:
         return citations
 
 
+def chunk_document_file(
+    file_path: str,
+    chunk_size: int = 1000,
+    chunk_overlap: int = 200,
+    skip_if_hash: Optional[str] = None,
+    chunk_unit: str = "chars",
+    encoding_name: str = "cl100k_base"
+) -> Optional[Tuple[List[Dict[str, Any]], List[List[DocumentChunk]], Dict[str, Any]]]:
+    """
+    Load, section and chunk one file. Module-level so it can run in a process pool.
+    
+    Returns (sections, chunks per section, metadata), or None when the file
+    hash equals skip_if_hash. Chunks are numbered from 0 within each section.
+    """
+    processor = MarkdownDocumentProcessor(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        chunk_unit=chunk_unit,
+        encoding_name=encoding_name
+    )
+    if skip_if_hash and processor._hash_file(file_path) == skip_if_hash:
+        return None
+    sections, metadata = processor.load_sections(file_path)
+    section_chunks = [
+        processor.chunk_section(section, file_path) if section["content"].strip() else []
+        for section in sections
+    ]
+    return sections, section_chunks, metadata
+
+
+def section_hash(section: Dict[str, Any]) -> str:
+    """SHA-256 of a section's level, title and content."""
+    key = f"{section['level']}\x00{section['title']}\x00{section['content']}"
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
 def count_tokens_approximate(text: str) -> int:
     """
     Approximate token count for text.
     Uses rough heuristic of 1 token ≈ 4 characters.
-    For production, use tiktoken library.
+    For exact counts use app.services.tokenizer.
     """
     return len(text) // 4
 
@@ -0,0 +1,244 @@
+"""
+Batching utilities for embedding generation.
+Splits large inputs into provider-sized batches and runs them concurrently
+under a concurrency limit and an in-flight token budget, and micro-batches
+concurrent single-text requests into shared provider calls.
+"""
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import logging
+
+import numpy as np
+
+from app.core.executor import BlockingExecutor, get_executor
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (1 token ≈ 4 characters), used for batch budgeting."""
+    return len(text) // 4 + 1
+
+
+class TokenBudget:
+    """
+    Async counting limiter over estimated tokens.
+    A single request larger than the whole budget is admitted on its own.
+    """
+
+    def __init__(self, max_tokens: int):
+        self.max_tokens = max_tokens
+        self.in_flight = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self, tokens: int) -> None:
+        async with self._condition:
+            await self._condition.wait_for(
+                lambda: self.in_flight == 0 or self.in_flight + tokens <= self.max_tokens
+            )
+            self.in_flight += tokens
+
+    async def release(self, tokens: int) -> None:
+        async with self._condition:
+            self.in_flight -= tokens
+            self._condition.notify_all()
+
+
+class BatchEmbeddingExecutor:
+    """
+    Runs embedding batches concurrently.
+
+    Texts are packed into batches of at most max_batch_size items and
+    max_batch_tokens estimated tokens. Up to max_concurrency batches are in
+    flight at once, further limited by max_inflight_tokens; the limits are
+    shared by all concurrent run() calls on the executor. Blocking SDK calls
+    are moved onto the size-limited "embedding" executor via run_blocking().
+    """
+
+    def __init__(
+        self,
+        max_batch_size: int = 100,
+        max_batch_tokens: int = 100000,
+        max_concurrency: int = 4,
+        max_inflight_tokens: int = 300000,
+        blocking_executor: Optional[BlockingExecutor] = None
+    ):
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_concurrency = max_concurrency
+        self.max_inflight_tokens = max_inflight_tokens
+        self.blocking_executor = blocking_executor
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._budget: Optional[TokenBudget] = None
+
+    def _limits(self) -> Tuple[asyncio.Semaphore, TokenBudget]:
+        """The shared limiters, created on first use in the running loop."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._budget = TokenBudget(self.max_inflight_tokens)
+        return self._semaphore, self._budget
+
+    def plan_batches(self, texts: List[str], max_batch_size: Optional[int] = None) -> List[Tuple[int, int, int]]:
+        """
+        Split texts into contiguous (start, end, tokens) batches honoring the
+        size and token limits.
+        """
+        max_batch_size = max_batch_size or self.max_batch_size
+        batches = []
+        start = 0
+        tokens = 0
+        for i, text in enumerate(texts):
+            text_tokens = estimate_tokens(text)
+            if i > start and (
+                i - start >= max_batch_size or tokens + text_tokens > self.max_batch_tokens
+            ):
+                batches.append((start, i, tokens))
+                start = i
+                tokens = 0
+            tokens += text_tokens
+        if start < len(texts):
+            batches.append((start, len(texts), tokens))
+        return batches
+
+    async def run(
+        self,
+        texts: List[str],
+        embed_batch: Callable[[List[str]], Awaitable[np.ndarray]],
+        dimensions: int,
+        max_batch_size: Optional[int] = None
+    ) -> np.ndarray:
+        """
+        Embed texts by calling embed_batch on each planned batch concurrently.
+        Results are written into a single (n, dimensions) float32 array in
+        input order.
+        """
+        results = np.empty((len(texts), dimensions), dtype=np.float32)
+        batches = self.plan_batches(texts, max_batch_size)
+        if not batches:
+            return results
+        semaphore, budget = self._limits()
+
+        async def run_one(start: int, end: int, tokens: int) -> None:
+            async with semaphore:
+                await budget.acquire(tokens)
+                try:
+                    results[start:end] = await embed_batch(texts[start:end])
+                finally:
+                    await budget.release(tokens)
+
+        if len(batches) == 1:
+            await run_one(*batches[0])
+            return results
+
+        tasks = [asyncio.create_task(run_one(*batch)) for batch in batches]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        return results
+
+    async def run_blocking(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run a blocking call on the executor without stalling the event loop."""
+        executor = self.blocking_executor or get_executor("embedding")
+        return await executor.run(func, *args, **kwargs)
+
+
+class MicroBatcher:
+    """
+    Coalesces single-text embedding requests into provider batches.
+
+    Requests arriving within max_wait_ms of the first pending request are
+    sent together as one embed_batch call (or sooner once max_batch_size
+    requests are pending), and each caller receives its own row.
+    """
+
+    def __init__(
+        self,
+        embed_batch: Callable[[List[str]], Awaitable[np.ndarray]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0
+    ):
+        self.embed_batch = embed_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+
+        self.batches = 0
+        self.items = 0
+        self.provider_calls = 0
+        self.full_flushes = 0
+        self.timeout_flushes = 0
+
+    async def submit(self, text: str) -> np.ndarray:
+        """Queue text for the next batch and wait for its embedding."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self.full_flushes += 1
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait_ms / 1000, self._flush_on_timeout)
+
+        return await future
+
+    def _flush_on_timeout(self) -> None:
+        self._timer = None
+        if self._pending:
+            self.timeout_flushes += 1
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        self.batches += 1
+        self.items += len(batch)
+        task = asyncio.create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        try:
+            embeddings = await self.embed_batch([text for text, _ in batch])
+            self.provider_calls += 1
+            if len(embeddings) != len(batch):
+                raise ValueError(f"Provider returned {len(embeddings)} embeddings for {len(batch)} texts")
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        except BaseException:
+            # Cancelled (e.g. at shutdown): do not leave callers waiting
+            for _, future in batch:
+                future.cancel()
+            raise
+        for (_, future), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(embedding)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return batch counters, including the mean batch fill ratio."""
+        avg_size = self.items / self.batches if self.batches else 0.0
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "batches": self.batches,
+            "items": self.items,
+            "provider_calls": self.provider_calls,
+            "avg_batch_size": round(avg_size, 2),
+            "fill_ratio": round(avg_size / self.max_batch_size, 4) if self.max_batch_size else 0.0,
+            "full_flushes": self.full_flushes,
+            "timeout_flushes": self.timeout_flushes,
+            "pending": len(self._pending),
+        }
@@ -0,0 +1,253 @@
+"""
+Embedding cache for the RAG system.
+Two tiers: a bounded in-process LRU with TTL, optionally backed by a
+persistent SQLite store so popular query embeddings survive restarts.
+"""
+from typing import Any, Dict, Iterable, List, Optional
+from collections import OrderedDict
+from pathlib import Path
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text for cache keying (unicode NFC, collapsed whitespace)."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def make_cache_key(model: str, dimensions: int, text: str) -> str:
+    """Build a cache key from model, dimensions and a normalized-text hash."""
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"{model}:{dimensions}:{digest}"
+
+
+class SQLiteEmbeddingStore:
+    """
+    Persistent embedding tier backed by SQLite.
+    Vectors are stored as raw float32 blobs keyed by make_cache_key(), with
+    the time they were written; lookups and prune() take a max_age.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                dimensions INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def get(self, key: str, max_age: Optional[float] = None) -> Optional[np.ndarray]:
+        """Return the stored vector for key as a read-only float32 array, or None."""
+        entry = self.get_entry(key, max_age)
+        return entry[0] if entry is not None else None
+
+    def get_entry(self, key: str, max_age: Optional[float] = None) -> Optional[tuple]:
+        """
+        Return (vector, age in seconds) for key, or None if it is missing or
+        older than max_age.
+        """
+        now = time.time()
+        min_created = now - max_age if max_age else 0.0
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT dimensions, vector, created_at FROM embeddings "
+                "WHERE key = ? AND created_at >= ?",
+                (key, min_created)
+            ).fetchone()
+        if row is None:
+            return None
+        dimensions, blob, created_at = row
+        return np.frombuffer(blob, dtype=np.float32, count=dimensions), max(0.0, now - created_at)
+
+    def prune(self, max_age: float) -> int:
+        """Delete entries older than max_age seconds; returns how many."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM embeddings WHERE created_at < ?", (time.time() - max_age,)
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def put_many(self, items: Iterable[tuple]) -> None:
+        """Store (key, vector) pairs, replacing existing entries."""
+        now = time.time()
+        rows = []
+        for key, vector in items:
+            array = np.asarray(vector, dtype=np.float32)
+            rows.append((key, int(array.shape[0]), array.tobytes(), now))
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, dimensions, vector, created_at) "
+                "VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class EmbeddingCache:
+    """
+    Size-bounded LRU cache with TTL, in front of an optional persistent store.
+
+    Lookups check the in-process tier first; on a miss the persistent tier is
+    consulted and hits are promoted back into memory for the rest of their
+    TTL. The TTL applies to both tiers: expired rows are never read back from
+    disk and are pruned when the cache is created. Counters are kept for
+    hits, misses, evictions and expirations.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        ttl_seconds: Optional[float] = 86400,
+        persistent_store: Optional[SQLiteEmbeddingStore] = None
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persistent_store = persistent_store
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        if persistent_store is not None and ttl_seconds:
+            try:
+                pruned = persistent_store.prune(ttl_seconds)
+            except sqlite3.Error as e:
+                logger.warning(f"Persistent embedding cache prune failed: {e}")
+            else:
+                if pruned:
+                    logger.info(f"Pruned {pruned} expired entries from the persistent embedding cache")
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Look up a vector, returning None on a miss."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+
+        if self.persistent_store is not None:
+            try:
+                entry = self.persistent_store.get_entry(key, self.ttl_seconds)
+            except sqlite3.Error as e:
+                logger.warning(f"Persistent embedding cache read failed: {e}")
+                entry = None
+            if entry is not None:
+                value, age = entry
+                with self._lock:
+                    self.persistent_hits += 1
+                    self._set_locked(key, value, now - age)
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, value: np.ndarray) -> None:
+        """Store a vector in memory and, if configured, on disk."""
+        self.put_many([(key, value)])
+
+    def put_many(self, items: List[tuple]) -> None:
+        """Store several (key, vector) pairs."""
+        now = time.monotonic()
+        with self._lock:
+            for key, value in items:
+                self._set_locked(key, value, now)
+
+        if self.persistent_store is not None:
+            try:
+                self.persistent_store.put_many(items)
+            except sqlite3.Error as e:
+                logger.warning(f"Persistent embedding cache write failed: {e}")
+
+    def _set_locked(self, key: str, value: np.ndarray, stored_at: float) -> None:
+        expires_at = stored_at + self.ttl_seconds if self.ttl_seconds else None
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        """Clear both tiers."""
+        with self._lock:
+            self._entries.clear()
+        if self.persistent_store is not None:
+            self.persistent_store.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache counters."""
+        lookups = self.hits + self.persistent_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round((self.hits + self.persistent_hits) / lookups, 4) if lookups else 0.0,
+            "persistent_path": self.persistent_store.path if self.persistent_store else None,
+        }
+
+
+def create_embedding_cache(
+    max_entries: int = 10000,
+    ttl_seconds: Optional[float] = 86400,
+    persistent_path: Optional[str] = None
+) -> EmbeddingCache:
+    """Factory for an EmbeddingCache with an optional SQLite tier."""
+    store = SQLiteEmbeddingStore(persistent_path) if persistent_path else None
+    return EmbeddingCache(
+        max_entries=max_entries,
+        ttl_seconds=ttl_seconds,
+        persistent_store=store
+    )
@@ -1,27 +1,44 @@
 """
 Embedding generation service for RAG system.
 Supports multiple embedding providers (OpenAI, Cohere, local models).
+
+Embeddings are carried as contiguous float32 NumPy arrays: a single
+embedding is a 1-D array of shape (dimensions,), a batch is a 2-D array of
+shape (n, dimensions).
 """
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Sequence
 from abc import ABC, abstractmethod
+import asyncio
+import base64
+import time
 import numpy as np
 from openai import AsyncOpenAI
 import logging
 
+from app.core.executor import get_executor
+from app.core.metrics import span
+from app.services.embedding_batching import BatchEmbeddingExecutor, MicroBatcher
+from app.services.embedding_cache import EmbeddingCache, create_embedding_cache, make_cache_key
+
 logger = logging.getLogger(__name__)
 
 
+def as_float32(vectors: Any) -> np.ndarray:
+    """Convert a vector or sequence of vectors to a contiguous float32 array."""
+    return np.ascontiguousarray(vectors, dtype=np.float32)
+
+
 class EmbeddingProvider(ABC):
     """Abstract base class for embedding providers."""
     
     @abstractmethod
-    async def generate_embedding(self, text: str) -> List[float]:
-        """Generate embedding for a single text."""
+    async def generate_embedding(self, text: str) -> np.ndarray:
+        """Generate embedding for a single text (1-D float32 array)."""
         pass
     
     @abstractmethod
-    async def generate_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
-        """Generate embeddings for multiple texts."""
+    async def generate_embeddings_batch(self, texts: List[str]) -> np.ndarray:
+        """Generate embeddings for multiple texts (2-D float32 array)."""
         pass
     
     @property
@@ -30,6 +47,11 @@ class EmbeddingProvider(ABC):
         """Return embedding dimensions."""
         pass
 
+    @property
+    def model_name(self) -> str:
+        """Return model identifier (used for cache keys)."""
+        return getattr(self, "model", type(self).__name__)
+
 
 class OpenAIEmbeddingProvider(EmbeddingProvider):
     """
@@ -41,11 +63,13 @@ class OpenAIEmbeddingProvider(EmbeddingProvider):
         self,
         api_key: str,
         model: str = "text-embedding-3-small",
-        dimensions: int = 1536
+        dimensions: int = 1536,
+        batch_executor: Optional[BatchEmbeddingExecutor] = None
     ):
         self.client = AsyncOpenAI(api_key=api_key)
         self.model = model
         self._dimensions = dimensions
+        self.batch_executor = batch_executor or BatchEmbeddingExecutor()
         
         # Model dimension mapping
         self.model_dimensions = {
@@ -54,42 +78,51 @@ class OpenAIEmbeddingProvider(EmbeddingProvider):
             "text-embedding-ada-002": 1536
         }
     
-    async def generate_embedding(self, text: str) -> List[float]:
+    @staticmethod
+    def _decode(item: Any) -> np.ndarray:
+        """Decode a base64 embedding payload straight into float32."""
+        return np.frombuffer(base64.b64decode(item.embedding), dtype=np.float32)
+    
+    async def generate_embedding(self, text: str) -> np.ndarray:
         """Generate embedding for single text."""
         try:
             response = await self.client.embeddings.create(
                 input=text,
                 model=self.model,
-                dimensions=self._dimensions
+                dimensions=self._dimensions,
+                encoding_format="base64"
             )
-            return response.data[0].embedding
+            return self._decode(response.data[0])
         except Exception as e:
             logger.error(f"Error generating embedding: {e}")
             raise
     
+    async def _embed_batch(self, batch: List[str]) -> np.ndarray:
+        """Embed one provider-sized batch."""
+        embeddings = np.empty((len(batch), self._dimensions), dtype=np.float32)
+        try:
+            response = await self.client.embeddings.create(
+                input=batch,
+                model=self.model,
+                dimensions=self._dimensions,
+                encoding_format="base64"
+            )
+            for item in response.data:
+                embeddings[item.index] = self._decode(item)
+        except Exception as e:
+            logger.error(f"Error generating batch embeddings: {e}")
+            raise
+        return embeddings
+    
     async def generate_embeddings_batch(
         self,
         texts: List[str],
-        batch_size: int = 100
-    ) -> List[List[float]]:
-        """Generate embeddings for multiple texts in batches."""
-        all_embeddings = []
-        
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i + batch_size]
-            try:
-                response = await self.client.embeddings.create(
-                    input=batch,
-                    model=self.model,
-                    dimensions=self._dimensions
-                )
-                embeddings = [item.embedding for item in response.data]
-                all_embeddings.extend(embeddings)
-            except Exception as e:
-                logger.error(f"Error generating batch embeddings: {e}")
-                raise
-        
-        return all_embeddings
+        batch_size: Optional[int] = None
+    ) -> np.ndarray:
+        """Generate embeddings for multiple texts in concurrent batches."""
+        return await self.batch_executor.run(
+            texts, self._embed_batch, self._dimensions, max_batch_size=batch_size
+        )
     
     @property
     def dimensions(self) -> int:
@@ -102,16 +135,25 @@ class CohereEmbeddingProvider(EmbeddingProvider):
     Alternative to OpenAI with competitive quality.
     """
     
-    def __init__(self, api_key: str, model: str = "embed-english-v3.0"):
+    # Cohere accepts at most 96 texts per embed call
+    MAX_BATCH_SIZE = 96
+    
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "embed-english-v3.0",
+        batch_executor: Optional[BatchEmbeddingExecutor] = None
+    ):
         try:
             import cohere
             self.client = cohere.AsyncClient(api_key)
             self.model = model
             self._dimensions = 1024  # Cohere embed-english-v3.0 dimensions
+            self.batch_executor = batch_executor or BatchEmbeddingExecutor()
         except ImportError:
             raise ImportError("Cohere package not installed. Install with: pip install cohere")
     
-    async def generate_embedding(self, text: str) -> List[float]:
+    async def generate_embedding(self, text: str) -> np.ndarray:
         """Generate embedding for single text."""
         try:
             response = await self.client.embed(
@@ -119,24 +161,31 @@ class CohereEmbeddingProvider(EmbeddingProvider):
                 model=self.model,
                 input_type="search_document"
             )
-            return response.embeddings[0]
+            return as_float32(response.embeddings[0])
         except Exception as e:
             logger.error(f"Error generating Cohere embedding: {e}")
             raise
     
-    async def generate_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
-        """Generate embeddings for multiple texts."""
+    async def _embed_batch(self, batch: List[str]) -> np.ndarray:
+        """Embed one provider-sized batch."""
         try:
             response = await self.client.embed(
-                texts=texts,
+                texts=batch,
                 model=self.model,
                 input_type="search_document"
             )
-            return response.embeddings
+            return as_float32(response.embeddings)
         except Exception as e:
             logger.error(f"Error generating Cohere batch embeddings: {e}")
             raise
     
+    async def generate_embeddings_batch(self, texts: List[str]) -> np.ndarray:
+        """Generate embeddings for multiple texts in concurrent batches."""
+        batch_size = min(self.batch_executor.max_batch_size, self.MAX_BATCH_SIZE)
+        return await self.batch_executor.run(
+            texts, self._embed_batch, self._dimensions, max_batch_size=batch_size
+        )
+    
     @property
     def dimensions(self) -> int:
         return self._dimensions
@@ -148,47 +197,60 @@ class GeminiEmbeddingProvider(EmbeddingProvider):
     Uses models/text-embedding-004 (768 dimensions) or models/embedding-001 (768 dimensions).
     """
 
-    def __init__(self, api_key: str, model: str = "models/text-embedding-004"):
+    # batchEmbedContents accepts at most 100 texts per request
+    MAX_BATCH_SIZE = 100
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "models/text-embedding-004",
+        batch_executor: Optional[BatchEmbeddingExecutor] = None
+    ):
         try:
             import google.generativeai as genai
             genai.configure(api_key=api_key)
+            self._genai = genai
             self.model = model
             self._dimensions = 768  # Gemini text-embedding-004 dimensions
+            self.batch_executor = batch_executor or BatchEmbeddingExecutor()
         except ImportError:
             raise ImportError("Google GenerativeAI package not installed. Install with: pip install google-generativeai")
 
-    async def generate_embedding(self, text: str) -> List[float]:
-        """Generate embedding for single text."""
+    async def generate_embedding(self, text: str) -> np.ndarray:
+        """Generate embedding for single text (SDK call runs on the embedding executor)."""
         try:
-            import google.generativeai as genai
-            result = genai.embed_content(
+            result = await self.batch_executor.run_blocking(
+                self._genai.embed_content,
                 model=self.model,
                 content=text,
                 task_type="retrieval_document"
             )
-            return result['embedding']
+            return as_float32(result['embedding'])
         except Exception as e:
             logger.error(f"Error generating Gemini embedding: {e}")
             raise
 
-    async def generate_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
-        """Generate embeddings for multiple texts."""
+    async def _embed_batch(self, batch: List[str]) -> np.ndarray:
+        """Embed one batch with a single batchEmbedContents call off the event loop."""
         try:
-            import google.generativeai as genai
-            # Gemini supports batch embedding
-            embeddings = []
-            for text in texts:
-                result = genai.embed_content(
-                    model=self.model,
-                    content=text,
-                    task_type="retrieval_document"
-                )
-                embeddings.append(result['embedding'])
-            return embeddings
+            result = await self.batch_executor.run_blocking(
+                self._genai.embed_content,
+                model=self.model,
+                content=batch,
+                task_type="retrieval_document"
+            )
+            return as_float32(result['embedding'])
         except Exception as e:
             logger.error(f"Error generating Gemini batch embeddings: {e}")
             raise
 
+    async def generate_embeddings_batch(self, texts: List[str]) -> np.ndarray:
+        """Generate embeddings for multiple texts in concurrent batches."""
+        batch_size = min(self.batch_executor.max_batch_size, self.MAX_BATCH_SIZE)
+        return await self.batch_executor.run(
+            texts, self._embed_batch, self._dimensions, max_batch_size=batch_size
+        )
+
     @property
     def dimensions(self) -> int:
         return self._dimensions
@@ -200,31 +262,45 @@ class LocalEmbeddingProvider(EmbeddingProvider):
     No API costs, runs on local hardware.
     """
     
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+    def __init__(
+        self,
+        model_name: str = "all-MiniLM-L6-v2",
+        batch_executor: Optional[BatchEmbeddingExecutor] = None
+    ):
         try:
             from sentence_transformers import SentenceTransformer
             self.model = SentenceTransformer(model_name)
+            self._model_name = model_name
             self._dimensions = self.model.get_sentence_embedding_dimension()
+            self.batch_executor = batch_executor or BatchEmbeddingExecutor()
         except ImportError:
             raise ImportError(
                 "sentence-transformers not installed. "
                 "Install with: pip install sentence-transformers"
             )
     
-    async def generate_embedding(self, text: str) -> List[float]:
-        """Generate embedding for single text."""
-        embedding = self.model.encode(text, convert_to_numpy=True)
-        return embedding.tolist()
+    async def generate_embedding(self, text: str) -> np.ndarray:
+        """Generate embedding for single text (encoding runs on the embedding executor)."""
+        embedding = await self.batch_executor.run_blocking(
+            self.model.encode, text, convert_to_numpy=True
+        )
+        return as_float32(embedding)
     
-    async def generate_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
-        """Generate embeddings for multiple texts."""
-        embeddings = self.model.encode(texts, convert_to_numpy=True, show_progress_bar=True)
-        return embeddings.tolist()
+    async def generate_embeddings_batch(self, texts: List[str]) -> np.ndarray:
+        """Generate embeddings for multiple texts (encoding runs on the embedding executor)."""
+        embeddings = await self.batch_executor.run_blocking(
+            self.model.encode, texts, convert_to_numpy=True, show_progress_bar=False
+        )
+        return as_float32(embeddings)
     
     @property
     def dimensions(self) -> int:
         return self._dimensions
 
+    @property
+    def model_name(self) -> str:
+        return self._model_name
+
 
 class EmbeddingService:
     """
@@ -235,54 +311,149 @@ class EmbeddingService:
     def __init__(
         self,
         provider: EmbeddingProvider,
-        cache_enabled: bool = False
+        cache_enabled: bool = False,
+        cache: Optional[EmbeddingCache] = None,
+        microbatcher: Optional[MicroBatcher] = None
     ):
         self.provider = provider
-        self.cache_enabled = cache_enabled
-        self._cache: Dict[str, List[float]] = {}
+        # Optional micro-batcher for single-text (query) embeddings
+        self.microbatcher = microbatcher
+        self.cache_enabled = cache_enabled or cache is not None
+        self._cache: Optional[EmbeddingCache] = None
+        if self.cache_enabled:
+            self._cache = cache if cache is not None else create_embedding_cache()
+
+        # In-flight requests keyed by cache key, shared by concurrent callers
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._coalesced = 0
+
+        # Provider latency tracking, used to estimate time saved by the cache
+        self._provider_calls = 0
+        self._provider_texts = 0
+        self._provider_time_ms = 0.0
+    
+    def _cache_key(self, text: str) -> str:
+        return make_cache_key(self.provider.model_name, self.provider.dimensions, text)
+    
+    async def _call_provider(self, texts: List[str]) -> np.ndarray:
+        """Call provider for texts and record latency."""
+        start = time.perf_counter()
+        with span("embedding_provider", texts=len(texts)):
+            if len(texts) == 1 and self.microbatcher is not None:
+                # The micro-batcher counts the shared provider calls it makes
+                embeddings = as_float32(await self.microbatcher.submit(texts[0]))[np.newaxis, :]
+            elif len(texts) == 1:
+                embeddings = as_float32(await self.provider.generate_embedding(texts[0]))[np.newaxis, :]
+                self._provider_calls += 1
+            else:
+                embeddings = as_float32(await self.provider.generate_embeddings_batch(texts))
+                self._provider_calls += 1
+        self._provider_texts += len(texts)
+        self._provider_time_ms += (time.perf_counter() - start) * 1000
+        return embeddings
     
-    async def embed_text(self, text: str) -> List[float]:
+    async def embed_text(self, text: str) -> np.ndarray:
         """Generate embedding with optional caching."""
-        if self.cache_enabled and text in self._cache:
-            return self._cache[text]
-        
-        embedding = await self.provider.generate_embedding(text)
-        
-        if self.cache_enabled:
-            self._cache[text] = embedding
-        
-        return embedding
+        return (await self.embed_texts([text]))[0]
     
-    async def embed_texts(self, texts: List[str]) -> List[List[float]]:
-        """Generate embeddings for multiple texts."""
+    async def embed_texts(self, texts: List[str]) -> np.ndarray:
+        """
+        Generate embeddings for multiple texts as a (n, dimensions) array.
+
+        Texts are looked up in the cache first. Texts already being embedded
+        by a concurrent call share that call's in-flight future instead of
+        triggering a second provider request.
+        """
+        results = np.empty((len(texts), self.dimensions), dtype=np.float32)
+        keys = [self._cache_key(text) for text in texts]
+        uncached: Dict[str, List[int]] = {}
+
         # Check cache for already embedded texts
-        if self.cache_enabled:
-            uncached_texts = []
-            uncached_indices = []
-            results = [None] * len(texts)
-            
-            for i, text in enumerate(texts):
-                if text in self._cache:
-                    results[i] = self._cache[text]
-                else:
-                    uncached_texts.append(text)
-                    uncached_indices.append(i)
-            
-            # Generate embeddings for uncached texts
-            if uncached_texts:
-                new_embeddings = await self.provider.generate_embeddings_batch(uncached_texts)
-                
-                for idx, embedding in zip(uncached_indices, new_embeddings):
-                    results[idx] = embedding
-                    self._cache[texts[idx]] = embedding
-            
-            return results
-        else:
-            return await self.provider.generate_embeddings_batch(texts)
+        for i, key in enumerate(keys):
+            cached = self._cache.get(key) if self._cache is not None else None
+            if cached is not None:
+                results[i] = cached
+            else:
+                uncached.setdefault(key, []).append(i)
+
+        # Split into texts we embed ourselves and texts already in flight
+        owned = [key for key in uncached if key not in self._inflight]
+        waiting = {key: self._inflight[key] for key in uncached if key in self._inflight}
+
+        if owned:
+            loop = asyncio.get_running_loop()
+            futures = {key: loop.create_future() for key in owned}
+            self._inflight.update(futures)
+            try:
+                # Duplicates within this call are embedded once
+                new_embeddings = await self._call_provider(
+                    [texts[uncached[key][0]] for key in owned]
+                )
+            except BaseException as e:
+                for key, future in futures.items():
+                    self._inflight.pop(key, None)
+                    if isinstance(e, Exception):
+                        future.set_exception(e)
+                        future.exception()  # mark retrieved when nobody waits
+                    else:
+                        future.cancel()
+                raise
+
+            cache_items = []
+            for key, embedding in zip(owned, new_embeddings):
+                results[uncached[key]] = embedding
+                # Copy so shared rows don't keep the whole batch buffer alive
+                shared = embedding.copy()
+                shared.flags.writeable = False
+                futures[key].set_result(shared)
+                self._inflight.pop(key, None)
+                cache_items.append((key, shared))
+            if self._cache is not None:
+                self._cache.put_many(cache_items)
+
+        if waiting:
+            self._coalesced += len(waiting)
+            shared_embeddings = await asyncio.gather(*waiting.values())
+            for key, embedding in zip(waiting, shared_embeddings):
+                results[uncached[key]] = embedding
+
+        return results
     
     def clear_cache(self):
         """Clear embedding cache."""
-        self._cache.clear()
+        if self._cache is not None:
+            self._cache.clear()
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """
+        Return cache counters plus an estimate of provider latency saved.
+        The estimate multiplies cache hits by the mean per-text provider latency.
+        """
+        avg_ms = self._provider_time_ms / self._provider_texts if self._provider_texts else 0.0
+        provider_calls = self._provider_calls
+        if self.microbatcher is not None:
+            provider_calls += self.microbatcher.provider_calls
+        stats: Dict[str, Any] = {
+            "enabled": self.cache_enabled,
+            "coalesced_requests": self._coalesced,
+            "in_flight": len(self._inflight),
+            "provider_calls": provider_calls,
+            "provider_texts": self._provider_texts,
+            "avg_provider_latency_ms_per_text": round(avg_ms, 2),
+        }
+        if self._cache is not None:
+            cache_stats = self._cache.stats()
+            stats.update(cache_stats)
+            stats["estimated_time_saved_ms"] = round(
+                (cache_stats["hits"] + cache_stats["persistent_hits"]) * avg_ms, 1
+            )
+        return stats
+    
+    def microbatch_stats(self) -> Dict[str, Any]:
+        """Return micro-batcher counters (batch fill ratio, flush reasons)."""
+        if self.microbatcher is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.microbatcher.stats()}
     
     @property
     def dimensions(self) -> int:
@@ -290,13 +461,13 @@ class EmbeddingService:
         return self.provider.dimensions
 
 
-def cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
+def cosine_similarity(vec1: Sequence[float], vec2: Sequence[float]) -> float:
     """
     Calculate cosine similarity between two vectors.
     Returns value between -1 and 1 (1 = identical, 0 = orthogonal, -1 = opposite).
     """
-    vec1_np = np.array(vec1)
-    vec2_np = np.array(vec2)
+    vec1_np = np.asarray(vec1, dtype=np.float32)
+    vec2_np = np.asarray(vec2, dtype=np.float32)
     
     dot_product = np.dot(vec1_np, vec2_np)
     norm1 = np.linalg.norm(vec1_np)
@@ -321,17 +492,44 @@ def create_embedding_service(
         provider_type: "openai", "cohere", "gemini", or "local"
         api_key: API key for cloud providers
         model: Model name
-        **kwargs: Additional provider-specific arguments
+        **kwargs: Additional provider-specific arguments. Cache options
+            (cache_enabled, cache_max_entries, cache_ttl_seconds, cache_path)
+            and batching options (batch_size, batch_max_tokens,
+            max_concurrent_batches, max_inflight_tokens) and micro-batching
+            options (microbatch_enabled, microbatch_max_size,
+            microbatch_max_wait_ms) and executor options
+            (executor_max_workers, executor_max_queue) are consumed here and
+            not passed to the provider.
 
     Returns:
         Configured EmbeddingService instance
     """
+    cache_enabled = kwargs.pop('cache_enabled', False)
+    cache_max_entries = kwargs.pop('cache_max_entries', 10000)
+    cache_ttl_seconds = kwargs.pop('cache_ttl_seconds', 86400)
+    cache_path = kwargs.pop('cache_path', None)
+    batch_executor = BatchEmbeddingExecutor(
+        max_batch_size=kwargs.pop('batch_size', 100),
+        max_batch_tokens=kwargs.pop('batch_max_tokens', 100000),
+        max_concurrency=kwargs.pop('max_concurrent_batches', 4),
+        max_inflight_tokens=kwargs.pop('max_inflight_tokens', 300000),
+        blocking_executor=get_executor(
+            "embedding",
+            max_workers=kwargs.pop('executor_max_workers', 8),
+            max_queue=kwargs.pop('executor_max_queue', 256)
+        )
+    )
+    microbatch_enabled = kwargs.pop('microbatch_enabled', False)
+    microbatch_max_size = kwargs.pop('microbatch_max_size', 32)
+    microbatch_max_wait_ms = kwargs.pop('microbatch_max_wait_ms', 5.0)
+
     if provider_type == "openai":
         if not api_key:
             raise ValueError("OpenAI API key required")
         provider = OpenAIEmbeddingProvider(
             api_key=api_key,
             model=model or "text-embedding-3-small",
+            batch_executor=batch_executor,
             **kwargs
         )
     elif provider_type == "cohere":
@@ -339,22 +537,42 @@ def create_embedding_service(
             raise ValueError("Cohere API key required")
         provider = CohereEmbeddingProvider(
             api_key=api_key,
-            model=model or "embed-english-v3.0"
+            model=model or "embed-english-v3.0",
+            batch_executor=batch_executor
         )
     elif provider_type == "gemini":
         if not api_key:
             raise ValueError("Gemini API key required")
         provider = GeminiEmbeddingProvider(
             api_key=api_key,
-            model=model or "models/text-embedding-004"
+            model=model or "models/text-embedding-004",
+            batch_executor=batch_executor
         )
     elif provider_type == "local":
         provider = LocalEmbeddingProvider(
-            model_name=model or "all-MiniLM-L6-v2"
+            model_name=model or "all-MiniLM-L6-v2",
+            batch_executor=batch_executor
         )
     else:
         raise ValueError(f"Unknown provider type: {provider_type}")
 
-    # Extract cache_enabled from kwargs if present, filter out provider-specific args
-    cache_enabled = kwargs.get('cache_enabled', False)
-    return EmbeddingService(provider=provider, cache_enabled=cache_enabled)
+    cache = None
+    if cache_enabled:
+        cache = create_embedding_cache(
+            max_entries=cache_max_entries,
+            ttl_seconds=cache_ttl_seconds,
+            persistent_path=cache_path or None
+        )
+    microbatcher = None
+    if microbatch_enabled:
+        microbatcher = MicroBatcher(
+            provider.generate_embeddings_batch,
+            max_batch_size=microbatch_max_size,
+            max_wait_ms=microbatch_max_wait_ms
+        )
+    return EmbeddingService(
+        provider=provider,
+        cache_enabled=cache_enabled,
+        cache=cache,
+        microbatcher=microbatcher
+    )
@@ -0,0 +1,137 @@
+"""
+Batched persistence of chat messages.
+insert_messages() writes any number of messages in one multi-row INSERT.
+MessageWriter optionally moves that write off the request path: handlers
+enqueue rows and a background task flushes them in batches on its own
+session.
+"""
+from typing import Any, Dict, List
+import asyncio
+import logging
+import time
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.conversation import Message
+
+logger = logging.getLogger(__name__)
+
+
+async def insert_messages(db: AsyncSession, rows: List[Dict[str, Any]]) -> List[int]:
+    """Insert message rows in a single statement; returns their ids in order."""
+    if not rows:
+        return []
+    result = await db.execute(
+        insert(Message).returning(Message.id, sort_by_parameter_order=True),
+        rows
+    )
+    return list(result.scalars().all())
+
+
+class MessageWriter:
+    """
+    Write-behind queue for chat messages.
+
+    submit() never waits on the database: rows are queued and written by
+    a background task in batches of up to max_batch rows, or whatever has
+    arrived within flush_interval_ms of the first queued row. When the
+    queue is full submit() returns False and the caller should write
+    inline. Rows still queued at stop() are flushed before it returns.
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        max_batch: int = 100,
+        flush_interval_ms: float = 50.0,
+        max_queue: int = 10000
+    ):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval_ms / 1000
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._task = None
+
+        self.written = 0
+        self.failed = 0
+        self.rejected = 0
+        self.batches = 0
+        self.last_flush_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Flush queued rows and stop the background task."""
+        if not self.running:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def submit(self, rows: List[Dict[str, Any]]) -> bool:
+        """Queue rows for writing; False if the writer is not running or full."""
+        if not self.running:
+            return False
+        try:
+            self._queue.put_nowait(rows)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            batches = [await self._queue.get()]
+            rows = list(batches[0])
+            deadline = time.perf_counter() + self.flush_interval
+            while len(rows) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                batches.append(batch)
+                rows.extend(batch)
+
+            try:
+                await self._flush(rows)
+            finally:
+                for _ in batches:
+                    self._queue.task_done()
+
+    async def _flush(self, rows: List[Dict[str, Any]]) -> None:
+        start = time.perf_counter()
+        try:
+            async with self.session_factory() as db:
+                await insert_messages(db, rows)
+                await db.commit()
+            self.written += len(rows)
+            self.batches += 1
+        except Exception as e:
+            self.failed += len(rows)
+            logger.error(f"Failed to write {len(rows)} chat messages: {e}")
+        self.last_flush_ms = round((time.perf_counter() - start) * 1000, 3)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "queue_depth": self._queue.qsize(),
+            "written": self.written,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "batches": self.batches,
+            "last_flush_ms": self.last_flush_ms,
+        }
@@ -0,0 +1,203 @@
+"""
+Managed pgvector ANN index on document_chunks.embedding.
+Creates, validates and rebuilds an HNSW or IVFFlat index (cosine ops) and
+reports its size and build progress.
+"""
+from typing import Any, Dict, Optional
+from datetime import datetime, timezone
+import asyncio
+import logging
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+VECTOR_INDEX_NAME = "ix_document_chunks_embedding_ann"
+INDEX_TYPES = ("hnsw", "ivfflat", "none")
+
+
+class PgVectorIndexManager:
+    """
+    Keeps the ANN index on document_chunks in line with configuration.
+
+    ensure_index() creates the index when it is missing, and recreates it
+    when it is invalid (e.g. an interrupted concurrent build) or was built
+    with a different type or parameters. Builds use CREATE INDEX
+    CONCURRENTLY so reads and writes continue meanwhile. IVFFlat lists are
+    trained on the rows present at build time, so rebuild after large loads.
+    """
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        index_type: str = "hnsw",
+        hnsw_m: int = 16,
+        hnsw_ef_construction: int = 64,
+        ivfflat_lists: int = 100,
+        maintenance_work_mem: Optional[str] = None
+    ):
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown vector index type: {index_type}")
+        self.engine = engine
+        self.index_type = index_type
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construction = hnsw_ef_construction
+        self.ivfflat_lists = ivfflat_lists
+        self.maintenance_work_mem = maintenance_work_mem
+        self._lock = asyncio.Lock()
+
+        # State of the last build started by this process
+        self.last_build: Dict[str, Any] = {}
+
+    @property
+    def index_options(self) -> Dict[str, int]:
+        if self.index_type == "hnsw":
+            return {"m": self.hnsw_m, "ef_construction": self.hnsw_ef_construction}
+        if self.index_type == "ivfflat":
+            return {"lists": self.ivfflat_lists}
+        return {}
+
+    @property
+    def building(self) -> bool:
+        return self._lock.locked()
+
+    def create_statement(self, name: str = VECTOR_INDEX_NAME) -> str:
+        options = ", ".join(f"{k} = {int(v)}" for k, v in self.index_options.items())
+        return (
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} "
+            f"ON document_chunks USING {self.index_type} (embedding vector_cosine_ops) "
+            f"WITH ({options})"
+        )
+
+    def _matches_config(self, indexdef: str) -> bool:
+        """Check an existing pg_indexes.indexdef against the configured type and options."""
+        if f"USING {self.index_type} " not in indexdef:
+            return False
+        return all(f"{k}='{int(v)}'" in indexdef for k, v in self.index_options.items())
+
+    async def _existing_index(self, conn) -> Optional[Dict[str, Any]]:
+        result = await conn.execute(
+            text("""
+                SELECT i.indexdef, x.indisvalid, x.indisready
+                FROM pg_indexes i
+                JOIN pg_class c ON c.relname = i.indexname
+                JOIN pg_index x ON x.indexrelid = c.oid
+                WHERE i.tablename = 'document_chunks' AND i.indexname = :name
+            """),
+            {"name": VECTOR_INDEX_NAME}
+        )
+        row = result.first()
+        if row is None:
+            return None
+        return {"definition": row.indexdef, "valid": row.indisvalid, "ready": row.indisready}
+
+    async def ensure_index(self, rebuild: bool = False) -> str:
+        """
+        Create or recreate the index as needed.
+        Returns the action taken: "disabled", "unchanged", "created" or "rebuilt".
+        """
+        if self.index_type == "none":
+            return "disabled"
+
+        async with self._lock:
+            # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction
+            async with self.engine.connect() as conn:
+                conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                existing = await self._existing_index(conn)
+
+                if existing and existing["valid"] and not rebuild and self._matches_config(existing["definition"]):
+                    return "unchanged"
+
+                self.last_build = {
+                    "index_type": self.index_type,
+                    "options": self.index_options,
+                    "started_at": datetime.now(timezone.utc).isoformat(),
+                    "finished_at": None,
+                    "duration_seconds": None,
+                    "error": None,
+                }
+                start = time.perf_counter()
+                try:
+                    if self.maintenance_work_mem:
+                        await conn.execute(
+                            text("SELECT set_config('maintenance_work_mem', :value, false)"),
+                            {"value": self.maintenance_work_mem}
+                        )
+                    if existing:
+                        # Build the replacement next to the old index and swap,
+                        # so queries keep using the old one until it is ready
+                        temp_name = f"{VECTOR_INDEX_NAME}_new"
+                        await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {temp_name}"))
+                        statement = self.create_statement(temp_name)
+                        logger.info(f"Rebuilding vector index: {statement}")
+                        await conn.execute(text(statement))
+                        await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {VECTOR_INDEX_NAME}"))
+                        await conn.execute(text(f"ALTER INDEX {temp_name} RENAME TO {VECTOR_INDEX_NAME}"))
+                    else:
+                        statement = self.create_statement()
+                        logger.info(f"Building vector index: {statement}")
+                        await conn.execute(text(statement))
+                except Exception as e:
+                    self.last_build["error"] = str(e)
+                    raise
+                finally:
+                    self.last_build["finished_at"] = datetime.now(timezone.utc).isoformat()
+                    self.last_build["duration_seconds"] = round(time.perf_counter() - start, 3)
+                    if self.maintenance_work_mem and not conn.closed:
+                        await conn.execute(text("RESET maintenance_work_mem"))
+
+        logger.info(f"Vector index ready in {self.last_build['duration_seconds']}s")
+        return "rebuilt" if existing else "created"
+
+    async def status(self) -> Dict[str, Any]:
+        """Report configuration, size, validity and in-progress build state."""
+        async with self.engine.connect() as conn:
+            existing = await self._existing_index(conn)
+
+            size = None
+            if existing:
+                result = await conn.execute(
+                    text("""
+                        SELECT pg_relation_size(CAST(:name AS regclass)) AS bytes,
+                               pg_size_pretty(pg_relation_size(CAST(:name AS regclass))) AS pretty
+                    """),
+                    {"name": VECTOR_INDEX_NAME}
+                )
+                row = result.first()
+                size = {"bytes": row.bytes, "pretty": row.pretty}
+
+            result = await conn.execute(text("""
+                SELECT reltuples::bigint AS estimated_rows,
+                       pg_total_relation_size(oid) AS table_bytes
+                FROM pg_class WHERE relname = 'document_chunks'
+            """))
+            table = result.first()
+
+            result = await conn.execute(text("""
+                SELECT p.phase, p.blocks_done, p.blocks_total,
+                       p.tuples_done, p.tuples_total
+                FROM pg_stat_progress_create_index p
+                JOIN pg_class c ON c.oid = p.relid
+                WHERE c.relname = 'document_chunks'
+            """))
+            progress = [dict(row._mapping) for row in result.fetchall()]
+
+        return {
+            "name": VECTOR_INDEX_NAME,
+            "configured": {"index_type": self.index_type, "options": self.index_options},
+            "exists": existing is not None,
+            "valid": existing["valid"] if existing else False,
+            "ready": existing["ready"] if existing else False,
+            "matches_config": self._matches_config(existing["definition"]) if existing else False,
+            "definition": existing["definition"] if existing else None,
+            "size": size,
+            "table": {
+                "estimated_rows": max(table.estimated_rows, 0) if table else 0,
+                "total_bytes": table.table_bytes if table else 0,
+            },
+            "building": self.building,
+            "build_progress": progress,
+            "last_build": self.last_build or None,
+        }
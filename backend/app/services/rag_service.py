@@ -2,59 +2,59 @@
 RAG (Retrieval Augmented Generation) service.
 Handles query processing, similarity search, and context augmentation.
 """
-from typing import List, Dict, Any, Optional, Tuple
-from sqlalchemy import select, func, text
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator, Awaitable
+from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+import functools
 import logging
+import time
 
 from app.models.document import DocumentChunk
 from app.models.conversation import Conversation, Message
 from app.services.embedding_service import EmbeddingService
+from app.services.retrieval import Retriever, RetrievedContext, PgVectorRetriever, HybridRetriever
+from app.services.response_cache import ResponseCache, CorpusVersion
+from app.services.tokenizer import get_tokenizer
+from app.core.metrics import span
+from app.services.context_assembler import ContextAssembler, AssembledContext, format_source
+from app.services.conversation_memory import ConversationMemory, MemoryState
+from app.services.message_writer import insert_messages
 
 logger = logging.getLogger(__name__)
 
 
-class RetrievedContext:
-    """Represents a retrieved document chunk with similarity score."""
-    
-    def __init__(
-        self,
-        content: str,
-        source_document: str,
-        section_title: Optional[str],
-        similarity_score: float,
-        chunk_id: int,
-        metadata: Optional[Dict[str, Any]] = None
-    ):
-        self.content = content
-        self.source_document = source_document
-        self.section_title = section_title
-        self.similarity_score = similarity_score
-        self.chunk_id = chunk_id
-        self.metadata = metadata or {}
-    
-    def to_dict(self) -> Dict[str, Any]:
-        return {
-            "content": self.content,
-            "source_document": self.source_document,
-            "section_title": self.section_title,
-            "similarity_score": self.similarity_score,
-            "chunk_id": self.chunk_id,
-            "metadata": self.metadata
-        }
-
-
 class RAGService:
     """
     Main RAG service for query processing and response generation.
     
     Pipeline:
     1. Query embedding generation
-    2. Vector similarity search
+    2. Vector similarity search (optionally fused with lexical search)
     3. Context ranking and filtering
     4. LLM response generation with citations
     """
     
+    GEMINI_GENERATION_CONFIG = {
+        "temperature": 0.3,
+        "max_output_tokens": 4096,
+    }
+
+    # Default system prompt for battery research domain
+    DEFAULT_SYSTEM_PROMPT = """You are an expert research assistant specializing in the US battery industry. 
+You provide accurate, well-cited answers based on the research documents provided.
+
+Guidelines:
+- Always cite your sources using [Source X] notation
+- If information is not in the provided context, clearly state that
+- Provide specific numbers, dates, and facts when available
+- Maintain objectivity and accuracy
+- If asked about topics outside the research scope, politely redirect to battery industry topics"""
+
+    SUMMARY_PROMPT = """You maintain a running summary of a conversation between a user and a research assistant about the US battery industry.
+Update the summary with the new messages. Keep the facts, numbers, sources and open questions the user may refer back to; drop greetings and repetition.
+Reply with the updated summary only, in at most a few short paragraphs."""
+
     def __init__(
         self,
         embedding_service: EmbeddingService,
@@ -62,9 +62,34 @@ class RAGService:
         llm_api_key: str = None,
         model: str = None,
         top_k: int = 5,
-        similarity_threshold: float = 0.7
+        similarity_threshold: float = 0.7,
+        retriever: Optional[Retriever] = None,
+        hybrid_retriever: Optional[HybridRetriever] = None,
+        use_hybrid: bool = False,
+        response_cache: Optional[ResponseCache] = None,
+        semantic_cache: bool = False,
+        corpus_version: Optional[CorpusVersion] = None,
+        tokenizer=None,
+        max_context_tokens: Optional[int] = None,
+        context_assembler: Optional[ContextAssembler] = None,
+        conversation_memory: Optional[ConversationMemory] = None,
+        session_factory=None
     ):
         self.embedding_service = embedding_service
+        self.retriever = retriever or PgVectorRetriever()
+        self.hybrid_retriever = hybrid_retriever or HybridRetriever(self.retriever)
+        self.use_hybrid = use_hybrid
+        self.response_cache = response_cache
+        self.semantic_cache = semantic_cache
+        self.corpus_version = corpus_version or CorpusVersion()
+        self.tokenizer = tokenizer or get_tokenizer()
+        self.max_context_tokens = max_context_tokens
+        self.context_assembler = context_assembler or ContextAssembler(
+            self.tokenizer, max_context_tokens=max_context_tokens
+        )
+        self.conversation_memory = conversation_memory or ConversationMemory(self.tokenizer)
+        # Pooled sessions for retrieval running alongside the request session
+        self.session_factory = session_factory
         self.llm_provider = llm_provider
         self.top_k = top_k
         self.similarity_threshold = similarity_threshold
@@ -87,7 +112,8 @@ class RAGService:
         query: str,
         db: AsyncSession,
         top_k: Optional[int] = None,
-        similarity_threshold: Optional[float] = None
+        similarity_threshold: Optional[float] = None,
+        hybrid: Optional[bool] = None
     ) -> List[RetrievedContext]:
         """
         Search for document chunks similar to query using vector similarity.
@@ -97,79 +123,82 @@ class RAGService:
             db: Database session
             top_k: Number of results to return (default: self.top_k)
             similarity_threshold: Minimum similarity score (default: self.similarity_threshold)
+            hybrid: Fuse vector and lexical results (default: self.use_hybrid)
         
         Returns:
-            List of RetrievedContext objects sorted by similarity
+            List of RetrievedContext objects sorted by similarity (or by
+            fusion score in hybrid mode)
         """
         top_k = top_k or self.top_k
         similarity_threshold = similarity_threshold or self.similarity_threshold
+        hybrid = self.use_hybrid if hybrid is None else hybrid
         
-        # Generate query embedding
-        query_embedding = await self.embedding_service.embed_text(query)
-        
-        # Convert to pgvector format
-        embedding_str = '[' + ','.join(map(str, query_embedding)) + ']'
-        
-        # Perform vector similarity search using pgvector
-        # Using cosine distance: 1 - cosine_similarity
-        query_text = text("""
-            SELECT 
-                id,
-                content,
-                source_document,
-                section_title,
-                metadata,
-                chunk_index,
-                1 - (embedding <=> :query_embedding) as similarity
-            FROM document_chunks
-            WHERE 1 - (embedding <=> :query_embedding) > :threshold
-            ORDER BY embedding <=> :query_embedding
-            LIMIT :limit
-        """)
+        if hybrid:
+            with span("hybrid_search"):
+                return await self.hybrid_retriever.search(
+                    query,
+                    embed=self.embedding_service.embed_text,
+                    db=db,
+                    top_k=top_k,
+                    similarity_threshold=similarity_threshold
+                )
         
-        result = await db.execute(
-            query_text,
-            {
-                "query_embedding": embedding_str,
-                "threshold": similarity_threshold,
-                "limit": top_k
-            }
-        )
+        # Generate query embedding
+        with span("query_embedding"):
+            query_embedding = await self.embedding_service.embed_text(query)
         
-        rows = result.fetchall()
-        
-        # Convert to RetrievedContext objects
-        contexts = []
-        for row in rows:
-            context = RetrievedContext(
-                content=row.content,
-                source_document=row.source_document,
-                section_title=row.section_title,
-                similarity_score=float(row.similarity),
-                chunk_id=row.id,
-                chunk_metadata=row.chunk_metadata or {}
+        # Delegate similarity search to the configured retrieval backend
+        with span("vector_search"):
+            return await self.retriever.search(
+                query_embedding,
+                db=db,
+                top_k=top_k,
+                similarity_threshold=similarity_threshold
             )
-            contexts.append(context)
-        
-        return contexts
     
-    def format_context(self, contexts: List[RetrievedContext]) -> str:
+    def format_context(
+        self,
+        contexts: List[RetrievedContext],
+        max_tokens: Optional[int] = None
+    ) -> str:
         """
         Format retrieved contexts into a single string for LLM.
         Includes source citations.
+        
+        With a token limit (default: self.max_context_tokens) sources are
+        added in rank order until the budget is used; the last one that
+        fits partially is cut at the exact token boundary.
         """
         if not contexts:
             return "No relevant context found."
         
+        max_tokens = max_tokens or self.max_context_tokens
+        separator = "\n---\n"
+        count = self.tokenizer.count_tokens
+        separator_tokens = count(separator)
+        
         formatted_parts = []
+        used = 0
         for i, ctx in enumerate(contexts, 1):
-            section_info = f" - {ctx.section_title}" if ctx.section_title else ""
-            source_info = f"[Source {i}: {ctx.source_document}{section_info}]"
-            formatted_parts.append(
-                f"{source_info}\n{ctx.content}\n"
-            )
+            part = format_source(i, ctx)
+            
+            if max_tokens:
+                cost = count(part) + (separator_tokens if formatted_parts else 0)
+                if used + cost > max_tokens:
+                    remaining = max_tokens - used - (separator_tokens if formatted_parts else 0)
+                    # Keep a partial source only if more than its header fits
+                    if remaining > count(part) - count(ctx.content) + 16:
+                        formatted_parts.append(self.tokenizer.truncate(part, remaining))
+                    logger.debug(f"Context trimmed to {max_tokens} tokens ({len(formatted_parts)}/{len(contexts)} sources)")
+                    break
+                used += cost
+            formatted_parts.append(part)
         
-        return "\n---\n".join(formatted_parts)
+        context_text = separator.join(formatted_parts)
+        # Parts can merge into fewer or more tokens once joined; re-check the total
+        if max_tokens and self.tokenizer.exact and count(context_text) > max_tokens:
+            context_text = self.tokenizer.truncate(context_text, max_tokens)
+        return context_text
     
     def generate_citations(self, contexts: List[RetrievedContext]) -> List[Dict[str, Any]]:
         """
@@ -187,39 +216,19 @@ class RAGService:
             citations.append(citation)
         return citations
     
-    async def generate_response(
+    def _build_messages(
         self,
         query: str,
         contexts: List[RetrievedContext],
         conversation_history: Optional[List[Dict[str, str]]] = None,
         system_prompt: Optional[str] = None
-    ) -> Tuple[str, List[Dict[str, Any]]]:
-        """
-        Generate LLM response using retrieved contexts.
-        
-        Args:
-            query: User question
-            contexts: Retrieved document chunks
-            conversation_history: Previous messages in conversation
-            system_prompt: Custom system prompt (optional)
-        
-        Returns:
-            Tuple of (response_text, citations)
-        """
+    ) -> Tuple[str, List[Dict[str, str]]]:
+        """Build the system prompt and chat messages for the LLM call."""
         # Format context for prompt
         context_text = self.format_context(contexts)
         
-        # Default system prompt for battery research domain
         if system_prompt is None:
-            system_prompt = """You are an expert research assistant specializing in the US battery industry. 
-You provide accurate, well-cited answers based on the research documents provided.
-
-Guidelines:
-- Always cite your sources using [Source X] notation
-- If information is not in the provided context, clearly state that
-- Provide specific numbers, dates, and facts when available
-- Maintain objectivity and accuracy
-- If asked about topics outside the research scope, politely redirect to battery industry topics"""
+            system_prompt = self.DEFAULT_SYSTEM_PROMPT
         
         # Build messages
         messages = []
@@ -233,7 +242,16 @@ Guidelines:
                 })
         
         # Add current query with context
-        user_message = f"""Context from research documents:
+        messages.append({
+            "role": "user",
+            "content": self._user_message(query, context_text)
+        })
+
+        return system_prompt, messages
+
+    @staticmethod
+    def _user_message(query: str, context_text: str) -> str:
+        return f"""Context from research documents:
 
 {context_text}
 
@@ -242,54 +260,173 @@ Guidelines:
 Question: {query}
 
 Please provide a detailed answer based on the context above. Always cite sources using [Source X] notation."""
+
+    def assemble_prompt(
+        self,
+        query: str,
+        contexts: List[RetrievedContext],
+        conversation_history: Optional[List[Dict[str, str]]] = None,
+        system_prompt: Optional[str] = None
+    ) -> AssembledContext:
+        """
+        Select the contexts and history that go into the prompt: overlapping
+        chunks merged, near-duplicates dropped, and both packed into the
+        prompt token budget left after the system prompt and question.
+        """
+        count = self.tokenizer.count_tokens
+        fixed_tokens = count(system_prompt or self.DEFAULT_SYSTEM_PROMPT) + count(self._user_message(query, ""))
+        return self.context_assembler.assemble(contexts, conversation_history, fixed_tokens)
+
+    def _gemini_request(
+        self,
+        system_prompt: str,
+        messages: List[Dict[str, str]]
+    ) -> Tuple[Any, List[Dict[str, Any]]]:
+        """Convert messages to a Gemini model and chat history."""
+        gemini_model = self.llm_client.GenerativeModel(
+            model_name=self.model,
+            system_instruction=system_prompt
+        )
+        chat_history = []
+        for msg in messages:
+            role = "user" if msg["role"] == "user" else "model"
+            chat_history.append({"role": role, "parts": [msg["content"]]})
+        return gemini_model, chat_history
+
+    async def generate_response(
+        self,
+        query: str,
+        contexts: List[RetrievedContext],
+        conversation_history: Optional[List[Dict[str, str]]] = None,
+        system_prompt: Optional[str] = None
+    ) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        Generate LLM response using retrieved contexts.
         
-        messages.append({
-            "role": "user",
-            "content": user_message
-        })
+        Args:
+            query: User question
+            contexts: Retrieved document chunks
+            conversation_history: Previous messages in conversation
+            system_prompt: Custom system prompt (optional)
+        
+        Returns:
+            Tuple of (response_text, citations)
+        """
+        system_prompt, messages = self._build_messages(
+            query, contexts, conversation_history, system_prompt
+        )
+
+        try:
+            response_text = await self._complete(system_prompt, messages)
+
+            # Generate citations
+            citations = self.generate_citations(contexts)
+
+            return response_text, citations
+
+        except Exception as e:
+            logger.error(f"Error generating response with {self.llm_provider}: {e}")
+            raise
+
+    async def _complete(
+        self,
+        system_prompt: str,
+        messages: List[Dict[str, str]],
+        max_tokens: int = 4096
+    ) -> str:
+        """Call the LLM API based on provider and return the response text."""
+        if self.llm_provider == "anthropic":
+            response = await self.llm_client.messages.create(
+                model=self.model,
+                max_tokens=max_tokens,
+                system=system_prompt,
+                messages=messages,
+                temperature=0.3  # Lower temperature for more factual responses
+            )
+            return response.content[0].text
+
+        gemini_model, chat_history = self._gemini_request(system_prompt, messages)
+
+        # Generate response with the SDK's async client so a slow
+        # generation does not block the event loop
+        response = await gemini_model.generate_content_async(
+            chat_history,
+            generation_config={**self.GEMINI_GENERATION_CONFIG, "max_output_tokens": max_tokens}
+        )
+        return response.text
+
+    async def summarize_conversation(
+        self,
+        previous_summary: Optional[str],
+        messages: List[Dict[str, str]]
+    ) -> str:
+        """Fold messages into the running conversation summary."""
+        transcript = "\n\n".join(f"{msg['role'].capitalize()}: {msg['content']}" for msg in messages)
+        prompt = (
+            f"Current summary:\n{previous_summary or '(none)'}\n\n"
+            f"New messages:\n{transcript}"
+        )
+        return await self._complete(
+            self.SUMMARY_PROMPT,
+            [{"role": "user", "content": prompt}],
+            max_tokens=1024
+        )
+
+    def _system_prompt(self, system_prompt: Optional[str], summary: Optional[str]) -> str:
+        """System prompt with the conversation summary appended."""
+        system_prompt = system_prompt or self.DEFAULT_SYSTEM_PROMPT
+        if summary:
+            system_prompt += f"\n\nSummary of the earlier conversation:\n{summary}"
+        return system_prompt
+
+    async def generate_response_stream(
+        self,
+        query: str,
+        contexts: List[RetrievedContext],
+        conversation_history: Optional[List[Dict[str, str]]] = None,
+        system_prompt: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Streaming variant of generate_response().
+        Yields text deltas as the LLM produces them.
+        """
+        system_prompt, messages = self._build_messages(
+            query, contexts, conversation_history, system_prompt
+        )
 
-        # Call LLM API based on provider
         try:
             if self.llm_provider == "anthropic":
-                response = await self.llm_client.messages.create(
+                stream = await self.llm_client.messages.create(
                     model=self.model,
                     max_tokens=4096,
                     system=system_prompt,
                     messages=messages,
-                    temperature=0.3  # Lower temperature for more factual responses
+                    temperature=0.3,
+                    stream=True
                 )
-                response_text = response.content[0].text
+                async for event in stream:
+                    if event.type == "content_block_delta" and getattr(event.delta, "text", None):
+                        yield event.delta.text
 
             elif self.llm_provider == "gemini":
-                # Convert messages to Gemini format
-                gemini_model = self.llm_client.GenerativeModel(
-                    model_name=self.model,
-                    system_instruction=system_prompt
-                )
-
-                # Build conversation history
-                chat_history = []
-                for msg in messages:
-                    role = "user" if msg["role"] == "user" else "model"
-                    chat_history.append({"role": role, "parts": [msg["content"]]})
-
-                # Generate response
-                response = gemini_model.generate_content(
+                gemini_model, chat_history = self._gemini_request(system_prompt, messages)
+                response = await gemini_model.generate_content_async(
                     chat_history,
-                    generation_config={
-                        "temperature": 0.3,
-                        "max_output_tokens": 4096,
-                    }
+                    generation_config=self.GEMINI_GENERATION_CONFIG,
+                    stream=True
                 )
-                response_text = response.text
-
-            # Generate citations
-            citations = self.generate_citations(contexts)
-
-            return response_text, citations
+                async for chunk in response:
+                    # chunk.text raises if the chunk has no text parts
+                    # (e.g. the final chunk carrying only finish metadata)
+                    try:
+                        text_delta = chunk.text
+                    except ValueError:
+                        continue
+                    if text_delta:
+                        yield text_delta
 
         except Exception as e:
-            logger.error(f"Error generating response with {self.llm_provider}: {e}")
+            logger.error(f"Error streaming response with {self.llm_provider}: {e}")
             raise
     
     async def query(
@@ -297,6 +434,7 @@ Please provide a detailed answer based on the context above. Always cite sources
         query: str,
         db: AsyncSession,
         conversation_id: Optional[int] = None,
+        memory: Optional[MemoryState] = None,
         **kwargs
     ) -> Dict[str, Any]:
         """
@@ -306,67 +444,281 @@ Please provide a detailed answer based on the context above. Always cite sources
             query: User question
             db: Database session
             conversation_id: Optional conversation ID for history
+            memory: Conversation memory if the caller already loaded it
             **kwargs: Additional arguments for customization
         
         Returns:
-            Dictionary with response, citations, and metadata
+            Dictionary with response, citations, and metadata. "cached" is
+            True when the answer came from the response cache.
         """
-        # 1. Retrieve similar contexts
-        contexts = await self.search_similar_chunks(
-            query=query,
-            db=db,
-            top_k=kwargs.get('top_k'),
-            similarity_threshold=kwargs.get('similarity_threshold')
+        start = time.perf_counter()
+        timings: Dict[str, float] = {}
+        
+        # 1-3. History, response cache and retrieval, concurrently
+        memory, cache_scope, cached, contexts = await self._prepare(
+            query, db, conversation_id, memory, timings, **kwargs
         )
+        if cached is not None:
+            timings["total"] = self._elapsed_ms(start)
+            return {**cached, "stage_timings_ms": timings}
+        conversation_history = memory.messages
+        system_prompt = self._system_prompt(kwargs.get('system_prompt'), memory.summary)
         
-        # 2. Get conversation history if provided
-        conversation_history = None
-        if conversation_id:
-            conversation_history = await self._get_conversation_history(
-                db, conversation_id
+        # 4. Pack contexts and history into the prompt budget
+        with span("assembly") as assembly:
+            assembled = self.assemble_prompt(
+                query, contexts, conversation_history, system_prompt
             )
+        timings["assembly"] = assembly.ms
         
-        # 3. Generate response
-        response_text, citations = await self.generate_response(
+        # 5. Generate response
+        response_text, citations = await self._timed(timings, "generation", self.generate_response(
             query=query,
-            contexts=contexts,
-            conversation_history=conversation_history,
-            system_prompt=kwargs.get('system_prompt')
-        )
+            contexts=assembled.contexts,
+            conversation_history=assembled.history,
+            system_prompt=system_prompt
+        ))
+        self._maybe_update_summary(conversation_id, memory)
         
-        # 4. Calculate confidence score
+        # 6. Calculate confidence score
         confidence = self._calculate_confidence(contexts)
         
-        return {
+        result = {
             "response": response_text,
             "citations": citations,
-            "source_contexts": [ctx.to_dict() for ctx in contexts],
+            "source_contexts": [ctx.to_dict() for ctx in assembled.contexts],
             "confidence_score": confidence,
             "model": self.model,
-            "retrieved_chunks": len(contexts)
+            "retrieved_chunks": len(contexts),
+            "prompt_context": assembled.stats(),
+            "cached": False
         }
+        
+        if cache_scope is not None:
+            await self._cache_store(cache_scope, query, result, start)
+        
+        timings["total"] = self._elapsed_ms(start)
+        return {**result, "stage_timings_ms": timings}
     
-    async def _get_conversation_history(
+    async def query_stream(
         self,
+        query: str,
         db: AsyncSession,
-        conversation_id: int
-    ) -> List[Dict[str, str]]:
-        """Retrieve conversation history from database."""
-        result = await db.execute(
-            select(Message)
-            .where(Message.conversation_id == conversation_id)
-            .order_by(Message.created_at)
-            .limit(20)  # Last 20 messages
+        conversation_id: Optional[int] = None,
+        memory: Optional[MemoryState] = None,
+        **kwargs
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Streaming variant of query().
+        
+        Yields (event, data) pairs: "citations" once retrieval is done,
+        "token" for each text delta, and finally "done" carrying the same
+        fields query() returns. A cached answer is sent as a single token.
+        """
+        start = time.perf_counter()
+        timings: Dict[str, float] = {}
+        
+        memory, cache_scope, cached, contexts = await self._prepare(
+            query, db, conversation_id, memory, timings, **kwargs
         )
-        messages = result.scalars().all()
+        if cached is not None:
+            timings["total"] = self._elapsed_ms(start)
+            yield "citations", {"citations": cached["citations"], "retrieved_chunks": cached["retrieved_chunks"]}
+            yield "token", {"text": cached["response"]}
+            yield "done", {**cached, "stage_timings_ms": timings}
+            return
+        conversation_history = memory.messages
+        system_prompt = self._system_prompt(kwargs.get('system_prompt'), memory.summary)
         
-        return [
-            {
-                "role": msg.role,
-                "content": msg.content
-            }
-            for msg in messages
-        ]
+        with span("assembly") as assembly:
+            assembled = self.assemble_prompt(
+                query, contexts, conversation_history, system_prompt
+            )
+        timings["assembly"] = assembly.ms
+        citations = self.generate_citations(assembled.contexts)
+        yield "citations", {"citations": citations, "retrieved_chunks": len(contexts)}
+        
+        parts = []
+        generation_start = time.perf_counter()
+        with span("generation") as generation:
+            async for delta in self.generate_response_stream(
+                query=query,
+                contexts=assembled.contexts,
+                conversation_history=assembled.history,
+                system_prompt=system_prompt
+            ):
+                if not parts:
+                    timings["first_token"] = self._elapsed_ms(generation_start)
+                parts.append(delta)
+                yield "token", {"text": delta}
+        timings["generation"] = generation.ms
+        self._maybe_update_summary(conversation_id, memory)
+        
+        result = {
+            "response": "".join(parts),
+            "citations": citations,
+            "source_contexts": [ctx.to_dict() for ctx in assembled.contexts],
+            "confidence_score": self._calculate_confidence(contexts),
+            "model": self.model,
+            "retrieved_chunks": len(contexts),
+            "prompt_context": assembled.stats(),
+            "cached": False
+        }
+        if cache_scope is not None:
+            await self._cache_store(cache_scope, query, result, start)
+        timings["total"] = self._elapsed_ms(start)
+        yield "done", {**result, "stage_timings_ms": timings}
+
+    async def _prepare(
+        self,
+        query: str,
+        db: AsyncSession,
+        conversation_id: Optional[int],
+        memory: Optional[MemoryState],
+        timings: Dict[str, float],
+        **kwargs
+    ) -> Tuple[MemoryState, Optional[Tuple], Optional[Dict[str, Any]], List[RetrievedContext]]:
+        """
+        Run the independent stages before generation as a small DAG:
+        retrieval (query embedding + search) runs on its own pooled session
+        while history and the response cache lookup use db, since one
+        AsyncSession cannot run statements concurrently. Retrieval is
+        cancelled on a cache hit. Without a session factory the stages run
+        one after the other on db.
+
+        Returns (memory, cache_scope, cached, contexts); contexts is empty
+        when cached is set.
+        """
+        search = functools.partial(
+            self.search_similar_chunks,
+            query=query,
+            top_k=kwargs.get('top_k'),
+            similarity_threshold=kwargs.get('similarity_threshold'),
+            hybrid=kwargs.get('hybrid')
+        )
+
+        async def retrieve() -> List[RetrievedContext]:
+            async with self.session_factory() as retrieval_db:
+                return await search(db=retrieval_db)
+
+        retrieval = None
+        if self.session_factory is not None:
+            retrieval = asyncio.create_task(self._timed(timings, "retrieval", retrieve()))
+        try:
+            if memory is None:
+                memory = await self._timed(timings, "history", self._load_memory(db, conversation_id))
+
+            cached = None
+            with span("cache_lookup") as lookup:
+                cache_scope = await self._cache_scope(db, memory.messages, **kwargs)
+                if cache_scope is not None:
+                    cached = await self._cache_lookup(cache_scope, query)
+            if cache_scope is not None:
+                timings["cache_lookup"] = lookup.ms
+        except BaseException:
+            if retrieval is not None:
+                retrieval.cancel()
+            raise
+
+        if cached is not None:
+            if retrieval is not None:
+                retrieval.cancel()
+            return memory, cache_scope, cached, []
+
+        if retrieval is not None:
+            contexts = await retrieval
+        else:
+            contexts = await self._timed(timings, "retrieval", search(db=db))
+        return memory, cache_scope, None, contexts
+
+    @staticmethod
+    def _elapsed_ms(start: float) -> float:
+        return round((time.perf_counter() - start) * 1000, 3)
+
+    async def _timed(self, timings: Dict[str, float], stage: str, awaitable: Awaitable[Any]) -> Any:
+        """Await awaitable in a span and record its duration in timings[stage]."""
+        stage_span = span(stage)
+        try:
+            with stage_span:
+                return await awaitable
+        finally:
+            timings[stage] = stage_span.ms
+
+    async def _cache_scope(
+        self,
+        db: AsyncSession,
+        conversation_history: Optional[List[Dict[str, str]]],
+        **kwargs
+    ) -> Optional[Tuple]:
+        """
+        Return the response cache scope for this query, or None if the
+        answer must not be cached: follow-up questions (the conversation
+        already has an answer), custom system prompts, or use_cache=False.
+        """
+        if self.response_cache is None or not kwargs.get('use_cache', True):
+            return None
+        if kwargs.get('system_prompt'):
+            return None
+        if conversation_history and any(msg["role"] == "assistant" for msg in conversation_history):
+            return None
+        
+        hybrid = kwargs.get('hybrid')
+        return (
+            self.model,
+            kwargs.get('top_k') or self.top_k,
+            kwargs.get('similarity_threshold') or self.similarity_threshold,
+            self.use_hybrid if hybrid is None else hybrid,
+            await self._corpus_version(db)
+        )
+
+    async def _corpus_version(self, db: AsyncSession) -> str:
+        """
+        Current corpus version, read on a short-lived pooled session when
+        there is one so db does not begin a transaction that would stay open
+        through generation.
+        """
+        if self.session_factory is None:
+            return await self.corpus_version.get(db)
+        async with self.session_factory() as version_db:
+            return await self.corpus_version.get(version_db)
+
+    async def _cache_lookup(self, scope: Tuple, query: str) -> Optional[Dict[str, Any]]:
+        """Exact match first, then (if enabled) embedding similarity."""
+        cached = self.response_cache.get(scope, query)
+        match = "exact"
+        if cached is None and self.semantic_cache:
+            # The query embedding is reused by retrieval on a miss via the
+            # embedding cache
+            embedding = await self.embedding_service.embed_text(query)
+            cached = self.response_cache.get_similar(scope, embedding)
+            match = "semantic"
+        if cached is None:
+            self.response_cache.record_miss()
+            return None
+        return {**cached, "cached": True, "cache_match": match}
+
+    async def _cache_store(self, scope: Tuple, query: str, result: Dict[str, Any], start: float) -> None:
+        embedding = None
+        if self.semantic_cache:
+            embedding = await self.embedding_service.embed_text(query)
+        self.response_cache.put(
+            scope,
+            query,
+            result,
+            embedding=embedding,
+            generation_ms=(time.perf_counter() - start) * 1000
+        )
+    
+    async def _load_memory(self, db: AsyncSession, conversation_id: Optional[int]) -> MemoryState:
+        """Conversation summary and recent messages (empty without a conversation)."""
+        if not conversation_id:
+            return MemoryState()
+        return await self.conversation_memory.load(db, conversation_id)
+    
+    def _maybe_update_summary(self, conversation_id: Optional[int], memory: MemoryState) -> None:
+        """Fold old messages into the summary in the background once enough piled up."""
+        if conversation_id and memory.needs_summary:
+            self.conversation_memory.schedule_update(conversation_id, self.summarize_conversation)
     
     def _calculate_confidence(self, contexts: List[RetrievedContext]) -> float:
         """
@@ -429,6 +781,15 @@ class ConversationManager:
         await db.flush()
         return message
     
+    async def add_messages(
+        self,
+        db: AsyncSession,
+        messages: List[Dict[str, Any]]
+    ) -> List[int]:
+        """Add several messages in one INSERT; returns their IDs in order."""
+        with span("db_persist", messages=len(messages)):
+            return await insert_messages(db, messages)
+    
     async def get_conversation(
         self,
         db: AsyncSession,
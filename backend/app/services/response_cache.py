@@ -0,0 +1,220 @@
+"""
+Response cache for the RAG system.
+Stores answered queries (response, citations, sources) so repeated and
+near-duplicate questions skip retrieval and LLM generation. Entries are
+scoped by model, retrieval parameters and corpus version, so re-ingesting
+documents invalidates them automatically.
+"""
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+from collections import OrderedDict
+import hashlib
+import threading
+import time
+import logging
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.services.embedding_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a question for exact matching (case, whitespace, trailing punctuation)."""
+    return normalize_text(query).casefold().rstrip(" ?!.")
+
+
+class CorpusVersion:
+    """
+    Hash of the ingested document set, refreshed at most every ttl_seconds.
+    Changes whenever a document is added, removed or re-ingested.
+    """
+
+    def __init__(self, ttl_seconds: float = 30.0):
+        self.ttl_seconds = ttl_seconds
+        self._version: Optional[str] = None
+        self._checked_at = 0.0
+
+    async def get(self, db: AsyncSession) -> str:
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < self.ttl_seconds:
+            return self._version
+
+        result = await db.execute(text("""
+            SELECT count(*) AS documents,
+                   max(updated_at) AS updated_at,
+                   string_agg(file_hash || ':' || processing_status, ',' ORDER BY file_path) AS hashes
+            FROM document_metadata
+        """))
+        row = result.first()
+        fingerprint = f"{row.documents}|{row.updated_at}|{row.hashes or ''}"
+        version = hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()[:16]
+
+        if self._version is not None and version != self._version:
+            logger.info(f"Corpus version changed: {self._version} -> {version}")
+        self._version = version
+        self._checked_at = now
+        return version
+
+    def invalidate(self) -> None:
+        """Force the next get() to re-read the corpus version."""
+        self._version = None
+
+
+class _Entry:
+    __slots__ = ("scope", "embedding", "result", "expires_at", "generation_ms")
+
+    def __init__(self, scope, embedding, result, expires_at, generation_ms):
+        self.scope = scope
+        self.embedding = embedding
+        self.result = result
+        self.expires_at = expires_at
+        self.generation_ms = generation_ms
+
+
+class ResponseCache:
+    """
+    LRU/TTL cache of query results.
+
+    get() matches the normalized query text exactly; get_similar() matches
+    the query embedding against previously answered queries in the same
+    scope by cosine similarity (>= similarity_threshold). The scope is any
+    hashable, e.g. (model, top_k, corpus_version).
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        ttl_seconds: Optional[float] = 3600,
+        similarity_threshold: float = 0.95
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries: "OrderedDict[Tuple[Hashable, str], _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Stacked unit embeddings per scope, rebuilt lazily after changes
+        self._matrices: Dict[Hashable, Tuple[List[Tuple[Hashable, str]], np.ndarray]] = {}
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.time_saved_ms = 0.0
+
+    def get(self, scope: Hashable, query: str) -> Optional[Dict[str, Any]]:
+        """Return the cached result for an exact (normalized) query match."""
+        key = (scope, normalize_query(query))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired_locked(key, entry, now):
+                entry = None
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            self.time_saved_ms += entry.generation_ms
+            return entry.result
+
+    def get_similar(self, scope: Hashable, embedding: np.ndarray) -> Optional[Dict[str, Any]]:
+        """Return the cached result of the most similar query above the threshold."""
+        now = time.monotonic()
+        query = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(query)
+        if not norm:
+            return None
+        with self._lock:
+            keys, matrix = self._matrix_locked(scope)
+            if not keys:
+                return None
+            scores = matrix @ (query / norm)
+            best = int(np.argmax(scores))
+            if scores[best] < self.similarity_threshold:
+                return None
+            key = keys[best]
+            entry = self._entries.get(key)
+            if entry is None or self._expired_locked(key, entry, now):
+                return None
+            self._entries.move_to_end(key)
+            self.semantic_hits += 1
+            self.time_saved_ms += entry.generation_ms
+            return entry.result
+
+    def record_miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def put(
+        self,
+        scope: Hashable,
+        query: str,
+        result: Dict[str, Any],
+        embedding: Optional[np.ndarray] = None,
+        generation_ms: float = 0.0
+    ) -> None:
+        """Store a result; embedding enables semantic matching for this entry."""
+        key = (scope, normalize_query(query))
+        if embedding is not None:
+            embedding = np.asarray(embedding, dtype=np.float32).reshape(-1)
+            norm = np.linalg.norm(embedding)
+            embedding = embedding / norm if norm else None
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            self._entries[key] = _Entry(scope, embedding, result, expires_at, generation_ms)
+            self._entries.move_to_end(key)
+            self._matrices.pop(scope, None)
+            while len(self._entries) > self.max_entries:
+                (old_scope, _), _ = self._entries.popitem(last=False)
+                self._matrices.pop(old_scope, None)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._matrices.clear()
+
+    def _expired_locked(self, key, entry: _Entry, now: float) -> bool:
+        if entry.expires_at is None or entry.expires_at > now:
+            return False
+        del self._entries[key]
+        self._matrices.pop(entry.scope, None)
+        self.expirations += 1
+        return True
+
+    def _matrix_locked(self, scope: Hashable) -> Tuple[List[Tuple[Hashable, str]], np.ndarray]:
+        cached = self._matrices.get(scope)
+        if cached is None:
+            items = [
+                (key, entry.embedding) for key, entry in self._entries.items()
+                if entry.scope == scope and entry.embedding is not None
+            ]
+            keys = [key for key, _ in items]
+            matrix = np.vstack([vector for _, vector in items]) if items else np.empty((0, 0), dtype=np.float32)
+            cached = self._matrices[scope] = (keys, matrix)
+        return cached
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the estimated generation time saved."""
+        hits = self.exact_hits + self.semantic_hits
+        lookups = hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "similarity_threshold": self.similarity_threshold,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "estimated_time_saved_ms": round(self.time_saved_ms, 1),
+        }
@@ -0,0 +1,604 @@
+"""
+Retrieval backends for the RAG system.
+A Retriever turns a query embedding (or query text, for lexical search) into
+ranked document chunks. Two implementations: pgvector with PostgreSQL
+full-text search, and an in-process ANN + BM25 index built from
+document_chunks or loaded from a snapshot file. HybridRetriever fuses vector
+and lexical results with reciprocal rank fusion.
+"""
+from typing import List, Dict, Any, Optional, Callable, Awaitable
+from abc import ABC, abstractmethod
+from pathlib import Path
+import asyncio
+import logging
+
+import numpy as np
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.document import DocumentChunk
+from app.services.text_index import BM25Index, tokenize
+from app.services.vector_index import IVFFlatIndex
+
+logger = logging.getLogger(__name__)
+
+
+class RetrievedContext:
+    """Represents a retrieved document chunk with similarity score."""
+
+    def __init__(
+        self,
+        content: str,
+        source_document: str,
+        section_title: Optional[str],
+        similarity_score: float,
+        chunk_id: int,
+        metadata: Optional[Dict[str, Any]] = None,
+        chunk_index: Optional[int] = None,
+        lexical_score: Optional[float] = None,
+        fusion_score: Optional[float] = None
+    ):
+        self.content = content
+        self.source_document = source_document
+        self.section_title = section_title
+        self.similarity_score = similarity_score
+        self.chunk_id = chunk_id
+        self.metadata = metadata or {}
+        self.chunk_index = chunk_index
+        self.lexical_score = lexical_score
+        self.fusion_score = fusion_score
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "content": self.content,
+            "source_document": self.source_document,
+            "section_title": self.section_title,
+            "similarity_score": self.similarity_score,
+            "chunk_id": self.chunk_id,
+            "chunk_index": self.chunk_index,
+            "lexical_score": self.lexical_score,
+            "fusion_score": self.fusion_score,
+            "metadata": self.metadata
+        }
+
+
+class Retriever(ABC):
+    """Abstract base class for similarity retrieval backends."""
+
+    name: str = "base"
+
+    # Whether lookups need a database session
+    requires_db: bool = True
+
+    async def initialize(self) -> None:
+        """Prepare the backend (load indexes etc.). Called on startup."""
+        pass
+
+    @abstractmethod
+    async def search(
+        self,
+        query_embedding: np.ndarray,
+        db: Optional[AsyncSession],
+        top_k: int,
+        similarity_threshold: float
+    ) -> List[RetrievedContext]:
+        """Return up to top_k chunks above similarity_threshold, best first."""
+        pass
+
+    @abstractmethod
+    async def search_text(
+        self,
+        query: str,
+        db: Optional[AsyncSession],
+        top_k: int
+    ) -> List[RetrievedContext]:
+        """Return up to top_k chunks matching query terms, best first."""
+        pass
+
+    @abstractmethod
+    async def similarities(
+        self,
+        query_embedding: np.ndarray,
+        chunk_ids: List[int],
+        db: Optional[AsyncSession]
+    ) -> Dict[int, float]:
+        """Return the cosine similarity of the query to each given chunk."""
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+
+class PgVectorRetriever(Retriever):
+    """
+    Similarity search with a pgvector query against document_chunks.
+
+    The query is a plain ORDER BY distance LIMIT k so the planner can use
+    the HNSW/IVFFlat index; the similarity threshold is applied to the k
+    results afterwards. ef_search (HNSW) and probes (IVFFlat) are set per
+    query with SET LOCAL.
+    """
+
+    name = "pgvector"
+
+    def __init__(
+        self,
+        index_type: str = "hnsw",
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None
+    ):
+        self.index_type = index_type
+        self.ef_search = ef_search
+        self.probes = probes
+
+    async def _apply_search_settings(self, db: AsyncSession, top_k: int) -> None:
+        # SET LOCAL only lasts until the end of the current transaction
+        if self.index_type == "hnsw" and self.ef_search:
+            # HNSW returns at most ef_search rows, so never go below top_k
+            ef_search = max(int(self.ef_search), top_k)
+            await db.execute(text(f"SET LOCAL hnsw.ef_search = {ef_search}"))
+        elif self.index_type == "ivfflat" and self.probes:
+            await db.execute(text(f"SET LOCAL ivfflat.probes = {int(self.probes)}"))
+
+    async def search(
+        self,
+        query_embedding: np.ndarray,
+        db: Optional[AsyncSession],
+        top_k: int,
+        similarity_threshold: float
+    ) -> List[RetrievedContext]:
+        await self._apply_search_settings(db, top_k)
+
+        # Cosine distance (1 - cosine_similarity), computed once per row. The
+        # query embedding is a float32 array bound via the binary pgvector codec.
+        query_text = text("""
+            SELECT
+                id,
+                content,
+                source_document,
+                section_title,
+                chunk_metadata,
+                chunk_index,
+                embedding <=> :query_embedding AS distance
+            FROM document_chunks
+            ORDER BY distance
+            LIMIT :limit
+        """)
+
+        result = await db.execute(
+            query_text,
+            {
+                "query_embedding": query_embedding,
+                "limit": top_k
+            }
+        )
+
+        contexts = []
+        for row in result.fetchall():
+            similarity = 1 - float(row.distance)
+            if similarity <= similarity_threshold:
+                # Rows are ordered by distance, so the rest are below too
+                break
+            contexts.append(RetrievedContext(
+                content=row.content,
+                source_document=row.source_document,
+                section_title=row.section_title,
+                similarity_score=similarity,
+                chunk_id=row.id,
+                metadata=row.chunk_metadata or {},
+                chunk_index=row.chunk_index
+            ))
+        return contexts
+
+    async def search_text(
+        self,
+        query: str,
+        db: Optional[AsyncSession],
+        top_k: int
+    ) -> List[RetrievedContext]:
+        # Terms are OR-ed so partial matches still rank; ts_rank_cd favours
+        # chunks matching more (and closer) terms. Served by the GIN index on
+        # to_tsvector('english', content).
+        terms = tokenize(query)
+        if not terms:
+            return []
+        query_text = text("""
+            SELECT
+                id,
+                content,
+                source_document,
+                section_title,
+                chunk_metadata,
+                chunk_index,
+                ts_rank_cd(to_tsvector('english', content), tsq) AS rank
+            FROM document_chunks, to_tsquery('english', :tsquery) AS tsq
+            WHERE to_tsvector('english', content) @@ tsq
+            ORDER BY rank DESC
+            LIMIT :limit
+        """)
+
+        result = await db.execute(
+            query_text,
+            {"tsquery": " | ".join(terms), "limit": top_k}
+        )
+
+        return [
+            RetrievedContext(
+                content=row.content,
+                source_document=row.source_document,
+                section_title=row.section_title,
+                similarity_score=0.0,
+                chunk_id=row.id,
+                metadata=row.chunk_metadata or {},
+                chunk_index=row.chunk_index,
+                lexical_score=float(row.rank)
+            )
+            for row in result.fetchall()
+        ]
+
+    async def similarities(
+        self,
+        query_embedding: np.ndarray,
+        chunk_ids: List[int],
+        db: Optional[AsyncSession]
+    ) -> Dict[int, float]:
+        if not chunk_ids:
+            return {}
+        result = await db.execute(
+            text("""
+                SELECT id, 1 - (embedding <=> :query_embedding) AS similarity
+                FROM document_chunks
+                WHERE id = ANY(:ids)
+            """),
+            {"query_embedding": query_embedding, "ids": list(chunk_ids)}
+        )
+        return {row.id: float(row.similarity) for row in result.fetchall()}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "index_type": self.index_type,
+            "ef_search": self.ef_search,
+            "probes": self.probes,
+        }
+
+
+class InMemoryRetriever(Retriever):
+    """
+    Similarity search against an in-process IVF index.
+
+    The index is built from document_chunks at startup (or loaded from a
+    snapshot file when one exists) and answers queries without a database
+    round-trip. Chunk text and citation metadata are kept alongside the
+    vectors, and a BM25 index over the chunk text serves lexical search.
+    nprobe controls recall; add_chunks/remove_chunks and sync_from_db()
+    update the indexes incrementally.
+    """
+
+    name = "memory"
+    requires_db = False
+
+    def __init__(
+        self,
+        dimensions: int,
+        nlist: int = 100,
+        nprobe: int = 8,
+        snapshot_path: Optional[str] = None,
+        session_factory: Optional[Callable[[], AsyncSession]] = None
+    ):
+        self.index = IVFFlatIndex(dimensions=dimensions, nlist=nlist, nprobe=nprobe)
+        self.payloads: Dict[int, Dict[str, Any]] = {}
+        self.text_index = BM25Index()
+        self.snapshot_path = snapshot_path
+        self.session_factory = session_factory
+
+    async def initialize(self) -> None:
+        if self.snapshot_path and Path(self.snapshot_path).exists():
+            self.load_snapshot(self.snapshot_path)
+            return
+        if self.session_factory is None:
+            logger.warning("In-memory retriever has no snapshot and no database; index is empty")
+            return
+        async with self.session_factory() as db:
+            await self.load_from_db(db)
+        if self.snapshot_path:
+            self.save_snapshot(self.snapshot_path)
+
+    @staticmethod
+    def _payload(row: Any) -> Dict[str, Any]:
+        return {
+            "content": row.content,
+            "source_document": row.source_document,
+            "section_title": row.section_title,
+            "chunk_index": row.chunk_index,
+            "metadata": row.chunk_metadata or {},
+        }
+
+    @staticmethod
+    def _chunk_query(ids: Optional[List[int]] = None):
+        query = select(
+            DocumentChunk.id,
+            DocumentChunk.content,
+            DocumentChunk.source_document,
+            DocumentChunk.section_title,
+            DocumentChunk.chunk_index,
+            DocumentChunk.chunk_metadata,
+            DocumentChunk.embedding,
+        )
+        if ids is not None:
+            query = query.where(DocumentChunk.id.in_(ids))
+        return query
+
+    async def load_from_db(self, db: AsyncSession, partition_size: int = 5000) -> None:
+        """Build the index from all rows in document_chunks."""
+        ids: List[int] = []
+        vectors: List[np.ndarray] = []
+        payloads: Dict[int, Dict[str, Any]] = {}
+
+        result = await db.stream(self._chunk_query())
+        async for partition in result.partitions(partition_size):
+            for row in partition:
+                ids.append(row.id)
+                vectors.append(np.asarray(row.embedding, dtype=np.float32))
+                payloads[row.id] = self._payload(row)
+
+        matrix = np.vstack(vectors) if vectors else np.empty((0, self.index.dimensions), dtype=np.float32)
+        self.index.build(ids, matrix)
+        self.payloads = payloads
+        self._rebuild_text_index()
+        logger.info(f"Built in-memory vector index with {len(ids)} chunks")
+
+    async def sync_from_db(self, db: AsyncSession) -> Dict[str, int]:
+        """Incrementally add new chunks and drop deleted ones."""
+        result = await db.execute(select(DocumentChunk.id))
+        db_ids = set(result.scalars().all())
+        known_ids = set(self.payloads)
+
+        removed = self.remove_chunks(known_ids - db_ids)
+        new_ids = list(db_ids - known_ids)
+        added = 0
+        if new_ids:
+            rows = (await db.execute(self._chunk_query(new_ids))).fetchall()
+            self.add_chunks(rows)
+            added = len(rows)
+        return {"added": added, "removed": removed}
+
+    def add_chunks(self, rows: List[Any]) -> None:
+        """Add rows exposing id, content, ..., embedding attributes."""
+        if not rows:
+            return
+        self.index.add(
+            [row.id for row in rows],
+            np.vstack([np.asarray(row.embedding, dtype=np.float32) for row in rows])
+        )
+        for row in rows:
+            self.payloads[row.id] = self._payload(row)
+            self.text_index.add(row.id, row.content)
+
+    def remove_chunks(self, ids: Any) -> int:
+        ids = list(ids)
+        for id_ in ids:
+            self.payloads.pop(id_, None)
+            self.text_index.remove(id_)
+        return self.index.remove(ids)
+
+    def _rebuild_text_index(self) -> None:
+        self.text_index.clear()
+        for chunk_id, payload in self.payloads.items():
+            self.text_index.add(chunk_id, payload["content"])
+
+    def load_snapshot(self, path: str) -> None:
+        self.index, self.payloads = IVFFlatIndex.load(path, nprobe=self.index.nprobe)
+        self._rebuild_text_index()
+        logger.info(f"Loaded in-memory vector index snapshot with {len(self.index)} chunks from {path}")
+
+    def save_snapshot(self, path: Optional[str] = None) -> None:
+        path = path or self.snapshot_path
+        self.index.save(path, self.payloads)
+        logger.info(f"Saved in-memory vector index snapshot to {path}")
+
+    async def search(
+        self,
+        query_embedding: np.ndarray,
+        db: Optional[AsyncSession],
+        top_k: int,
+        similarity_threshold: float
+    ) -> List[RetrievedContext]:
+        contexts = []
+        for chunk_id, score in self.index.search(query_embedding, top_k):
+            if score <= similarity_threshold:
+                break
+            contexts.append(self._context(chunk_id, similarity_score=score))
+        return contexts
+
+    async def search_text(
+        self,
+        query: str,
+        db: Optional[AsyncSession],
+        top_k: int
+    ) -> List[RetrievedContext]:
+        return [
+            self._context(chunk_id, similarity_score=0.0, lexical_score=score)
+            for chunk_id, score in self.text_index.search(query, top_k)
+        ]
+
+    async def similarities(
+        self,
+        query_embedding: np.ndarray,
+        chunk_ids: List[int],
+        db: Optional[AsyncSession]
+    ) -> Dict[int, float]:
+        vectors = self.index.get_vectors(chunk_ids)
+        if not vectors:
+            return {}
+        query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(query) or 1.0
+        return {chunk_id: float(vector @ query / norm) for chunk_id, vector in vectors.items()}
+
+    def _context(self, chunk_id: int, **scores: float) -> RetrievedContext:
+        payload = self.payloads[chunk_id]
+        return RetrievedContext(
+            content=payload["content"],
+            source_document=payload["source_document"],
+            section_title=payload["section_title"],
+            chunk_id=chunk_id,
+            metadata=payload["metadata"],
+            chunk_index=payload["chunk_index"],
+            **scores
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "chunks": len(self.index),
+            "text_index_terms": self.text_index.vocabulary_size,
+            "trained": self.index.is_trained,
+            "nlist": len(self.index.centroids) if self.index.is_trained else 0,
+            "nprobe": self.index.nprobe,
+            "snapshot_path": self.snapshot_path,
+        }
+
+
+def reciprocal_rank_fusion(
+    result_lists: List[List[RetrievedContext]],
+    k: int = 60,
+    weights: Optional[List[float]] = None
+) -> List[RetrievedContext]:
+    """
+    Merge ranked result lists with reciprocal rank fusion.
+
+    Each chunk scores sum(weight / (k + rank)) over the lists it appears in
+    (rank starting at 1). Scores from the individual lists are merged onto
+    one RetrievedContext per chunk, ordered by fusion_score.
+    """
+    weights = weights or [1.0] * len(result_lists)
+    fused: Dict[int, RetrievedContext] = {}
+    for results, weight in zip(result_lists, weights):
+        for rank, ctx in enumerate(results, 1):
+            existing = fused.get(ctx.chunk_id)
+            if existing is None:
+                existing = fused[ctx.chunk_id] = ctx
+                existing.fusion_score = 0.0
+            else:
+                existing.similarity_score = max(existing.similarity_score, ctx.similarity_score)
+                if ctx.lexical_score is not None:
+                    existing.lexical_score = ctx.lexical_score
+            existing.fusion_score += weight / (k + rank)
+    return sorted(fused.values(), key=lambda ctx: ctx.fusion_score, reverse=True)
+
+
+class HybridRetriever:
+    """
+    Vector + lexical retrieval merged with reciprocal rank fusion.
+
+    The lexical lookup runs concurrently with query embedding and the vector
+    lookup; with a database backend each lookup uses its own session from
+    session_factory. Each side fetches candidate_multiplier * top_k
+    candidates. Chunks found only lexically bypass the similarity threshold;
+    their cosine similarity is filled in afterwards so citations and
+    confidence keep a comparable score.
+    """
+
+    def __init__(
+        self,
+        retriever: Retriever,
+        session_factory: Optional[Callable[[], AsyncSession]] = None,
+        rrf_k: int = 60,
+        vector_weight: float = 1.0,
+        lexical_weight: float = 1.0,
+        candidate_multiplier: int = 4
+    ):
+        self.retriever = retriever
+        self.session_factory = session_factory
+        self.rrf_k = rrf_k
+        self.vector_weight = vector_weight
+        self.lexical_weight = lexical_weight
+        self.candidate_multiplier = candidate_multiplier
+
+    async def _run(self, db: Optional[AsyncSession], lookup: Callable[[Optional[AsyncSession]], Awaitable[Any]]) -> Any:
+        if self.retriever.requires_db and self.session_factory is not None:
+            async with self.session_factory() as session:
+                return await lookup(session)
+        return await lookup(db)
+
+    async def search(
+        self,
+        query: str,
+        embed: Callable[[str], Awaitable[np.ndarray]],
+        db: Optional[AsyncSession],
+        top_k: int,
+        similarity_threshold: float
+    ) -> List[RetrievedContext]:
+        """Embed and search query, returning up to top_k fused results."""
+        candidates = top_k * self.candidate_multiplier
+
+        async def vector_lookup() -> tuple:
+            query_embedding = await embed(query)
+            results = await self._run(db, lambda session: self.retriever.search(
+                query_embedding, db=session, top_k=candidates,
+                similarity_threshold=similarity_threshold
+            ))
+            return query_embedding, results
+
+        async def lexical_lookup() -> List[RetrievedContext]:
+            return await self._run(db, lambda session: self.retriever.search_text(
+                query, db=session, top_k=candidates
+            ))
+
+        if self.retriever.requires_db and self.session_factory is None:
+            # A single session cannot run statements concurrently
+            query_embedding, vector_results = await vector_lookup()
+            lexical_results = await lexical_lookup()
+        else:
+            (query_embedding, vector_results), lexical_results = await asyncio.gather(
+                vector_lookup(), lexical_lookup()
+            )
+
+        fused = reciprocal_rank_fusion(
+            [vector_results, lexical_results],
+            k=self.rrf_k,
+            weights=[self.vector_weight, self.lexical_weight]
+        )[:top_k]
+
+        vector_ids = {ctx.chunk_id for ctx in vector_results}
+        missing = [ctx.chunk_id for ctx in fused if ctx.chunk_id not in vector_ids]
+        if missing:
+            scores = await self._run(db, lambda session: self.retriever.similarities(
+                query_embedding, missing, db=session
+            ))
+            for ctx in fused:
+                if ctx.chunk_id in scores:
+                    ctx.similarity_score = scores[ctx.chunk_id]
+        return fused
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rrf_k": self.rrf_k,
+            "vector_weight": self.vector_weight,
+            "lexical_weight": self.lexical_weight,
+            "candidate_multiplier": self.candidate_multiplier,
+        }
+
+
+def create_retriever(
+    backend: str = "pgvector",
+    dimensions: Optional[int] = None,
+    **kwargs
+) -> Retriever:
+    """
+    Factory function to create a retriever.
+
+    Args:
+        backend: "pgvector" or "memory"
+        dimensions: Embedding dimensions (required for "memory")
+        **kwargs: Backend-specific options (index_type, ef_search, probes for
+            "pgvector"; nlist, nprobe, snapshot_path, session_factory for "memory")
+    """
+    if backend == "pgvector":
+        return PgVectorRetriever(**kwargs)
+    elif backend == "memory":
+        if not dimensions:
+            raise ValueError("Embedding dimensions required for in-memory retriever")
+        return InMemoryRetriever(dimensions=dimensions, **kwargs)
+    else:
+        raise ValueError(f"Unknown retriever backend: {backend}")
@@ -0,0 +1,289 @@
+"""
+In-process search over the platform data.
+Companies, policies, technologies and timeline entries are indexed once
+per data snapshot: one BM25 index per field (name, technology,
+description, tags), combined with per-field boosts. Query terms that are
+not in the vocabulary are expanded to similar terms through a character
+trigram index, so misspellings still match. Results carry highlighted
+snippets of the fields that matched.
+"""
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+from collections import Counter
+import heapq
+import re
+
+from app.services.company_catalog import CompanyCatalog, company_slug, name_key
+from app.services.text_index import BM25Index, tokenize
+
+FIELD_BOOSTS = {
+    "name": 3.0,
+    "technology": 2.0,
+    "tags": 1.5,
+    "description": 1.0
+}
+
+DOCUMENT_TYPES = ("company", "policy", "technology", "timeline")
+
+
+def _text(*values: Any) -> str:
+    """Flatten strings and lists of strings into one field text."""
+    parts: List[str] = []
+    for value in values:
+        if isinstance(value, str):
+            parts.append(value)
+        elif isinstance(value, (list, tuple)):
+            parts.extend(str(item) for item in value if isinstance(item, (str, int, float)))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            parts.append(str(value))
+    return " · ".join(part for part in parts if part)
+
+
+def index_terms(text: str) -> List[str]:
+    """Tokens of text plus the parts of hyphenated tokens ("solid-state")."""
+    terms = []
+    for token in tokenize(text):
+        terms.append(token)
+        if "-" in token:
+            terms.extend(part for part in token.split("-") if part)
+    return terms
+
+
+def _trigrams(term: str) -> Set[str]:
+    padded = f"${term}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    """
+    Field-boosted BM25 with trigram fuzzy matching.
+
+    Documents are (type, id, item, fields); item is what a result
+    returns and fields maps a field name to its text.
+    """
+
+    def __init__(
+        self,
+        boosts: Optional[Dict[str, float]] = None,
+        fuzzy_threshold: float = 0.6,
+        fuzzy_weight: float = 0.7,
+        max_expansions: int = 5
+    ):
+        self.boosts = dict(boosts or FIELD_BOOSTS)
+        self.fuzzy_threshold = fuzzy_threshold
+        self.fuzzy_weight = fuzzy_weight
+        self.max_expansions = max_expansions
+        self._fields = {field: BM25Index() for field in self.boosts}
+        self._docs: Dict[Hashable, Tuple[str, Dict[str, Any], Dict[str, str]]] = {}
+        self._trigram_terms: Dict[str, Set[str]] = {}
+        # term -> number of its trigrams
+        self._vocabulary: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, doc_type: str, doc_id: str, item: Dict[str, Any], fields: Dict[str, str]) -> None:
+        key = (doc_type, doc_id)
+        if key in self._docs:
+            return
+        fields = {field: text for field, text in fields.items() if field in self._fields and text}
+        self._docs[key] = (doc_type, item, fields)
+        for field, text in fields.items():
+            terms = index_terms(text)
+            self._fields[field].add_tokens(key, terms)
+            for term in terms:
+                if term not in self._vocabulary:
+                    grams = _trigrams(term)
+                    self._vocabulary[term] = len(grams)
+                    for gram in grams:
+                        self._trigram_terms.setdefault(gram, set()).add(term)
+
+    def expand(self, term: str) -> List[Tuple[str, float]]:
+        """The term itself (if indexed) and similar vocabulary terms, with weights."""
+        if term in self._vocabulary:
+            return [(term, 1.0)]
+        if len(term) < 4:
+            return []
+        grams = _trigrams(term)
+        shared = Counter(
+            candidate
+            for gram in grams
+            for candidate in self._trigram_terms.get(gram, ())
+        )
+        similar = []
+        for candidate, count in shared.items():
+            dice = 2 * count / (len(grams) + self._vocabulary[candidate])
+            if dice >= self.fuzzy_threshold:
+                similar.append((candidate, dice * self.fuzzy_weight))
+        return heapq.nlargest(self.max_expansions, similar, key=lambda item: item[1])
+
+    def search(
+        self,
+        query: str,
+        types: Optional[Iterable[str]] = None,
+        fields: Optional[Iterable[str]] = None,
+        limit: int = 10
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Rank every document matching the query and return the best limit
+        of them, plus the number of matches. Each hit has type, item,
+        score (relative to the best hit, 0..1) and highlights.
+        """
+        wanted_types = set(types) if types else None
+        selected = [field for field in (fields or self._fields) if field in self._fields] or list(self._fields)
+
+        weighted: Dict[str, float] = {}
+        for token in tokenize(query):
+            # "solid-state" matches the hyphenated term if some document
+            # has it, else its parts
+            parts = [token] if token in self._vocabulary or "-" not in token else token.split("-")
+            for part in parts:
+                for term, weight in self.expand(part):
+                    weighted[term] = max(weighted.get(term, 0.0), weight)
+        if not weighted:
+            return [], 0
+
+        scores: Dict[Hashable, float] = {}
+        matched: Dict[Hashable, Set[str]] = {}
+        for field in selected:
+            boost = self.boosts[field]
+            index = self._fields[field]
+            for term, weight in weighted.items():
+                for key, score in index.score_terms([term]).items():
+                    if wanted_types is not None and key[0] not in wanted_types:
+                        continue
+                    scores[key] = scores.get(key, 0.0) + boost * weight * score
+                    matched.setdefault(key, set()).add(term)
+
+        total = len(scores)
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        top_score = best[0][1] if best else 1.0
+        hits = []
+        for key, score in best:
+            doc_type, item, doc_fields = self._docs[key]
+            hits.append({
+                "type": doc_type,
+                "item": item,
+                "score": round(score / top_score, 4),
+                "highlights": self._highlights(doc_fields, selected, matched[key]),
+            })
+        return hits, total
+
+    def _highlights(self, fields: Dict[str, str], selected: List[str], terms: Set[str], max_snippets: int = 3) -> List[str]:
+        pattern = re.compile(
+            r"(?<![a-z0-9])(" + "|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True)) + r")(?![a-z0-9])",
+            re.IGNORECASE
+        )
+        snippets = []
+        for field in sorted(selected, key=lambda f: -self.boosts[f]):
+            text = fields.get(field)
+            if not text:
+                continue
+            match = pattern.search(text)
+            if match is None:
+                continue
+            start = max(0, match.start() - 40)
+            end = min(len(text), match.end() + 80)
+            snippet = pattern.sub(r"<em>\1</em>", text[start:end])
+            snippets.append(("…" if start else "") + snippet + ("…" if end < len(text) else ""))
+            if len(snippets) == max_snippets:
+                break
+        return snippets
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "documents": len(self._docs),
+            "by_type": dict(Counter(doc_type for doc_type, _ in self._docs)),
+            "vocabulary": len(self._vocabulary),
+        }
+
+
+def build_search_index(
+    companies: CompanyCatalog,
+    datasets: Dict[str, Any],
+    policies: Dict[str, Dict[str, Any]]
+) -> SearchIndex:
+    """Index the companies, policies, technologies and timeline of a snapshot."""
+    index = SearchIndex()
+
+    # search-data.json describes companies in more depth; attach its
+    # entries to the catalog by name and index the rest on their own
+    search_companies: Dict[str, Dict[str, Any]] = {}
+    for comp in (datasets.get("search-data") or {}).get("companies", []):
+        if isinstance(comp, dict) and comp.get("name"):
+            search_companies.setdefault(name_key(comp["name"]), comp)
+
+    policy_companies: Dict[str, List[str]] = {}
+
+    def add_company(company_id: str, name: str, capacity: Any, technology: str, extra: Dict[str, Any], tags: List[Any]) -> None:
+        for policy in extra.get("policies", []) or []:
+            policy_companies.setdefault(str(policy), []).append(name)
+        facilities = [
+            _text(facility.get("name"), facility.get("location"))
+            for facility in extra.get("facilities", []) or [] if isinstance(facility, dict)
+        ]
+        index.add("company", company_id, {
+            "id": company_id,
+            "name": name,
+            "capacity": capacity,
+            "technology": technology,
+        }, {
+            "name": name,
+            "technology": _text(technology, extra.get("technologies"), extra.get("chemistries")),
+            "description": _text(extra.get("description"), extra.get("products"), extra.get("features")),
+            "tags": _text(tags, extra.get("stage"), extra.get("policies"), facilities),
+        })
+
+    for detail in companies.details:
+        extra = dict(search_companies.pop(name_key(detail.name), {}))
+        add_company(detail.id, detail.name, detail.capacity, detail.technology, extra, [*detail.states, *detail.partnerships])
+    for comp in search_companies.values():
+        add_company(str(comp.get("id") or company_slug(comp["name"])), comp["name"], comp.get("capacity"), _text(comp.get("technologies")), comp, [])
+
+    for policy_id, policy in policies.items():
+        name = policy.get("name") or policy.get("title") or policy_id
+        index.add("policy", policy_id, dict(policy), {
+            "name": name,
+            "description": _text(policy.get("description"), policy.get("summary")),
+            "tags": _text(policy.get("type"), policy.get("jurisdiction"), policy.get("state")),
+        })
+    for name, referenced_by in policy_companies.items():
+        policy_id = company_slug(name)
+        index.add("policy", policy_id, {"id": policy_id, "name": name, "companies": referenced_by}, {
+            "name": name,
+            "tags": _text(referenced_by),
+        })
+
+    for chem in (datasets.get("technology-specs") or {}).get("chemistries", []):
+        if not isinstance(chem, dict) or not chem.get("name"):
+            continue
+        tech_id = company_slug(chem["name"])
+        index.add("technology", tech_id, {
+            "id": tech_id,
+            "name": chem["name"],
+            "formula": chem.get("formula"),
+            "applications": chem.get("applications"),
+            "major_manufacturers": chem.get("major_manufacturers"),
+        }, {
+            "name": _text(chem["name"], chem.get("formula")),
+            "technology": _text(chem.get("formula")),
+            "description": _text(chem.get("advantages"), chem.get("disadvantages")),
+            "tags": _text(chem.get("applications"), chem.get("major_manufacturers")),
+        })
+
+    timeline = datasets.get("timeline-complete") or {}
+    for era in timeline.get("eras", []):
+        if isinstance(era, dict) and era.get("name"):
+            index.add("timeline", f"era-{company_slug(era['name'])}", dict(era), {
+                "name": era["name"],
+                "description": _text(era.get("description"), era.get("characteristics"), era.get("key_outcome")),
+                "tags": _text(era.get("period")),
+            })
+    for event in timeline.get("events", []):
+        if isinstance(event, dict) and event.get("event"):
+            event_id = f"{event.get('date') or event.get('year')}-{company_slug(event['event'])[:48]}"
+            index.add("timeline", event_id, dict(event), {
+                "name": event["event"],
+                "description": _text(event.get("significance"), event.get("impact")),
+                "tags": _text(event.get("type"), event.get("year")),
+            })
+    return index
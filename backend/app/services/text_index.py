@@ -0,0 +1,106 @@
+"""
+In-process lexical search.
+A small tokenizer and an Okapi BM25 inverted index, used where a database
+full-text index is not available (e.g. the in-memory retriever).
+"""
+from typing import Dict, Hashable, Iterable, List, Tuple
+from collections import Counter
+import heapq
+import math
+import re
+import unicodedata
+
+# Words joined by "." or "-" stay one token ("li-ion", "45x", "u.s")
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.\-][a-z0-9]+)*")
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have in into is it its of on or
+that the their there these this to was were what when where which who will
+with how does do did can about than then them they our we you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, NFKC-normalize and split text into index terms, dropping stopwords."""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return [token for token in _TOKEN_RE.findall(text) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Okapi BM25 over an inverted index of term -> {doc_id: term frequency}.
+    Documents can be added and removed incrementally.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[Hashable, int]] = {}
+        self._doc_terms: Dict[Hashable, Counter] = {}
+        self._doc_lengths: Dict[Hashable, int] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._doc_lengths)
+
+    @property
+    def vocabulary_size(self) -> int:
+        return len(self._postings)
+
+    def add(self, doc_id: Hashable, text: str) -> None:
+        """Index text under doc_id, replacing any previous version."""
+        self.add_tokens(doc_id, tokenize(text))
+
+    def add_tokens(self, doc_id: Hashable, tokens: List[str]) -> None:
+        if doc_id in self._doc_lengths:
+            self.remove(doc_id)
+        counts = Counter(tokens)
+        for term, tf in counts.items():
+            self._postings.setdefault(term, {})[doc_id] = tf
+        self._doc_terms[doc_id] = counts
+        self._doc_lengths[doc_id] = len(tokens)
+        self._total_length += len(tokens)
+
+    def remove(self, doc_id: Hashable) -> bool:
+        counts = self._doc_terms.pop(doc_id, None)
+        if counts is None:
+            return False
+        for term in counts:
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+        self._total_length -= self._doc_lengths.pop(doc_id)
+        return True
+
+    def clear(self) -> None:
+        self._postings.clear()
+        self._doc_terms.clear()
+        self._doc_lengths.clear()
+        self._total_length = 0
+
+    def idf(self, term: str) -> float:
+        df = len(self._postings.get(term, ()))
+        n = len(self._doc_lengths)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def score_terms(self, terms: Iterable[str]) -> Dict[Hashable, float]:
+        """Return BM25 scores for every document matching at least one term."""
+        if not self._doc_lengths:
+            return {}
+        avg_length = self._total_length / len(self._doc_lengths) or 1.0
+        scores: Dict[Hashable, float] = {}
+        for term in set(terms):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf(term)
+            for doc_id, tf in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[Hashable, float]]:
+        """Return up to k (doc_id, score) pairs, best first."""
+        scores = self.score_terms(tokenize(query))
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
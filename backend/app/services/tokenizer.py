@@ -0,0 +1,99 @@
+"""
+Token counting for chunking and prompt budgeting.
+Wraps a tiktoken BPE encoding with an LRU cache of token counts, and falls
+back to the len/4 approximation when tiktoken or its encoding file is not
+available (tiktoken downloads encodings on first use unless they are
+already in TIKTOKEN_CACHE_DIR).
+"""
+from typing import Dict, List
+import functools
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_tokenizers: Dict[str, "Tokenizer"] = {}
+_registry_lock = threading.Lock()
+
+
+class Tokenizer:
+    """
+    BPE tokenizer with cached token counts.
+
+    count_tokens() is memoized, since the same chunks, prompts and history
+    messages are counted over and over. Special-token text such as
+    "<|endoftext|>" in documents is encoded as ordinary text.
+    """
+
+    exact = True
+
+    def __init__(self, encoding_name: str = "cl100k_base", cache_size: int = 65536):
+        try:
+            import tiktoken
+        except ImportError:
+            raise ImportError("tiktoken not installed. Install with: pip install tiktoken")
+        self.encoding_name = encoding_name
+        self.encoding = tiktoken.get_encoding(encoding_name)
+        self.count_tokens = functools.lru_cache(maxsize=cache_size)(self._count_tokens)
+
+    def encode(self, text: str) -> List[int]:
+        return self.encoding.encode(text, disallowed_special=())
+
+    def _count_tokens(self, text: str) -> int:
+        return len(self.encode(text))
+
+    def token_bytes(self, tokens: List[int]) -> List[bytes]:
+        """UTF-8 bytes of each token (a multi-byte character may span tokens)."""
+        return self.encoding.decode_tokens_bytes(tokens)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Return the longest prefix of text that fits in max_tokens tokens."""
+        if max_tokens <= 0:
+            return ""
+        tokens = self.encode(text)
+        if len(tokens) <= max_tokens:
+            return text
+        # Drop a character split by the cut rather than emit U+FFFD
+        return self.encoding.decode_bytes(tokens[:max_tokens]).decode("utf-8", errors="ignore")
+
+    def cache_info(self) -> Dict[str, int]:
+        info = self.count_tokens.cache_info()
+        return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "max_size": info.maxsize}
+
+
+class ApproximateTokenizer:
+    """Fallback estimating 1 token ≈ 4 characters. Cannot encode."""
+
+    exact = False
+    encoding_name = "approximate"
+
+    def count_tokens(self, text: str) -> int:
+        return len(text) // 4
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        return text[:max(max_tokens, 0) * 4]
+
+    def cache_info(self) -> Dict[str, int]:
+        return {}
+
+
+def get_tokenizer(encoding_name: str = "cl100k_base", cache_size: int = 65536, exact: bool = False):
+    """
+    Return the shared tokenizer for encoding_name.
+    Falls back to ApproximateTokenizer (with a warning) unless exact=True,
+    in which case the load error is raised.
+    """
+    with _registry_lock:
+        tokenizer = _tokenizers.get(encoding_name)
+        if tokenizer is None:
+            try:
+                tokenizer = Tokenizer(encoding_name, cache_size=cache_size)
+            except Exception as e:
+                if exact:
+                    raise
+                logger.warning(f"Tokenizer '{encoding_name}' unavailable, estimating tokens as len/4: {e}")
+                tokenizer = ApproximateTokenizer()
+            _tokenizers[encoding_name] = tokenizer
+    if exact and not tokenizer.exact:
+        raise RuntimeError(f"Tokenizer '{encoding_name}' is unavailable")
+    return tokenizer
@@ -0,0 +1,265 @@
+"""
+In-process approximate nearest neighbour index for chunk embeddings.
+
+IVF-Flat over cosine similarity: vectors are L2-normalized and assigned to
+the nearest of nlist centroids (spherical k-means). A query scans only the
+nprobe closest inverted lists, so nprobe trades recall for latency
+(nprobe == nlist is an exact search). Pure NumPy, no extra dependencies.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+import json
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class IVFFlatIndex:
+    """
+    Inverted-file index with exact (flat) scoring inside each list.
+
+    Until train() has run the index behaves as a flat (brute force) index.
+    Vectors can be added and removed incrementally after training; the
+    centroids are kept fixed until the next train()/build().
+    """
+
+    def __init__(
+        self,
+        dimensions: int,
+        nlist: int = 100,
+        nprobe: int = 8,
+        kmeans_iterations: int = 10,
+        seed: int = 0
+    ):
+        self.dimensions = dimensions
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.kmeans_iterations = kmeans_iterations
+        self.seed = seed
+
+        self.centroids: Optional[np.ndarray] = None
+        self._list_ids: List[np.ndarray] = []
+        self._list_vectors: List[np.ndarray] = []
+        self._id_to_list: Dict[int, int] = {}
+
+        # Flat storage used before training
+        self._flat_ids = np.empty(0, dtype=np.int64)
+        self._flat_vectors = np.empty((0, dimensions), dtype=np.float32)
+
+    # ------------------------------------------------------------------
+    # Building
+    # ------------------------------------------------------------------
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def __len__(self) -> int:
+        return len(self._id_to_list) if self.is_trained else len(self._flat_ids)
+
+    def build(self, ids: Iterable[int], vectors: np.ndarray) -> None:
+        """Train centroids on vectors and (re)populate the index."""
+        ids = np.asarray(list(ids), dtype=np.int64)
+        vectors = _normalize(vectors)
+        self.centroids = None
+        self._list_ids, self._list_vectors, self._id_to_list = [], [], {}
+        self._flat_ids = ids
+        self._flat_vectors = vectors
+        if len(ids):
+            self.train()
+
+    def train(self) -> None:
+        """Train centroids on the currently stored vectors and assign them to lists."""
+        ids, vectors = self._all_items()
+        if not len(ids):
+            return
+
+        # Aim for ~39+ training points per centroid, as usual for IVF
+        nlist = max(1, min(self.nlist, len(ids) // 39 or 1))
+        self.centroids = self._kmeans(vectors, nlist)
+        self._list_ids = [np.empty(0, dtype=np.int64) for _ in range(nlist)]
+        self._list_vectors = [np.empty((0, self.dimensions), dtype=np.float32) for _ in range(nlist)]
+        self._id_to_list = {}
+        self._flat_ids = np.empty(0, dtype=np.int64)
+        self._flat_vectors = np.empty((0, self.dimensions), dtype=np.float32)
+        self._assign(ids, vectors)
+        logger.info(f"Trained IVF index: {len(ids)} vectors, {nlist} lists")
+
+    def _kmeans(self, vectors: np.ndarray, nlist: int) -> np.ndarray:
+        rng = np.random.default_rng(self.seed)
+        sample_size = min(len(vectors), nlist * 256)
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+
+        for _ in range(self.kmeans_iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            counts = np.bincount(assignment, minlength=nlist)
+            empty = counts == 0
+            if empty.any():
+                # Re-seed empty clusters from random sample points
+                sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            centroids = _normalize(sums)
+        return centroids
+
+    def _assign(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        lists = np.argmax(vectors @ self.centroids.T, axis=1)
+        for list_no in np.unique(lists):
+            mask = lists == list_no
+            self._list_ids[list_no] = np.concatenate([self._list_ids[list_no], ids[mask]])
+            self._list_vectors[list_no] = np.concatenate([self._list_vectors[list_no], vectors[mask]])
+        for id_, list_no in zip(ids.tolist(), lists.tolist()):
+            self._id_to_list[id_] = list_no
+
+    def _all_items(self) -> Tuple[np.ndarray, np.ndarray]:
+        if not self.is_trained:
+            return self._flat_ids, self._flat_vectors
+        if not self._list_ids:
+            return np.empty(0, dtype=np.int64), np.empty((0, self.dimensions), dtype=np.float32)
+        return np.concatenate(self._list_ids), np.concatenate(self._list_vectors)
+
+    # ------------------------------------------------------------------
+    # Incremental updates
+    # ------------------------------------------------------------------
+
+    def add(self, ids: Iterable[int], vectors: np.ndarray) -> None:
+        """Add (or replace) vectors."""
+        ids = np.asarray(list(ids), dtype=np.int64)
+        if not len(ids):
+            return
+        self.remove(ids.tolist())
+        vectors = _normalize(np.atleast_2d(vectors))
+        if self.is_trained:
+            self._assign(ids, vectors)
+        else:
+            self._flat_ids = np.concatenate([self._flat_ids, ids])
+            self._flat_vectors = np.concatenate([self._flat_vectors, vectors])
+
+    def remove(self, ids: Iterable[int]) -> int:
+        """Remove vectors by id. Returns the number removed."""
+        ids = set(int(i) for i in ids)
+        if not ids:
+            return 0
+        if not self.is_trained:
+            mask = ~np.isin(self._flat_ids, list(ids))
+            removed = int((~mask).sum())
+            self._flat_ids = self._flat_ids[mask]
+            self._flat_vectors = self._flat_vectors[mask]
+            return removed
+
+        by_list: Dict[int, List[int]] = {}
+        for id_ in ids:
+            list_no = self._id_to_list.pop(id_, None)
+            if list_no is not None:
+                by_list.setdefault(list_no, []).append(id_)
+        for list_no, list_ids in by_list.items():
+            mask = ~np.isin(self._list_ids[list_no], list_ids)
+            self._list_ids[list_no] = self._list_ids[list_no][mask]
+            self._list_vectors[list_no] = self._list_vectors[list_no][mask]
+        return sum(len(v) for v in by_list.values())
+
+    def ids(self) -> List[int]:
+        return self._all_items()[0].tolist()
+
+    def get_vectors(self, ids: Iterable[int]) -> Dict[int, np.ndarray]:
+        """Return the stored (normalized) vectors for the given ids that exist."""
+        found = {}
+        for id_ in ids:
+            if self.is_trained:
+                list_no = self._id_to_list.get(id_)
+                if list_no is None:
+                    continue
+                list_ids, list_vectors = self._list_ids[list_no], self._list_vectors[list_no]
+            else:
+                list_ids, list_vectors = self._flat_ids, self._flat_vectors
+            positions = np.flatnonzero(list_ids == id_)
+            if len(positions):
+                found[id_] = list_vectors[positions[0]]
+        return found
+
+    # ------------------------------------------------------------------
+    # Search
+    # ------------------------------------------------------------------
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int,
+        nprobe: Optional[int] = None
+    ) -> List[Tuple[int, float]]:
+        """Return up to k (id, cosine similarity) pairs, best first."""
+        query = _normalize(np.asarray(query, dtype=np.float32).reshape(-1))
+
+        if self.is_trained:
+            nprobe = min(nprobe or self.nprobe, len(self.centroids))
+            centroid_scores = self.centroids @ query
+            probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+            candidate_ids = [self._list_ids[i] for i in probe if len(self._list_ids[i])]
+            if not candidate_ids:
+                return []
+            ids = np.concatenate(candidate_ids)
+            vectors = np.concatenate([self._list_vectors[i] for i in probe if len(self._list_ids[i])])
+        else:
+            ids, vectors = self._flat_ids, self._flat_vectors
+
+        if not len(ids):
+            return []
+        scores = vectors @ query
+        k = min(k, len(ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+    # ------------------------------------------------------------------
+    # Snapshots
+    # ------------------------------------------------------------------
+
+    def save(self, path: str, payloads: Optional[Dict[int, dict]] = None) -> None:
+        """Save index (and optional per-id payloads) to an .npz snapshot."""
+        ids, vectors = self._all_items()
+        np.savez(
+            path,
+            ids=ids,
+            vectors=vectors,
+            centroids=self.centroids if self.is_trained else np.empty((0, self.dimensions), dtype=np.float32),
+            config=np.array(json.dumps({
+                "dimensions": self.dimensions,
+                "nlist": self.nlist,
+                "nprobe": self.nprobe,
+            })),
+            payloads=np.array(json.dumps({str(k): v for k, v in (payloads or {}).items()})),
+        )
+
+    @classmethod
+    def load(cls, path: str, nprobe: Optional[int] = None) -> Tuple["IVFFlatIndex", Dict[int, dict]]:
+        """Load a snapshot written by save(). Returns (index, payloads)."""
+        with np.load(path, allow_pickle=False) as data:
+            config = json.loads(str(data["config"]))
+            index = cls(
+                dimensions=config["dimensions"],
+                nlist=config["nlist"],
+                nprobe=nprobe or config["nprobe"]
+            )
+            ids = data["ids"].astype(np.int64)
+            vectors = data["vectors"].astype(np.float32)
+            centroids = data["centroids"]
+            payloads = {int(k): v for k, v in json.loads(str(data["payloads"])).items()}
+
+        if len(centroids):
+            index.centroids = centroids.astype(np.float32)
+            index._list_ids = [np.empty(0, dtype=np.int64) for _ in range(len(centroids))]
+            index._list_vectors = [np.empty((0, index.dimensions), dtype=np.float32) for _ in range(len(centroids))]
+            index._assign(ids, vectors)
+        else:
+            index._flat_ids = ids
+            index._flat_vectors = vectors
+        return index, payloads
@@ -0,0 +1,179 @@
+"""
+Micro-benchmark for the markdown chunker.
+Times the streaming chunker against the previous implementation (string
+concatenation per line, character-by-character boundary scan) on the
+corpus and on synthetic documents of growing size, and checks that both
+produce identical chunks.
+"""
+import argparse
+import random
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services.document_processor import MarkdownDocumentProcessor
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class LegacyChunker:
+    """The chunker as it was before streaming, kept as the reference output."""
+
+    def __init__(self, chunk_size: int, chunk_overlap: int, min_chunk_size: int = 100):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.min_chunk_size = min_chunk_size
+
+    def extract_sections(self, content: str) -> List[Dict[str, Any]]:
+        sections = []
+        current_section = {"title": "Introduction", "content": "", "level": 0}
+        for line in content.split('\n'):
+            header_match = re.match(r'^(#{1,6})\s+(.+)$', line)
+            if header_match:
+                if current_section["content"].strip():
+                    sections.append(current_section)
+                current_section = {
+                    "title": header_match.group(2).strip(),
+                    "content": "",
+                    "level": len(header_match.group(1))
+                }
+            else:
+                current_section["content"] += line + '\n'
+        if current_section["content"].strip():
+            sections.append(current_section)
+        return sections
+
+    def chunk_text(self, text: str, section_title: Optional[str] = None) -> List[str]:
+        if len(text) <= self.chunk_size:
+            return [text]
+        chunks = []
+        start = 0
+        while start < len(text):
+            end = start + self.chunk_size
+            if end < len(text):
+                while end > start and not text[end].isspace():
+                    end -= 1
+                if end == start:
+                    end = start + self.chunk_size
+            else:
+                end = len(text)
+            chunk = text[start:end].strip()
+            if len(chunk) >= self.min_chunk_size:
+                if section_title:
+                    chunk = f"# {section_title}\n\n{chunk}"
+                chunks.append(chunk)
+            start = end - self.chunk_overlap if end < len(text) else end
+        return chunks
+
+    def chunk_file(self, file_path: str) -> List[str]:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        chunks = []
+        for section in self.extract_sections(content):
+            chunks.extend(self.chunk_text(section["content"], section["title"]))
+        return chunks
+
+
+def synthetic_document(size: int, seed: int = 0) -> str:
+    """Markdown with headers, paragraphs and some very long sections."""
+    rng = random.Random(seed)
+    words = ["lithium", "cathode", "anode", "GWh", "2030", "solid-state", "the", "of",
+             "capacity", "sodium-ion", "cell", "pack", "$120/kWh", "LFP", "NMC", "supply"]
+    separators = [" "] * 12 + ["\n", "\n\n", "\t", " "]
+    parts: List[str] = []
+    total = 0
+    while total < size:
+        level = rng.randint(1, 4)
+        parts.append(f"\n{'#' * level} Section {len(parts)}\n")
+        # Mostly normal sections, occasionally one huge one
+        section_size = rng.choice([500, 2000, 8000, 8000, 200_000])
+        written = 0
+        while written < section_size:
+            word = rng.choice(words) + rng.choice(separators)
+            parts.append(word)
+            written += len(word)
+        total += written
+    return "".join(parts)
+
+
+def chunk_streaming(processor: MarkdownDocumentProcessor, file_path: str) -> List[str]:
+    # Chunk text only, like LegacyChunker.chunk_file (no DocumentChunk hashing)
+    return [
+        chunk
+        for section in processor.read_sections(file_path)
+        for chunk in processor.iter_chunks(section["content"], section["title"])
+    ]
+
+
+def time_call(func, *args) -> Tuple[float, Any]:
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def benchmark_file(file_path: str, chunk_size: int, chunk_overlap: int, skip_legacy: bool) -> None:
+    processor = MarkdownDocumentProcessor(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    new_seconds, new_chunks = time_call(chunk_streaming, processor, file_path)
+    size_mb = Path(file_path).stat().st_size / 1e6
+
+    if skip_legacy:
+        logger.info(
+            f"{Path(file_path).name}: {size_mb:.1f} MB, {len(new_chunks)} chunks, "
+            f"streaming {new_seconds:.3f}s ({size_mb / new_seconds:.1f} MB/s)"
+        )
+        return
+
+    legacy = LegacyChunker(chunk_size, chunk_overlap)
+    old_seconds, old_chunks = time_call(legacy.chunk_file, file_path)
+    if new_chunks != old_chunks:
+        raise SystemExit(f"Output differs for {file_path}: {len(old_chunks)} vs {len(new_chunks)} chunks")
+    logger.info(
+        f"{Path(file_path).name}: {size_mb:.1f} MB, {len(new_chunks)} chunks identical, "
+        f"legacy {old_seconds:.3f}s, streaming {new_seconds:.3f}s "
+        f"({old_seconds / new_seconds:.1f}x)"
+    )
+
+
+def main(sizes: List[int], chunk_size: int, chunk_overlap: int, legacy_limit: int):
+    project_root = Path(__file__).parent.parent.parent
+    corpus = sorted(project_root.glob("*.md")) + sorted((project_root / "agent-outputs").glob("*.md"))
+    for file_path in corpus:
+        benchmark_file(str(file_path), chunk_size, chunk_overlap, skip_legacy=False)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            file_path = Path(tmp) / f"synthetic-{size}.md"
+            file_path.write_text(synthetic_document(size), encoding="utf-8")
+            # The legacy chunker is quadratic in section length, so only
+            # compare against it on smaller inputs
+            benchmark_file(str(file_path), chunk_size, chunk_overlap, skip_legacy=size > legacy_limit)
+            file_path.unlink()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1_000_000, 10_000_000, 50_000_000],
+        help="synthetic document sizes in characters"
+    )
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument(
+        "--legacy-limit", type=int, default=10_000_000,
+        help="largest synthetic size to also run through the legacy chunker"
+    )
+    args = parser.parse_args()
+
+    main(args.sizes, args.chunk_size, args.chunk_overlap, args.legacy_limit)
@@ -0,0 +1,58 @@
+"""
+Script to build an in-memory vector index snapshot from document_chunks.
+The snapshot lets RETRIEVER_BACKEND=memory start without a database scan.
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+import logging
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+
+from app.config import settings
+from app.database import register_vector_codec
+from app.services.retrieval import InMemoryRetriever
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+async def main(output: str, dimensions: int, nlist: int, nprobe: int):
+    """Build the index from the database and write the snapshot."""
+    engine = create_async_engine(settings.DATABASE_URL, echo=False)
+    register_vector_codec(engine)
+    AsyncSessionLocal = async_sessionmaker(
+        engine, class_=AsyncSession, expire_on_commit=False
+    )
+
+    retriever = InMemoryRetriever(dimensions=dimensions, nlist=nlist, nprobe=nprobe)
+    async with AsyncSessionLocal() as session:
+        await retriever.load_from_db(session)
+    retriever.save_snapshot(output)
+
+    await engine.dispose()
+    logger.info(f"Index snapshot written: {retriever.stats()}")
+
+
+if __name__ == "__main__":
+    default_dimensions = (
+        settings.GEMINI_EMBEDDING_DIMENSIONS
+        if settings.EMBEDDING_PROVIDER == "gemini"
+        else settings.EMBEDDING_DIMENSIONS
+    )
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--output", default=settings.ANN_INDEX_SNAPSHOT_PATH or "vector_index.npz")
+    parser.add_argument("--dimensions", type=int, default=default_dimensions)
+    parser.add_argument("--nlist", type=int, default=settings.ANN_INDEX_NLIST)
+    parser.add_argument("--nprobe", type=int, default=settings.ANN_INDEX_NPROBE)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.output, args.dimensions, args.nlist, args.nprobe))
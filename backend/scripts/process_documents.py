@@ -1,25 +1,46 @@
 """
 Script to process research documents and populate vector database.
 Run this to initialize the RAG system with document embeddings.
+
+Re-runs are incremental: unchanged files are skipped, and in changed files
+only sections whose content hash changed are re-embedded and rewritten.
+Chunks that no longer exist are deleted. Use --report to write the diff
+of added, updated and removed chunks as JSON.
+
+Ingestion is a staged pipeline connected by bounded queues:
+file discovery -> chunking (process pool) -> planning against the stored
+chunks -> embedding (concurrent tasks) -> a single batched DB writer.
 """
+import argparse
 import asyncio
+import json
+import os
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import Any, Dict, List, Optional, Tuple
 import logging
 
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from sqlalchemy import text
-from sqlalchemy import select
+from sqlalchemy import select, update, delete, bindparam, func, and_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 
 from app.config import settings
 from app.models.document import DocumentChunk, DocumentMetadata
-from app.database import Base
-from app.services.document_processor import MarkdownDocumentProcessor, count_tokens_approximate
+from app.database import Base, register_vector_codec
+from app.services.document_processor import (
+    MarkdownDocumentProcessor,
+    DocumentChunk as ProcessedChunk,
+    chunk_document_file,
+)
 from app.services.embedding_service import create_embedding_service
+from app.services.pgvector_index import PgVectorIndexManager
+from app.services.tokenizer import get_tokenizer
 
 # Configure logging
 logging.basicConfig(
@@ -28,132 +49,537 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Queue sentinel: one per upstream worker, sent when it has finished
+_DONE = None
+
+
+class IngestionStats:
+    """Counters and timings for an ingestion run."""
+    
+    def __init__(self):
+        self.documents_processed = 0
+        self.documents_skipped = 0
+        self.documents_failed = 0
+        self.chunks_total = 0
+        self.chunks_embedded = 0
+        self.chunks_reused = 0
+        self.chunking_seconds = 0.0
+        self.embedding_seconds = 0.0
+        self.db_seconds = 0.0
+        self.started = time.perf_counter()
+        
+        # Per-document diff: path -> {status, added, updated, removed, ...}
+        self.documents: Dict[str, Dict[str, Any]] = {}
+    
+    def record(self, file_path: str, **diff: Any) -> None:
+        self.documents[file_path] = diff
+    
+    def diff_totals(self) -> Dict[str, int]:
+        totals = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+        for diff in self.documents.values():
+            for key in totals:
+                totals[key] += diff.get(key, 0)
+        return totals
+    
+    def report(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self.started
+        return {
+            "documents_processed": self.documents_processed,
+            "documents_skipped": self.documents_skipped,
+            "documents_failed": self.documents_failed,
+            "chunks_total": self.chunks_total,
+            "chunks_embedded": self.chunks_embedded,
+            "chunks_reused": self.chunks_reused,
+            "chunks": self.diff_totals(),
+            "elapsed_seconds": round(elapsed, 2),
+            # Stage times are summed over workers, so they can exceed elapsed
+            "chunking_seconds": round(self.chunking_seconds, 2),
+            "embedding_seconds": round(self.embedding_seconds, 2),
+            "db_seconds": round(self.db_seconds, 2),
+            "chunks_per_second": round(self.chunks_total / elapsed, 1) if elapsed else 0.0,
+        }
+
+
+class DocumentPlan:
+    """Changes needed to bring one document's stored chunks up to date."""
+    
+    def __init__(self, file_path: str, metadata: Dict[str, Any], sections_total: int):
+        self.file_path = file_path
+        self.metadata = metadata
+        self.sections_total = sections_total
+        self.sections_rechunked = 0
+        self.new_chunks: List[ProcessedChunk] = []
+        self.reused_chunks: List[ProcessedChunk] = []
+        # Chunks whose content is already stored for another document
+        self.duplicates: List[ProcessedChunk] = []
+        self.moved: List[Tuple[int, int]] = []  # (chunk id, new chunk_index)
+        self.removed: List[Any] = []
+        self.unchanged = 0
+        self.total_chunks = 0
+        self.total_tokens = 0
+        self.embeddings: List[Any] = []
+
 
 class DocumentIngestionPipeline:
-    """Pipeline for processing and ingesting documents into vector database."""
+    """
+    Pipeline for processing and ingesting documents into vector database.
+    
+    Stages run concurrently and hand documents over through bounded queues,
+    so the slowest stage (usually embedding) applies backpressure instead of
+    letting chunked documents pile up in memory:
+    - chunk_workers processes parse and chunk files;
+    - a planner diffs each document against its stored chunks;
+    - embed_workers tasks embed documents concurrently;
+    - one writer applies each document's changes in a single transaction.
+    
+    Storage is set-based: existing content hashes are loaded in one query
+    per document, only new chunks are embedded, and rows are written with
+    batched INSERT ... ON CONFLICT (content_hash) DO UPDATE. content_hash is
+    unique across documents, so a chunk whose content another document
+    already stores is skipped; a document only ever updates its own rows.
+    
+    Ingestion is incremental. Each chunk records the hash of its section
+    and the chunking settings; when a file changes, chunks of sections with
+    an unchanged hash and settings are kept (renumbered if they moved),
+    other sections are rewritten, and stored chunks that are no longer
+    produced are deleted. full=True also reprocesses unchanged files, e.g.
+    after changing the chunk size or unit.
+    
+    Token counts use the BPE tokenizer for encoding_name (len/4 if it is
+    unavailable); chunk_unit="tokens" requires the real tokenizer.
+    """
     
     def __init__(
         self,
-        db_session: AsyncSession,
+        session_factory: async_sessionmaker,
         embedding_service,
         chunk_size: int = 1000,
-        chunk_overlap: int = 200
+        chunk_overlap: int = 200,
+        write_batch_size: int = 500,
+        full: bool = False,
+        chunk_workers: Optional[int] = None,
+        embed_workers: int = 4,
+        queue_size: int = 16,
+        chunk_unit: str = "chars",
+        encoding_name: str = "cl100k_base"
     ):
-        self.db = db_session
+        self.session_factory = session_factory
         self.embedding_service = embedding_service
-        self.processor = MarkdownDocumentProcessor(
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.chunk_unit = chunk_unit
+        self.encoding_name = encoding_name
+        self.tokenizer = get_tokenizer(encoding_name)
+        # Chunking itself runs in the pool; this instance provides the
+        # settings signature that stored chunks are compared against
+        self.chunking = MarkdownDocumentProcessor(
             chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap
-        )
+            chunk_overlap=chunk_overlap,
+            chunk_unit=chunk_unit,
+            encoding_name=encoding_name
+        ).chunking
+        self.write_batch_size = write_batch_size
+        self.full = full
+        self.chunk_workers = chunk_workers or os.cpu_count() or 1
+        self.embed_workers = embed_workers
+        self.queue_size = queue_size
+        self.stats = IngestionStats()
     
-    async def process_document(self, file_path: str) -> None:
-        """Process a single document."""
-        logger.info(f"Processing document: {file_path}")
+    async def run(self, directories: List[str]) -> None:
+        """Ingest all markdown files in the given directories."""
+        known_hashes: Dict[str, str] = {}
+        if not self.full:
+            # Hashes of completed documents let chunk workers skip unchanged
+            # files before parsing them. A failed run may already have stored
+            # the new hash, so only completed documents count
+            async with self.session_factory() as db:
+                result = await db.execute(
+                    select(DocumentMetadata.file_path, DocumentMetadata.file_hash).where(
+                        DocumentMetadata.processing_status == "completed"
+                    )
+                )
+                known_hashes = {row.file_path: row.file_hash for row in result.all()}
         
-        try:
-            # Check if document already processed
-            result = await self.db.execute(
-                select(DocumentMetadata).where(
-                    DocumentMetadata.file_path == file_path
+        files: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        chunked: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        planned: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        embedded: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        
+        with ProcessPoolExecutor(max_workers=self.chunk_workers) as pool:
+            tasks = [
+                asyncio.create_task(self._discover(directories, files)),
+                *[
+                    asyncio.create_task(self._chunk_worker(pool, known_hashes, files, chunked))
+                    for _ in range(self.chunk_workers)
+                ],
+                asyncio.create_task(self._planner(chunked, planned)),
+                *[
+                    asyncio.create_task(self._embed_worker(planned, embedded))
+                    for _ in range(self.embed_workers)
+                ],
+                asyncio.create_task(self._writer(embedded)),
+            ]
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                raise
+    
+    async def _discover(self, directories: List[str], out: asyncio.Queue) -> None:
+        for directory in directories:
+            md_files = sorted(Path(directory).glob("*.md"))
+            logger.info(f"Found {len(md_files)} markdown files in {directory}")
+            for md_file in md_files:
+                await out.put(str(md_file))
+        for _ in range(self.chunk_workers):
+            await out.put(_DONE)
+    
+    async def _chunk_worker(
+        self,
+        pool: ProcessPoolExecutor,
+        known_hashes: Dict[str, str],
+        inbox: asyncio.Queue,
+        out: asyncio.Queue
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        while (file_path := await inbox.get()) is not _DONE:
+            start = time.perf_counter()
+            try:
+                result = await loop.run_in_executor(
+                    pool,
+                    chunk_document_file,
+                    file_path,
+                    self.chunk_size,
+                    self.chunk_overlap,
+                    known_hashes.get(file_path),
+                    self.chunk_unit,
+                    self.encoding_name,
                 )
-            )
-            existing = result.scalar_one_or_none()
-            
-            # Process document into chunks
-            chunks, metadata = self.processor.process_document(file_path)
+            except Exception as e:
+                await self._mark_failed(file_path, e)
+                continue
+            self.stats.chunking_seconds += time.perf_counter() - start
             
-            # Check if file changed (compare hash)
-            if existing and existing.file_hash == metadata["file_hash"]:
+            if result is None:
                 logger.info(f"Document unchanged, skipping: {file_path}")
-                return
-            
-            # Update metadata record
-            if existing:
-                logger.info(f"Document changed, reprocessing: {file_path}")
-                existing.processing_status = "processing"
-                await self.db.flush()
+                self.stats.documents_skipped += 1
+                self.stats.record(file_path, status="unchanged")
+                continue
+            await out.put((file_path, result))
+        await out.put(_DONE)
+    
+    async def _planner(self, inbox: asyncio.Queue, out: asyncio.Queue) -> None:
+        remaining = self.chunk_workers
+        while remaining:
+            item = await inbox.get()
+            if item is _DONE:
+                remaining -= 1
+                continue
+            file_path, (sections, section_chunks, metadata) = item
+            try:
+                plan = await self.plan_document(file_path, sections, section_chunks, metadata)
+            except Exception as e:
+                await self._mark_failed(file_path, e)
+                continue
+            await out.put(plan)
+        for _ in range(self.embed_workers):
+            await out.put(_DONE)
+    
+    async def plan_document(
+        self,
+        file_path: str,
+        sections: List[Dict[str, Any]],
+        section_chunks: List[List[ProcessedChunk]],
+        metadata: Dict[str, Any]
+    ) -> DocumentPlan:
+        """Diff a chunked document against its stored chunks."""
+        plan = DocumentPlan(file_path, metadata, len(sections))
+        table = DocumentChunk.__table__
+        
+        start = time.perf_counter()
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(
+                    table.c.id,
+                    table.c.content_hash,
+                    table.c.chunk_index,
+                    table.c.token_count,
+                    table.c.chunk_metadata,
+                )
+                .where(table.c.source_document == metadata["file_name"])
+                .order_by(table.c.chunk_index)
+            )
+            # source_document is the bare file name, so tell same-named files
+            # apart by the path recorded in the chunk metadata
+            stored = [
+                row for row in result.all()
+                if (row.chunk_metadata or {}).get("file_path", file_path) == file_path
+            ]
+        self.stats.db_seconds += time.perf_counter() - start
+        
+        # Chunks written before section hashes were recorded, or with other
+        # chunking settings, are never kept as-is; their content (and
+        # embedding) is still reused by hash if it reappears
+        by_section: Dict[str, List[Any]] = {}
+        for row in stored:
+            chunk_metadata = row.chunk_metadata or {}
+            section = chunk_metadata.get("section_hash")
+            if section and chunk_metadata.get("chunking") == self.chunking:
+                by_section.setdefault(section, []).append(row)
+        
+        kept: List[Any] = []  # (row, new chunk_index)
+        changed_chunks: List[ProcessedChunk] = []
+        chunk_index = 0
+        for section, chunks in zip(sections, section_chunks):
+            if not chunks:
+                continue
+            # pop: a repeated identical section is rewritten, not double-counted
+            rows = by_section.pop(section["hash"], None)
+            if rows:
+                kept.extend((row, chunk_index + i) for i, row in enumerate(rows))
+                chunk_index += len(rows)
             else:
-                doc_metadata = DocumentMetadata(
-                    file_path=file_path,
-                    file_name=metadata["file_name"],
-                    file_type="markdown",
-                    file_size=metadata["file_size"],
-                    file_hash=metadata["file_hash"],
-                    processing_status="processing"
+                for chunk in chunks:
+                    chunk.chunk_index = chunk_index
+                    chunk_index += 1
+                changed_chunks.extend(chunks)
+                plan.sections_rechunked += 1
+        
+        new_hashes = {chunk.content_hash for chunk in changed_chunks}
+        kept = [(row, index) for row, index in kept if row.content_hash not in new_hashes]
+        kept_ids = {row.id for row, _ in kept}
+        plan.moved = [(row.id, index) for row, index in kept if row.chunk_index != index]
+        plan.unchanged = len(kept) - len(plan.moved)
+        plan.removed = [
+            row for row in stored
+            if row.id not in kept_ids and row.content_hash not in new_hashes
+        ]
+        plan.total_chunks = chunk_index
+        plan.total_tokens = (
+            sum(row.token_count for row, _ in kept)
+            + sum(self.tokenizer.count_tokens(chunk.content) for chunk in changed_chunks)
+        )
+        
+        # content_hash is unique, and one INSERT ... ON CONFLICT cannot touch
+        # the same row twice, so keep the first chunk for each hash
+        unique: Dict[str, ProcessedChunk] = {}
+        for chunk in changed_chunks:
+            unique.setdefault(chunk.content_hash, chunk)
+        
+        if unique:
+            start = time.perf_counter()
+            async with self.session_factory() as db:
+                result = await db.execute(
+                    select(table.c.content_hash, table.c.source_document, table.c.chunk_metadata).where(
+                        table.c.content_hash.in_(list(unique))
+                    )
                 )
-                self.db.add(doc_metadata)
-                await self.db.flush()
-            
-            logger.info(f"Generated {len(chunks)} chunks")
-            
-            # Generate embeddings in batches
-            batch_size = 50
-            total_chunks = len(chunks)
-            
-            for i in range(0, total_chunks, batch_size):
-                batch = chunks[i:i + batch_size]
-                logger.info(f"Processing batch {i//batch_size + 1}/{(total_chunks-1)//batch_size + 1}")
-                
-                # Extract text content
-                texts = [chunk.content for chunk in batch]
-                
-                # Generate embeddings
-                embeddings = await self.embedding_service.embed_texts(texts)
-                
-                # Store in database
-                for chunk, embedding in zip(batch, embeddings):
-                    # Check if chunk already exists (by hash)
-                    existing_chunk = await self.db.execute(
-                        select(DocumentChunk).where(
-                            DocumentChunk.content_hash == chunk.content_hash
-                        )
+                existing = {
+                    row.content_hash: (
+                        row.source_document == metadata["file_name"]
+                        and (row.chunk_metadata or {}).get("file_path", file_path) == file_path
                     )
-                    existing_chunk = existing_chunk.scalar_one_or_none()
-                    
-                    if existing_chunk:
-                        # Update existing chunk
-                        existing_chunk.embedding = embedding
-                    else:
-                        # Create new chunk
-                        db_chunk = DocumentChunk(
-                            source_document=chunk.source_document,
-                            chunk_index=chunk.chunk_index,
-                            content=chunk.content,
-                            content_hash=chunk.content_hash,
-                            section_title=chunk.section_title,
-                            chunk_metadata=chunk.chunk_metadata,
-                            embedding=embedding,
-                            token_count=count_tokens_approximate(chunk.content)
-                        )
-                        self.db.add(db_chunk)
-                
-                await self.db.flush()
+                    for row in result.all()
+                }
+            self.stats.db_seconds += time.perf_counter() - start
             
-            # Update metadata
-            if existing:
-                existing.processing_status = "completed"
-                existing.total_chunks = len(chunks)
-                existing.total_tokens = sum(count_tokens_approximate(c.content) for c in chunks)
-                existing.error_message = None
-            else:
-                doc_metadata = await self.db.execute(
-                    select(DocumentMetadata).where(
-                        DocumentMetadata.file_path == file_path
+            for chunk in unique.values():
+                owned = existing.get(chunk.content_hash)
+                if owned is None:
+                    plan.new_chunks.append(chunk)
+                elif owned:
+                    plan.reused_chunks.append(chunk)
+                else:
+                    plan.duplicates.append(chunk)
+            if plan.duplicates:
+                logger.info(
+                    f"{file_path}: skipping {len(plan.duplicates)} chunks whose content "
+                    f"is already stored for another document"
+                )
+        
+        logger.info(
+            f"Planned {file_path}: {plan.sections_rechunked}/{plan.sections_total} sections changed, "
+            f"{len(plan.new_chunks)} chunks to embed, {len(plan.reused_chunks)} already stored"
+        )
+        return plan
+    
+    async def _embed_worker(self, inbox: asyncio.Queue, out: asyncio.Queue) -> None:
+        # Only new content needs embedding; the provider also splits each
+        # document into concurrent batches within its in-flight limits
+        while (plan := await inbox.get()) is not _DONE:
+            if plan.new_chunks:
+                start = time.perf_counter()
+                try:
+                    plan.embeddings = await self.embedding_service.embed_texts(
+                        [chunk.content for chunk in plan.new_chunks]
                     )
+                except Exception as e:
+                    await self._mark_failed(plan.file_path, e)
+                    continue
+                self.stats.embedding_seconds += time.perf_counter() - start
+                self.stats.chunks_embedded += len(plan.new_chunks)
+            await out.put(plan)
+        await out.put(_DONE)
+    
+    async def _writer(self, inbox: asyncio.Queue) -> None:
+        remaining = self.embed_workers
+        async with self.session_factory() as db:
+            while remaining:
+                plan = await inbox.get()
+                if plan is _DONE:
+                    remaining -= 1
+                    continue
+                start = time.perf_counter()
+                try:
+                    await self.write_document(db, plan)
+                except Exception as e:
+                    await db.rollback()
+                    await self._mark_failed(plan.file_path, e)
+                finally:
+                    self.stats.db_seconds += time.perf_counter() - start
+    
+    @staticmethod
+    def _owned_by(table, plan: DocumentPlan):
+        """Condition matching the stored chunks that belong to plan's document."""
+        return and_(
+            table.c.source_document == plan.metadata["file_name"],
+            func.coalesce(table.c.chunk_metadata["file_path"].as_string(), plan.file_path) == plan.file_path,
+        )
+    
+    async def write_document(self, db: AsyncSession, plan: DocumentPlan) -> None:
+        """Apply a document plan and update its metadata in one transaction."""
+        metadata = plan.metadata
+        result = await db.execute(
+            select(DocumentMetadata).where(DocumentMetadata.file_path == plan.file_path)
+        )
+        doc_metadata = result.scalar_one_or_none()
+        existed = doc_metadata is not None
+        if doc_metadata is None:
+            doc_metadata = DocumentMetadata(
+                file_path=plan.file_path,
+                file_name=metadata["file_name"],
+                file_type="markdown",
+            )
+            db.add(doc_metadata)
+        
+        table = DocumentChunk.__table__
+        
+        if plan.new_chunks:
+            insert_stmt = pg_insert(table)
+            # A hash can be taken by another document between planning and
+            # writing; that row is left alone rather than reassigned
+            upsert = insert_stmt.on_conflict_do_update(
+                index_elements=[table.c.content_hash],
+                set_={
+                    "chunk_index": insert_stmt.excluded.chunk_index,
+                    "section_title": insert_stmt.excluded.section_title,
+                    "chunk_metadata": insert_stmt.excluded.chunk_metadata,
+                    "embedding": insert_stmt.excluded.embedding,
+                    "token_count": insert_stmt.excluded.token_count,
+                    "updated_at": func.now(),
+                },
+                where=self._owned_by(table, plan)
+            )
+            for i in range(0, len(plan.new_chunks), self.write_batch_size):
+                batch = plan.new_chunks[i:i + self.write_batch_size]
+                rows = [
+                    {
+                        "source_document": chunk.source_document,
+                        "chunk_index": chunk.chunk_index,
+                        "content": chunk.content,
+                        "content_hash": chunk.content_hash,
+                        "section_title": chunk.section_title,
+                        "chunk_metadata": chunk.chunk_metadata,
+                        "embedding": embedding,
+                        "token_count": self.tokenizer.count_tokens(chunk.content),
+                    }
+                    for chunk, embedding in zip(batch, plan.embeddings[i:i + self.write_batch_size])
+                ]
+                await db.execute(upsert, rows)
+        
+        if plan.reused_chunks:
+            # Same content, possibly at a new position: refresh placement
+            # metadata of this document's own rows without touching the
+            # embedding
+            update_stmt = (
+                update(table)
+                .where(table.c.content_hash == bindparam("b_content_hash"))
+                .where(self._owned_by(table, plan))
+                .values(
+                    chunk_index=bindparam("b_chunk_index"),
+                    section_title=bindparam("b_section_title"),
+                    chunk_metadata=bindparam("b_chunk_metadata"),
                 )
-                doc_metadata = doc_metadata.scalar_one()
-                doc_metadata.processing_status = "completed"
-                doc_metadata.total_chunks = len(chunks)
-                doc_metadata.total_tokens = sum(count_tokens_approximate(c.content) for c in chunks)
-            
-            await self.db.commit()
-            logger.info(f"Successfully processed: {file_path}")
-            
-        except Exception as e:
-            logger.error(f"Error processing {file_path}: {e}", exc_info=True)
-            
-            # Update metadata with error
-            result = await self.db.execute(
+            )
+            for i in range(0, len(plan.reused_chunks), self.write_batch_size):
+                batch = plan.reused_chunks[i:i + self.write_batch_size]
+                await db.execute(
+                    update_stmt,
+                    [
+                        {
+                            "b_content_hash": chunk.content_hash,
+                            "b_chunk_index": chunk.chunk_index,
+                            "b_section_title": chunk.section_title,
+                            "b_chunk_metadata": chunk.chunk_metadata,
+                        }
+                        for chunk in batch
+                    ]
+                )
+        
+        if plan.moved:
+            # Unchanged sections after an edited one shift position
+            renumber = (
+                update(table)
+                .where(table.c.id == bindparam("b_id"))
+                .values(chunk_index=bindparam("b_chunk_index"))
+            )
+            for i in range(0, len(plan.moved), self.write_batch_size):
+                await db.execute(
+                    renumber,
+                    [{"b_id": id_, "b_chunk_index": index} for id_, index in plan.moved[i:i + self.write_batch_size]]
+                )
+        
+        if plan.removed:
+            # Tombstones: logged with their hashes, then deleted in one statement
+            for row in plan.removed:
+                logger.debug(f"Tombstoning chunk {row.id} ({row.content_hash[:12]}) of {plan.file_path}")
+            await db.execute(delete(table).where(table.c.id.in_([row.id for row in plan.removed])))
+        
+        doc_metadata.file_hash = metadata["file_hash"]
+        doc_metadata.file_size = metadata["file_size"]
+        doc_metadata.processing_status = "completed"
+        doc_metadata.total_chunks = plan.total_chunks
+        doc_metadata.total_tokens = plan.total_tokens
+        doc_metadata.error_message = None
+        await db.commit()
+        
+        diff = {
+            "status": "updated" if existed else "added",
+            "sections_total": plan.sections_total,
+            "sections_rechunked": plan.sections_rechunked,
+            "added": len(plan.new_chunks),
+            "updated": len(plan.reused_chunks) + len(plan.moved),
+            "removed": len(plan.removed),
+            "duplicates": len(plan.duplicates),
+            "unchanged": plan.unchanged,
+        }
+        self.stats.record(plan.file_path, **diff)
+        self.stats.documents_processed += 1
+        self.stats.chunks_total += len(plan.new_chunks) + len(plan.reused_chunks)
+        self.stats.chunks_reused += len(plan.reused_chunks)
+        logger.info(
+            f"Successfully processed: {plan.file_path} "
+            f"(+{diff['added']} ~{diff['updated']} -{diff['removed']} ={diff['unchanged']})"
+        )
+    
+    async def _mark_failed(self, file_path: str, error: Exception) -> None:
+        """Log a failed document and record the error on its metadata row, if any."""
+        logger.error(f"Error processing {file_path}: {error}", exc_info=error)
+        self.stats.documents_failed += 1
+        self.stats.record(file_path, status="failed", error=str(error))
+        async with self.session_factory() as db:
+            result = await db.execute(
                 select(DocumentMetadata).where(
                     DocumentMetadata.file_path == file_path
                 )
@@ -161,44 +587,49 @@ class DocumentIngestionPipeline:
             doc_metadata = result.scalar_one_or_none()
             if doc_metadata:
                 doc_metadata.processing_status = "failed"
-                doc_metadata.error_message = str(e)
-                await self.db.commit()
-            
-            raise
-    
-    async def process_directory(self, directory: str) -> None:
-        """Process all markdown files in a directory."""
-        directory_path = Path(directory)
-        
-        # Find all markdown files
-        md_files = list(directory_path.glob("*.md"))
-        logger.info(f"Found {len(md_files)} markdown files in {directory}")
-        
-        for md_file in md_files:
-            await self.process_document(str(md_file))
+                doc_metadata.error_message = str(error)
+                await db.commit()
 
 
-async def main():
+async def main(
+    full: bool = False,
+    report_path: Optional[str] = None,
+    chunk_workers: Optional[int] = None,
+    embed_workers: int = 4,
+    queue_size: int = 16,
+    write_batch_size: int = 500
+):
     """Main function to run document processing."""
     # Create async engine
     engine = create_async_engine(settings.DATABASE_URL, echo=False)
+    register_vector_codec(engine)
     
     # Create tables
     async with engine.begin() as conn:
         await conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
         await conn.run_sync(Base.metadata.create_all)
+    await engine.dispose()
     
     # Create session factory
     AsyncSessionLocal = async_sessionmaker(
         engine, class_=AsyncSession, expire_on_commit=False
     )
     
+    # Batching options: several provider batches are sent concurrently
+    batch_options = {
+        "batch_size": settings.EMBEDDING_BATCH_SIZE,
+        "batch_max_tokens": settings.EMBEDDING_BATCH_MAX_TOKENS,
+        "max_concurrent_batches": settings.EMBEDDING_MAX_CONCURRENT_BATCHES,
+        "max_inflight_tokens": settings.EMBEDDING_MAX_INFLIGHT_TOKENS,
+    }
+    
     # Initialize embedding service based on provider
     if settings.EMBEDDING_PROVIDER == "gemini":
         embedding_service = create_embedding_service(
             provider_type="gemini",
             api_key=settings.GEMINI_API_KEY,
-            model=settings.GEMINI_EMBEDDING_MODEL
+            model=settings.GEMINI_EMBEDDING_MODEL,
+            **batch_options
         )
     else:
         # Default to OpenAI
@@ -206,37 +637,76 @@ async def main():
             provider_type="openai",
             api_key=settings.OPENAI_API_KEY,
             model=settings.EMBEDDING_MODEL,
-            dimensions=settings.EMBEDDING_DIMENSIONS
+            dimensions=settings.EMBEDDING_DIMENSIONS,
+            **batch_options
         )
     
     logger.info(f"Using embedding model: {settings.EMBEDDING_MODEL}")
     logger.info(f"Embedding dimensions: {settings.EMBEDDING_DIMENSIONS}")
     
-    # Process documents
-    async with AsyncSessionLocal() as session:
-        pipeline = DocumentIngestionPipeline(
-            db_session=session,
-            embedding_service=embedding_service,
-            chunk_size=settings.CHUNK_SIZE,
-            chunk_overlap=settings.CHUNK_OVERLAP
-        )
-        
-        # Get project root directory (where markdown files are)
-        project_root = Path(__file__).parent.parent.parent
-        
-        # Process all markdown files in project root
-        logger.info(f"Processing documents in: {project_root}")
-        await pipeline.process_directory(str(project_root))
-        
-        # Also process agent-outputs directory
-        agent_outputs = project_root / "agent-outputs"
-        if agent_outputs.exists():
-            logger.info(f"Processing documents in: {agent_outputs}")
-            await pipeline.process_directory(str(agent_outputs))
+    pipeline = DocumentIngestionPipeline(
+        session_factory=AsyncSessionLocal,
+        embedding_service=embedding_service,
+        chunk_size=settings.CHUNK_SIZE,
+        chunk_overlap=settings.CHUNK_OVERLAP,
+        chunk_unit=settings.CHUNK_UNIT,
+        encoding_name=settings.TOKENIZER_ENCODING,
+        write_batch_size=write_batch_size,
+        full=full,
+        chunk_workers=chunk_workers,
+        embed_workers=embed_workers,
+        queue_size=queue_size
+    )
+    
+    # Get project root directory (where markdown files are), plus the
+    # agent-outputs directory
+    project_root = Path(__file__).parent.parent.parent
+    directories = [str(project_root)]
+    agent_outputs = project_root / "agent-outputs"
+    if agent_outputs.exists():
+        directories.append(str(agent_outputs))
+    
+    logger.info(f"Processing documents in: {', '.join(directories)}")
+    await pipeline.run(directories)
+    
+    summary = pipeline.stats.report()
+    logger.info(f"Ingestion summary: {summary}")
+    if report_path:
+        with open(report_path, "w") as f:
+            json.dump({"summary": summary, "documents": pipeline.stats.documents}, f, indent=2)
+        logger.info(f"Diff report written to {report_path}")
+    
+    # Make sure the ANN index exists now that the chunks are loaded
+    index_manager = PgVectorIndexManager(
+        engine,
+        index_type=settings.VECTOR_INDEX_TYPE,
+        hnsw_m=settings.VECTOR_INDEX_HNSW_M,
+        hnsw_ef_construction=settings.VECTOR_INDEX_HNSW_EF_CONSTRUCTION,
+        ivfflat_lists=settings.VECTOR_INDEX_IVFFLAT_LISTS,
+        maintenance_work_mem=settings.VECTOR_INDEX_MAINTENANCE_WORK_MEM or None
+    )
+    action = await index_manager.ensure_index()
+    logger.info(f"Vector index: {action}")
     
     await engine.dispose()
     logger.info("Document processing completed!")
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--full", action="store_true", help="reprocess unchanged files too (after changing chunk settings)")
+    parser.add_argument("--report", help="write the per-document chunk diff to this JSON file")
+    parser.add_argument("--chunk-workers", type=int, default=None, help="chunking processes (default: CPU count)")
+    parser.add_argument("--embed-workers", type=int, default=4, help="documents embedded concurrently")
+    parser.add_argument("--queue-size", type=int, default=16, help="max documents waiting between stages")
+    parser.add_argument("--write-batch-size", type=int, default=500, help="rows per INSERT/UPDATE statement")
+    args = parser.parse_args()
+    
+    asyncio.run(main(
+        full=args.full,
+        report_path=args.report,
+        chunk_workers=args.chunk_workers,
+        embed_workers=args.embed_workers,
+        queue_size=args.queue_size,
+        write_batch_size=args.write_batch_size
+    ))
@@ -0,0 +1,32 @@
+import asyncio
+import threading
+
+from app.core.executor import BlockingExecutor
+
+
+def test_cancelled_queued_calls_release_their_slots():
+    executor = BlockingExecutor("test-cancel", max_workers=1, max_queue=3)
+    release = threading.Event()
+
+    async def scenario():
+        busy = asyncio.create_task(executor.run(release.wait, 5))
+        await asyncio.sleep(0.05)
+        queued = [asyncio.create_task(executor.run(lambda: None)) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        assert executor.stats()["queue_depth"] == 3
+
+        for task in queued:
+            task.cancel()
+        await asyncio.gather(*queued, return_exceptions=True)
+        assert executor.stats()["queue_depth"] == 0
+
+        release.set()
+        await busy
+        assert await executor.run(lambda: 42) == 42
+        assert executor.stats()["queue_depth"] == 0
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        release.set()
+        executor.shutdown()